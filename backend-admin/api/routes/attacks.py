@@ -3,12 +3,13 @@ Attack Log Routes
 View detected attacks and security events
 """
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, func
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
+import httpx
 import sys
 import os
 
@@ -16,8 +17,10 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(
 
 from database.database import get_db
 from models.attack import AttackLog
+from models.campaign import AttackCampaign
 from models.user import User
 from api.routes.auth import get_current_user
+from config import settings
 
 router = APIRouter()
 
@@ -41,6 +44,28 @@ class AttackResponse(BaseModel):
         from_attributes = True
 
 
+class CampaignResponse(BaseModel):
+    id: int
+    group_type: str
+    group_key: str
+    asn: Optional[int] = None
+    asn_org: Optional[str] = None
+    status: str
+    kind: Optional[str] = None
+    max_severity: Optional[str] = None
+    event_count: int
+    packet_count: int
+    source_count: int
+    port_count: int
+    attack_types: Optional[dict] = None
+    sample_sources: Optional[List[str]] = None
+    first_seen: datetime
+    last_seen: datetime
+    
+    class Config:
+        from_attributes = True
+
+
 class AttackStatsResponse(BaseModel):
     total_attacks: int
     attacks_today: int
@@ -129,3 +154,58 @@ async def get_attack_stats(
         top_countries=top_countries
     )
 
+
+
+@router.get("/top-talkers")
+async def get_top_talkers(
+    limit: int = Query(20, ge=1, le=200),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Live heavy hitters from the IDS sketch layer (current and previous window):
+    approximate packet counts, distinct ports and distinct local hosts per source
+    """
+    url = f"http://{settings.IDS_STATS_HOST}:{settings.IDS_STATS_PORT}/sketches"
+    try:
+        async with httpx.AsyncClient(timeout=3.0) as client:
+            response = await client.get(url, params={"limit": limit})
+    except httpx.HTTPError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"IDS engine unreachable: {e}"
+        )
+    
+    if response.status_code == 404:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="IDS sketches are disabled"
+        )
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail=f"IDS engine returned {response.status_code}"
+        )
+    
+    return response.json()
+
+
+@router.get("/campaigns", response_model=List[CampaignResponse])
+async def get_campaigns(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200),
+    status_filter: Optional[str] = Query(None, alias="status", description="active or closed (default: both)"),
+    kind: Optional[str] = Query(None, description="distributed_scan or slow_scan"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Slow / distributed scan campaigns found by the correlation job (services/campaign_correlator.py)"""
+    
+    query = db.query(AttackCampaign)
+    if status_filter:
+        query = query.filter(AttackCampaign.status == status_filter)
+    else:
+        query = query.filter(AttackCampaign.status != 'candidate')
+    if kind:
+        query = query.filter(AttackCampaign.kind == kind)
+    
+    return query.order_by(desc(AttackCampaign.last_seen)).offset(skip).limit(limit).all()
@@ -4,11 +4,12 @@ API endpoints for honeypot logging and monitoring
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_, func
-from pydantic import BaseModel, validator
-from typing import Optional, List, Dict
-from datetime import datetime, timedelta
+from sqlalchemy import desc, and_, func, insert
+from pydantic import BaseModel, ValidationError, validator
+from typing import Optional, List, Dict, Any, Tuple
+from datetime import datetime, timedelta, timezone
 import json
 import sys
 import os
@@ -19,11 +20,18 @@ from database.database import get_db
 from models.user import User
 from models.honeypot import HoneypotLog, HoneypotSession
 from services.geoip_service import geoip_service
-from services.whois_service import whois_service
+from services.whois_enricher import whois_from_cache
+from services.request_classifier import request_classifier, ACTIVITY_TYPES
 from api.routes.auth import get_current_user
 
 from config import settings
 
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
 router = APIRouter()
 
 
@@ -44,7 +52,7 @@ class HoneypotLogRequest(BaseModel):
     request_body: Optional[str] = None
     response_status: Optional[int] = None
     response_size: Optional[int] = None
-    activity_type: str  # scan, login_attempt, failed_login, page_view, api_call, fake_probe
+    activity_type: str  # One of ACTIVITY_TYPES (services/request_classifier.py) or auto_detect
     scan_target: Optional[str] = None
     scan_hash: Optional[str] = None
     suspicious_score: Optional[int] = 0
@@ -54,7 +62,7 @@ class HoneypotLogRequest(BaseModel):
 
     @validator('activity_type')
     def validate_activity_type(cls, v):
-        valid_types = ['scan', 'login_attempt', 'failed_login', 'page_view', 'api_call', 'fake_probe', 'legitimate_access']
+        valid_types = list(ACTIVITY_TYPES) + ['auto_detect']
         if v not in valid_types:
             raise ValueError(f'activity_type must be one of: {valid_types}')
         return v
@@ -106,66 +114,19 @@ async def log_honeypot_activity(
 ):
     """Log honeypot activity from Honeypot Server (remote)"""
     try:
-        # Validate API Key
-        api_key = request.headers.get('X-API-Key')
-        expected_key = settings.CENTRAL_MONITOR_API_KEY if hasattr(settings, 'CENTRAL_MONITOR_API_KEY') else 'your-secret-key'
-        
-        if api_key != expected_key:
-            raise HTTPException(status_code=403, detail="Invalid API Key")
-        
+        _check_api_key(request)
+
         # Use client info from log_data (not from request, because it's proxied)
         client_ip = log_data.client_ip
-        user_agent = log_data.user_agent or 'Unknown'
 
         # Get GeoIP info
         geoip_info = geoip_service.lookup(client_ip)
 
-        # Get WHOIS info
-        whois_info = whois_service.lookup_whois(client_ip)
-
-        # Use authentication status from log_data (from Honeypot Server)
-        is_authenticated = log_data.is_authenticated
-        user_id = log_data.user_id
-
-        # Determine activity type if not provided
-        if log_data.activity_type == 'auto_detect':
-            activity_type = _detect_activity_type(log_data.request_path, log_data.request_method)
-        else:
-            activity_type = log_data.activity_type
-
-        # Calculate suspicious score if not provided
-        suspicious_score = log_data.suspicious_score
-        suspicious_reasons = log_data.suspicious_reasons or []
-
-        if suspicious_score == 0:
-            suspicious_score, suspicious_reasons = _calculate_suspicious_score(
-                log_data, geoip_info, whois_info
-            )
+        # Cached WHOIS info (unknown IPs are queued and back-filled by the WHOIS enricher)
+        whois_info = whois_from_cache(db, [client_ip]).get(client_ip, {})
 
         # Create honeypot log
-        honeypot_log = HoneypotLog(
-            session_id=log_data.session_id,
-            user_id=user_id,
-            is_authenticated=is_authenticated,
-            ip_address=client_ip,
-            user_agent=user_agent,
-            request_method=log_data.request_method,
-            request_path=log_data.request_path,
-            request_headers=log_data.request_headers,
-            request_body=log_data.request_body[:5000] if log_data.request_body else None,  # Limit size
-            response_status=log_data.response_status,
-            response_size=log_data.response_size,
-            geoip_country=geoip_info.get('country'),
-            geoip_city=geoip_info.get('city'),
-            geoip_lat=geoip_info.get('latitude'),
-            geoip_lon=geoip_info.get('longitude'),
-            whois_data=whois_info if whois_info.get('success') else None,
-            activity_type=activity_type,
-            scan_target=log_data.scan_target,
-            scan_hash=log_data.scan_hash,
-            suspicious_score=suspicious_score,
-            suspicious_reasons=suspicious_reasons
-        )
+        honeypot_log = HoneypotLog(**_build_log_values(log_data, geoip_info, whois_info))
 
         db.add(honeypot_log)
         db.commit()
@@ -173,6 +134,8 @@ async def log_honeypot_activity(
 
         return {"success": True, "log_id": honeypot_log.id}
 
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -181,6 +144,66 @@ async def log_honeypot_activity(
         )
 
 
+async def _read_body(request: Request, max_bytes: int) -> bytes:
+    """Request body, refused with 413 as soon as it exceeds max_bytes (never buffered past the limit)"""
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Batch larger than {max_bytes} bytes"
+    )
+    content_length = request.headers.get('content-length')
+    if content_length is not None:
+        try:
+            declared = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid Content-Length")
+        if declared > max_bytes:
+            raise too_large
+
+    # Chunked uploads have no Content-Length; a declared one is not trusted either
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+
+@router.post("/log/batch", response_model=dict)
+async def log_honeypot_activity_batch(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Log many honeypot activities in one request (Honeypot Server log shipper)
+
+    Body: a JSON array of log records (application/json), one record per
+    line (application/x-ndjson) or a msgpack array (application/msgpack).
+    Records are validated one by one, each distinct client IP is enriched
+    once, and every valid record goes into honeypot_logs in one
+    transaction (multi-row INSERTs). Invalid records don't fail the batch:
+    they are reported in "results" by position.
+    """
+    _check_api_key(request)
+
+    body = await _read_body(request, settings.HONEYPOT_BATCH_MAX_BYTES)
+    items = _decode_batch(body, request.headers.get('content-type', ''))
+    if len(items) > settings.HONEYPOT_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch has {len(items)} records, limit is {settings.HONEYPOT_BATCH_MAX_ITEMS}"
+        )
+
+    # Lookups and INSERTs are blocking: keep them off the event loop
+    try:
+        return await run_in_threadpool(_store_batch, items, db)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to log honeypot batch: {str(e)}"
+        )
+
+
 @router.get("/logs", response_model=List[HoneypotLogResponse])
 async def get_honeypot_logs(
     skip: int = Query(0, ge=0),
@@ -314,85 +337,152 @@ async def get_suspicious_activities(
 # HELPER FUNCTIONS
 # ========================================
 
-def _detect_activity_type(path: str, method: str) -> str:
-    """Auto-detect activity type from request"""
-    path_lower = path.lower()
-
-    if '/api/v1/scanner/' in path_lower:
-        return 'scan'
-    elif '/api/v1/auth/login' in path_lower:
-        return 'login_attempt'
-    elif '/api/v1/auth/register' in path_lower:
-        return 'login_attempt'
-    elif path_lower.startswith('/api/'):
-        return 'api_call'
-    elif method == 'GET' and not path.startswith('/api/'):
-        return 'page_view'
-    else:
-        return 'api_call'
-
-
-def _calculate_suspicious_score(log_data: HoneypotLogRequest, geoip_info: dict, whois_info: dict) -> tuple:
-    """Calculate suspicious score and reasons"""
-    score = 0
-    reasons = []
-
-    # Check for suspicious patterns in request
-    path_lower = log_data.request_path.lower()
-
-    # SQL injection patterns
-    sql_patterns = ["'", '"', ';', 'union', 'select', 'drop', 'insert', 'update', 'delete']
-    for pattern in sql_patterns:
-        if pattern in path_lower:
-            score += 20
-            reasons.append(f"Potential SQL injection: {pattern}")
-            break
-
-    # Path traversal attempts
-    if '../' in path_lower or '..\\' in path_lower:
-        score += 30
-        reasons.append("Path traversal attempt")
-
-    # Scanner activity
-    if '/api/v1/scanner/' in path_lower:
-        score += 15
-        reasons.append("Scanner activity detected")
-
-    # Unusual user agents
-    user_agent = log_data.request_headers.get('User-Agent', '').lower()
-    suspicious_uas = ['sqlmap', 'nmap', 'nessus', 'openvas', 'nikto', 'w3af', 'burp']
-    for ua in suspicious_uas:
-        if ua in user_agent:
-            score += 25
-            reasons.append(f"Suspicious user agent: {ua}")
-            break
-
-    # Rapid requests (would need session tracking for this)
-    # For now, we'll rely on activity type
-
-    # GeoIP based suspicion (high-risk countries, but this is controversial)
-    # country = geoip_info.get('country', '').lower()
-    # risky_countries = ['cn', 'ru', 'ir', 'kp', 'sy']  # Example list
-    # if country in risky_countries:
-    #     score += 10
-    #     reasons.append(f"High-risk country: {country}")
-
-    # WHOIS based suspicion
-    if whois_info.get('success') and whois_info.get('country'):
-        # Can add logic here if needed
-        pass
-
-    # Activity type based scoring
-    if log_data.activity_type == 'failed_login':
-        score += 10
-        reasons.append("Failed login attempt")
-
-    if log_data.activity_type == 'scan':
-        score += 5
-        reasons.append("Scanning activity")
-
-    # Ensure minimum score of 0 and maximum of 100
-    score = max(0, min(100, score))
-
-    return score, reasons
+def _check_api_key(request: Request):
+    """Reject requests without the Honeypot Server API key"""
+    api_key = request.headers.get('X-API-Key')
+    expected_key = settings.CENTRAL_MONITOR_API_KEY if hasattr(settings, 'CENTRAL_MONITOR_API_KEY') else 'your-secret-key'
+
+    if api_key != expected_key:
+        raise HTTPException(status_code=403, detail="Invalid API Key")
+
+
+def _build_log_values(log_data: HoneypotLogRequest, geoip_info: dict, whois_info: dict) -> Dict[str, Any]:
+    """HoneypotLog column values for one validated log record"""
+    activity_type = None if log_data.activity_type == 'auto_detect' else log_data.activity_type
+    suspicious_score = log_data.suspicious_score
+    suspicious_reasons = log_data.suspicious_reasons or []
+
+    # Classify here what the sender left out (score 0 / auto_detect)
+    if suspicious_score == 0 or activity_type is None:
+        result = request_classifier.classify(
+            log_data.request_path,
+            log_data.user_agent or log_data.request_headers.get('user-agent') or log_data.request_headers.get('User-Agent'),
+            log_data.request_body,
+            log_data.request_method,
+            is_fake=log_data.is_fake_path,
+            activity_type=activity_type
+        )
+        activity_type = result.activity_type
+        if suspicious_score == 0:
+            suspicious_score, suspicious_reasons = result.score, result.reasons
+
+    # Authentication status comes from the Honeypot Server
+    return {
+        'session_id': log_data.session_id,
+        'user_id': log_data.user_id,
+        'is_authenticated': log_data.is_authenticated,
+        'ip_address': log_data.client_ip,
+        'user_agent': log_data.user_agent or 'Unknown',
+        'request_method': log_data.request_method,
+        'request_path': log_data.request_path,
+        'request_headers': log_data.request_headers,
+        'request_body': log_data.request_body[:5000] if log_data.request_body else None,  # Limit size
+        'response_status': log_data.response_status,
+        'response_size': log_data.response_size,
+        'geoip_country': geoip_info.get('country'),
+        'geoip_city': geoip_info.get('city'),
+        'geoip_lat': geoip_info.get('latitude'),
+        'geoip_lon': geoip_info.get('longitude'),
+        'whois_data': whois_info if whois_info.get('success') else None,
+        'activity_type': activity_type,
+        'scan_target': log_data.scan_target,
+        'scan_hash': log_data.scan_hash,
+        'suspicious_score': suspicious_score,
+        'suspicious_reasons': suspicious_reasons
+    }
+
+
+def _decode_batch(body: bytes, content_type: str) -> List[Any]:
+    """Split a batch body into raw records according to its Content-Type"""
+    media_type = content_type.split(';')[0].strip().lower()
 
+    try:
+        if media_type in ('application/x-ndjson', 'application/ndjson', 'application/jsonl'):
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        elif media_type in ('application/msgpack', 'application/x-msgpack'):
+            if not MSGPACK_AVAILABLE:
+                raise HTTPException(
+                    status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                    detail="msgpack is not installed on the Central Monitor"
+                )
+            items = msgpack.unpackb(body, raw=False)
+        elif media_type in ('', 'application/json'):
+            items = json.loads(body)
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"Unsupported batch content type: {media_type}"
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Malformed batch body: {str(e)}")
+
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Batch body must be an array of log records")
+    return items
+
+
+def _parse_timestamp(value: Optional[str], default: datetime) -> datetime:
+    """Event time sent by the Honeypot Server (logs may arrive late from its spill file)"""
+    if value:
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return default
+
+
+def _store_batch(items: List[Any], db: Session) -> Dict[str, Any]:
+    """Validate, enrich and insert a decoded batch; per-record results in input order"""
+    received_at = datetime.now(timezone.utc)
+    results: List[Dict[str, Any]] = []
+    valid: List[Tuple[int, HoneypotLogRequest]] = []
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results.append({"index": index, "status": "invalid", "error": "record must be an object"})
+            continue
+        try:
+            valid.append((index, HoneypotLogRequest(**item)))
+            results.append(None)
+        except ValidationError as e:
+            errors = "; ".join(
+                f"{'.'.join(str(loc) for loc in error['loc'])}: {error['msg']}" for error in e.errors()
+            )
+            results.append({"index": index, "status": "invalid", "error": errors})
+
+    # One GeoIP lookup per distinct client IP in the batch, WHOIS from the
+    # cache only (unknown IPs are queued and back-filled by the WHOIS enricher)
+    geoip = {}
+    for _, log_data in valid:
+        if log_data.client_ip not in geoip:
+            geoip[log_data.client_ip] = geoip_service.lookup(log_data.client_ip)
+    whois = whois_from_cache(db, geoip) if geoip else {}
+
+    rows = []
+    for _, log_data in valid:
+        values = _build_log_values(log_data, geoip[log_data.client_ip], whois.get(log_data.client_ip, {}))
+        values['timestamp'] = _parse_timestamp(log_data.timestamp, received_at)
+        rows.append(values)
+
+    if rows:
+        # executemany with RETURNING: SQLAlchemy packs the rows into multi-row
+        # INSERT ... VALUES statements and returns ids in parameter order
+        table = HoneypotLog.__table__
+        ids = db.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True),
+            rows
+        ).scalars().all()
+        db.commit()
+
+        for (index, _), log_id in zip(valid, ids):
+            results[index] = {"index": index, "status": "created", "log_id": log_id}
+
+    return {
+        "success": True,
+        "received": len(items),
+        "created": len(rows),
+        "invalid": len(items) - len(rows),
+        "results": results
+    }
@@ -56,6 +56,7 @@ class Settings(BaseSettings):
     
     # GeoIP
     GEOIP_DB_PATH: str = os.path.join(os.path.dirname(__file__), "GeoLite2-City.mmdb")
+    GEOIP_ASN_DB_PATH: str = os.path.join(os.path.dirname(__file__), "GeoLite2-ASN.mmdb")  # Optional
     
     # Email
     SMTP_HOST: str = "smtp.gmail.com"
@@ -68,6 +69,8 @@ class Settings(BaseSettings):
     CENTRAL_MONITOR_URL: str = "http://localhost:27009/api/logs"
     ENABLE_MONITORING: bool = True
     CENTRAL_MONITOR_API_KEY: str = "change-this-api-key-in-production"  # API key for Honeypot→Central communication
+    HONEYPOT_BATCH_MAX_ITEMS: int = 10000  # Records per POST /honeypot/log/batch
+    HONEYPOT_BATCH_MAX_BYTES: int = 16 * 1024 * 1024  # Below nginx client_max_body_size (20M)
     
     # Elasticsearch
     ELASTICSEARCH_HOSTS: List[str] = ["http://localhost:9200"]
@@ -77,12 +80,101 @@ class Settings(BaseSettings):
     ELASTICSEARCH_HONEYPOT_INDEX: str = "pandora-honeypot-logs"
     ELASTICSEARCH_IDS_INDEX: str = "pandora-ids-attacks"
     ELASTICSEARCH_ENABLED: bool = True
-    
+    ELASTICSEARCH_BULK_FLUSH_ACTIONS: int = 500  # Flush the bulk buffer at this many documents
+    ELASTICSEARCH_BULK_FLUSH_BYTES: int = 5 * 1024 * 1024  # ...or this many bytes per request
+    ELASTICSEARCH_BULK_FLUSH_INTERVAL_MS: int = 2000  # ...or at least this often
+    ELASTICSEARCH_BULK_MAX_BUFFER: int = 20000  # Documents held before new ones are dropped
+    ELASTICSEARCH_BULK_MAX_RETRIES: int = 5  # Retries for documents rejected with 429
+    ELASTICSEARCH_BULK_INITIAL_BACKOFF: float = 0.5  # Seconds, doubled per retry
+    ELASTICSEARCH_BULK_MAX_BACKOFF: float = 30.0
+
+    # IDS Engine
+    IDS_CAPTURE_BACKEND: str = "afpacket"  # afpacket (Linux mmap ring) or scapy
+    IDS_LOCAL_IP_REFRESH_SECONDS: int = 60  # Re-read local IPs and regenerate the BPF prefilter
+    IDS_LOCAL_NETWORKS: str = ""  # Extra CIDRs treated as local, comma-separated (e.g. a mirrored subnet)
+    IDS_ALLOWLIST: str = ""  # Source CIDRs never reported (own scanners, monitoring), IPv4 or IPv6
+    IDS_DENYLIST: str = ""  # Source CIDRs reported on every new connection
+    IDS_STATS_HOST: str = "127.0.0.1"
+    IDS_STATS_PORT: int = 9109  # GET /stats on the IDS host
+    IDS_DETECTOR_WORKERS: int = 0  # >1 = detector processes sharded by source IP
+    IDS_PIPELINE_RING_SLOTS: int = 32768  # Packets buffered per worker shared-memory ring
+    IDS_MAX_TRACKED_SOURCES: int = 100000  # Per tracker (and per worker); least recently active evicted
+    IDS_RULES_FILE: str = ""  # Detection rules JSON; empty = ids/rules.json
+    IDS_RULES_RELOAD_SECONDS: int = 5  # Rule file mtime check (engine and every worker)
+    # TCP handshake table: half-open, FIN/NULL/Xmas and RST-storm detection. Off by default: the
+    # prefilter then has to pass every inbound bare ACK (~4x the packets on a host serving content,
+    # see `benchmark.py filter` on a `webserver` synth capture)
+    IDS_FLOW_TRACKING: bool = False
+    IDS_MAX_TRACKED_FLOWS: int = 200000  # Per worker; oldest half-open flow evicted first
+    IDS_FLOW_SYN_TIMEOUT_SECONDS: int = 30  # Handshake not completed within this = abandoned
+    IDS_FLOW_IDLE_TIMEOUT_SECONDS: int = 300
+    IDS_ACTIVE_RESPONSE: bool = False  # Block high-confidence attackers in the kernel (needs CAP_NET_ADMIN)
+    IDS_ACTIVE_RESPONSE_BACKEND: str = "nftables"  # nftables or ipset
+    IDS_ACTIVE_RESPONSE_TABLE: str = "pandora_ids"  # nftables table / ipset set name
+    IDS_ACTIVE_RESPONSE_MIN_SEVERITY: str = "high"
+    IDS_ACTIVE_RESPONSE_MIN_CONFIDENCE: int = 90
+    IDS_ACTIVE_RESPONSE_BLOCK_SECONDS: int = 3600  # Kernel set timeout per blocked address
+    IDS_ACTIVE_RESPONSE_BATCH_MS: int = 200  # One nft / ipset transaction per interval
+    IDS_ACTIVE_RESPONSE_MAX_PENDING: int = 10000
+    IDS_ACTIVE_RESPONSE_BLOCK_PRIVATE: bool = False  # Also block RFC 1918 etc. sources (lab / namespace tests)
+    IDS_SNAPSHOT_FILE: str = ""  # Tracker state kept across restarts (empty = ids/state/detector.snap)
+    IDS_SNAPSHOT_SECONDS: int = 60  # Background save interval; 0 disables save and restore
+    IDS_SKETCHES_ENABLED: bool = True  # Count-min / HyperLogLog / top-K layer for distributed attacks
+    IDS_SKETCH_WINDOW_SECONDS: int = 10
+    IDS_SKETCH_TOP_K: int = 64  # Heavy hitters exposed at /api/v1/attacks/top-talkers
+    IDS_WRITER_QUEUE_SIZE: int = 10000  # Max pending detections before dropping
+    IDS_WRITER_FLUSH_INTERVAL_MS: int = 500  # Flush at least this often
+    IDS_WRITER_FLUSH_BATCH_SIZE: int = 500  # ...or as soon as this many detections are queued
+    IDS_GEOIP_CACHE_SIZE: int = 50000  # Source IPs kept in the IDS GeoIP LRU
+    IDS_GEOIP_CACHE_TTL_SECONDS: int = 3600
+    IDS_ATTACK_AGGREGATION_MINUTES: int = 5  # Same attacker + type within window = one AttackLog row
+    IDS_ALERT_WORKERS: int = 1  # Each worker keeps its own SMTP connection
+    IDS_ALERT_QUEUE_SIZE: int = 1000
+    IDS_ALERT_QUEUE_POLICY: str = "drop_oldest"  # drop_oldest, drop_new or block
+    IDS_ALERT_BLOCK_SECONDS: float = 0.5  # Max writer stall under the block policy
+    IDS_ALERT_DIGEST_SECONDS: int = 60  # One email per window listing every new attacker
+    IDS_ALERT_DIGEST_MAX: int = 200  # ...or sooner once this many are pending
+
+    # Campaign correlation job (services/campaign_correlator.py)
+    CORRELATION_SOURCE: str = "database"  # database (attack_logs) or elasticsearch (IDS index)
+    CORRELATION_INTERVAL_SECONDS: int = 300
+    CORRELATION_BATCH_SIZE: int = 5000  # Rows per streamed chunk / commit
+    CORRELATION_ES_LAG_SECONDS: int = 120  # Leave documents still in the bulk indexer pipeline for the next run
+    CORRELATION_IPV4_PREFIX: int = 24
+    CORRELATION_IPV6_PREFIX: int = 48
+    CORRELATION_CAMPAIGN_GAP_HOURS: int = 24  # Quiet this long = campaign closed, next event starts a new one
+    CORRELATION_MIN_SOURCES: int = 5  # Distinct sources in one prefix / ASN = distributed scan
+    CORRELATION_MIN_PORTS: int = 10  # Distinct target ports ...
+    CORRELATION_SLOW_SCAN_MIN_HOURS: float = 1.0  # ...spread over at least this long = slow scan
+
+    # WHOIS enrichment job (services/whois_enricher.py)
+    WHOIS_ENRICH_INTERVAL_SECONDS: int = 30
+    WHOIS_BATCH_SIZE: int = 50  # Queued IPs claimed (and committed) per batch
+    WHOIS_WORKERS: int = 4  # Concurrent WHOIS queries
+    WHOIS_TIMEOUT_SECONDS: int = 10  # Socket timeout of each query
+    WHOIS_CACHE_TTL_DAYS: int = 30  # Answer reused this long, then looked up again when the IP is next seen
+    WHOIS_RETRY_HOURS: int = 24  # Failed lookups are not retried before this
+
     @property
     def cors_origins_list(self) -> List[str]:
         """Parse CORS origins into list"""
         return [origin.strip() for origin in self.CORS_ORIGINS.split(",")]
     
+    @property
+    def ids_local_networks_list(self) -> List[str]:
+        """Parse IDS local networks into list"""
+        return [cidr.strip() for cidr in self.IDS_LOCAL_NETWORKS.split(",") if cidr.strip()]
+    
+    @property
+    def ids_allowlist(self) -> List[str]:
+        """Parse IDS allowlist CIDRs into list"""
+        return [cidr.strip() for cidr in self.IDS_ALLOWLIST.split(",") if cidr.strip()]
+    
+    @property
+    def ids_denylist(self) -> List[str]:
+        """Parse IDS denylist CIDRs into list"""
+        return [cidr.strip() for cidr in self.IDS_DENYLIST.split(",") if cidr.strip()]
+    
     @property
     def redis_url(self) -> str:
         """Build Redis URL"""
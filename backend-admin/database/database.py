@@ -23,6 +23,8 @@ def import_models():
         from models.scan import Scan, ScanResult
         from models.attack import AttackLog
         from models.honeypot import HoneypotLog, HoneypotSession
+        from models.campaign import AttackCampaign, CorrelationWatermark
+        from models.whois import WhoisRecord
     except ImportError as e:
         print(f"[WARNING] Could not import some models: {e}")
 
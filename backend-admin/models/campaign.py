@@ -0,0 +1,67 @@
+"""
+Attack Campaign Models
+Correlated low-rate / distributed activity and the correlation job's watermarks
+"""
+
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, LargeBinary, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import Base
+
+
+class AttackCampaign(Base):
+    """Attack log activity grouped by source prefix or ASN over time (see services/campaign_correlator.py)"""
+    __tablename__ = "attack_campaigns"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Grouping: 'prefix' ('203.0.113.0/24') or 'asn' ('AS64500')
+    group_type = Column(String(10), nullable=False)
+    group_key = Column(String(64), nullable=False)
+    asn = Column(BigInteger)
+    asn_org = Column(String(255))
+
+    # 'candidate' (below thresholds), 'active', 'closed' (quiet for the campaign gap)
+    status = Column(String(20), nullable=False, default='candidate', index=True)
+    kind = Column(String(30))  # 'distributed_scan' or 'slow_scan' once active
+    max_severity = Column(String(20))
+
+    # Aggregates
+    event_count = Column(Integer, default=0)
+    packet_count = Column(BigInteger, default=0)
+    source_count = Column(Integer, default=0)  # Distinct sources (HyperLogLog estimate)
+    port_count = Column(Integer, default=0)    # Distinct target ports (HyperLogLog estimate)
+    attack_types = Column(JSONB)               # attack_type -> events
+    sample_sources = Column(JSONB)             # First few distinct source IPs
+    source_sketch = Column(LargeBinary)
+    port_sketch = Column(LargeBinary)
+
+    # Timestamps (of the correlated events)
+    first_seen = Column(DateTime(timezone=True), nullable=False, index=True)
+    last_seen = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index('ix_attack_campaigns_group', 'group_type', 'group_key', 'status'),
+    )
+
+    def __repr__(self):
+        return f"<AttackCampaign {self.kind or self.status} {self.group_key}>"
+
+
+class CorrelationWatermark(Base):
+    """Position of the correlation job in one input (attack_logs or the Elasticsearch IDS index)"""
+    __tablename__ = "correlation_watermarks"
+
+    source = Column(String(50), primary_key=True)
+    last_id = Column(BigInteger, default=0)           # attack_logs.id
+    last_timestamp = Column(DateTime(timezone=True))  # Elasticsearch @timestamp
+    rows_processed = Column(BigInteger, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<CorrelationWatermark {self.source} id={self.last_id} ts={self.last_timestamp}>"
@@ -0,0 +1,34 @@
+"""
+WHOIS Cache Model
+Per-IP WHOIS results, also the queue of the deferred WHOIS enrichment job
+"""
+
+from sqlalchemy import Column, Integer, String, Text, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.database import Base
+
+
+class WhoisRecord(Base):
+    """WHOIS result for one client IP (see services/whois_enricher.py)"""
+    __tablename__ = "whois_records"
+
+    ip_address = Column(String(45), primary_key=True)
+
+    # 'pending' (queued by ingest), 'ok' or 'failed'
+    status = Column(String(10), nullable=False, default='pending', index=True)
+    whois_data = Column(JSONB)  # whois_service.lookup_whois() result when status = 'ok'
+    error = Column(Text)
+    attempts = Column(Integer, default=0)
+
+    # Timestamps
+    requested_at = Column(DateTime(timezone=True), server_default=func.now())
+    looked_up_at = Column(DateTime(timezone=True), index=True)
+    expires_at = Column(DateTime(timezone=True))  # Queued again when seen after this
+
+    def __repr__(self):
+        return f"<WhoisRecord {self.ip_address} {self.status}>"
@@ -0,0 +1,443 @@
+"""
+Campaign Correlator
+Incremental correlation of IDS detections into slow / distributed scan campaigns
+
+Per-packet thresholds (3 ports in 60 s) miss a scan that sends one probe
+every few minutes, or one spread over a /24 or an ASN so that no single
+source ever crosses a threshold. This job groups detections by source
+prefix and by ASN (when GeoLite2-ASN is installed) and keeps one
+AttackCampaign row per group and burst of activity; a quiet period of
+CORRELATION_CAMPAIGN_GAP_HOURS ends a campaign.
+
+Every run reads only what arrived after the input's watermark:
+
+    database       attack_logs by id through a server-side cursor (rows
+                   are taken once their aggregation window has closed)
+    elasticsearch  the IDS index through a point-in-time + search_after
+
+Events are folded one chunk (CORRELATION_BATCH_SIZE) at a time, and each
+chunk's campaign updates commit together with the advanced watermark. A
+crash replays at most one chunk, and memory is bounded by the chunk, not
+by months of history. Distinct sources / ports are HyperLogLog registers
+stored on the campaign row, so they merge across chunks and runs.
+
+Usage:
+    python services/campaign_correlator.py                 # every CORRELATION_INTERVAL_SECONDS
+    python services/campaign_correlator.py --once
+    python services/campaign_correlator.py --source elasticsearch --once
+"""
+
+from sqlalchemy import select, update, delete, tuple_
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+import ipaddress
+import argparse
+import hashlib
+import math
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from database.database import SessionLocal
+from models.attack import AttackLog
+from models.campaign import AttackCampaign, CorrelationWatermark
+
+CORRELATION_SOURCES = ('database', 'elasticsearch')
+
+SEVERITY_ORDER = {'low': 0, 'medium': 1, 'high': 2, 'critical': 3}
+OPEN_STATUSES = ('candidate', 'active')
+SAMPLE_SOURCES = 20
+KEYS_PER_QUERY = 1000  # (group_type, group_key) pairs per IN clause
+
+# (detected_at, source_ip, target_port, attack_type, severity, packet_count)
+Event = Tuple[datetime, str, Optional[int], str, str, int]
+
+
+class HyperLogLog:
+    """Distinct-count sketch: 2^precision one-byte registers (~3% error at precision 10)"""
+
+    def __init__(self, registers: Optional[bytes] = None, precision: int = 10):
+        self.precision = precision
+        self.registers = bytearray(registers) if registers else bytearray(1 << precision)
+
+    def add(self, value: str) -> None:
+        digest = int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+        rest_bits = 64 - self.precision
+        index = digest >> rest_bits
+        rank = rest_bits - (digest & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: 'HyperLogLog') -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        zeros = self.registers.count(0)
+        if zeros == m:
+            return 0
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        if raw <= 2.5 * m and zeros:
+            return int(round(m * math.log(m / zeros)))  # Linear counting: exact enough for small sets
+        return int(round(raw))
+
+
+class Burst:
+    """One group's activity within a chunk (no gap longer than the campaign gap)"""
+
+    __slots__ = ('first', 'last', 'events', 'packets', 'types', 'sources', 'ports', 'samples',
+                 'severity', 'asn', 'asn_org')
+
+    def __init__(self, first: datetime, asn: Optional[int], asn_org: Optional[str]):
+        self.first = self.last = first
+        self.events = 0
+        self.packets = 0
+        self.types: Dict[str, int] = {}
+        self.sources = HyperLogLog()
+        self.ports = HyperLogLog()
+        self.samples: List[str] = []
+        self.severity = None
+        self.asn = asn
+        self.asn_org = asn_org
+
+    def add(self, event: Event) -> None:
+        detected_at, source_ip, target_port, attack_type, severity, packet_count = event
+        self.first = min(self.first, detected_at)
+        self.last = max(self.last, detected_at)
+        self.events += 1
+        self.packets += packet_count
+        self.types[attack_type] = self.types.get(attack_type, 0) + 1
+        self.sources.add(source_ip)
+        if target_port:
+            self.ports.add(str(target_port))
+        if len(self.samples) < SAMPLE_SOURCES and source_ip not in self.samples:
+            self.samples.append(source_ip)
+        if SEVERITY_ORDER.get(severity, -1) > SEVERITY_ORDER.get(self.severity, -1):
+            self.severity = severity
+
+
+def stream_attack_logs(session, after_id: int, settled_before: datetime,
+                       batch_size: int) -> Iterator[Tuple[List[Event], int]]:
+    """
+    (events, last id) chunks of attack_logs after after_id, in id order
+
+    Stops at the first row whose aggregation window is still open (its
+    packet_count can still grow); the next run starts there.
+    """
+    query = (
+        select(AttackLog.id, AttackLog.detected_at, AttackLog.source_ip, AttackLog.target_port,
+               AttackLog.attack_type, AttackLog.severity, AttackLog.packet_count)
+        .where(AttackLog.id > after_id)
+        .order_by(AttackLog.id)
+        .execution_options(stream_results=True, yield_per=batch_size)
+    )
+    result = session.execute(query)
+    try:
+        for rows in result.partitions():
+            events = []
+            last_id = None
+            settled = True
+            for row in rows:
+                if row.detected_at is not None and row.detected_at >= settled_before:
+                    settled = False
+                    break
+                if row.detected_at is not None:
+                    events.append((row.detected_at, str(row.source_ip), row.target_port,
+                                   row.attack_type or 'unknown', row.severity, row.packet_count or 1))
+                last_id = row.id
+            if last_id is not None:
+                yield events, last_id
+            if not settled:
+                return
+    finally:
+        result.close()
+
+
+def stream_elasticsearch_attacks(client, index: str, after: Optional[datetime], settled_before: datetime,
+                                 batch_size: int) -> Iterator[Tuple[List[Event], datetime]]:
+    """(events, last @timestamp) chunks of the IDS index after `after`, through a point-in-time"""
+    time_range = {'lt': int(settled_before.timestamp() * 1000), 'format': 'epoch_millis'}
+    if after is not None:
+        time_range['gt'] = int(after.timestamp() * 1000)
+    fields = ['source_ip', 'target_port', 'attack_type', 'severity', 'packet_count']
+
+    pit = client.open_point_in_time(index=index, keep_alive='5m')['id']
+    try:
+        search_after = None
+        while True:
+            response = client.search(
+                pit={'id': pit, 'keep_alive': '5m'},
+                query={'range': {'@timestamp': time_range}},
+                sort=[{'@timestamp': 'asc'}, {'_shard_doc': 'asc'}],
+                source=fields,
+                size=batch_size,
+                search_after=search_after
+            )
+            pit = response.get('pit_id', pit)
+            hits = response['hits']['hits']
+            if not hits:
+                return
+
+            events = []
+            for hit in hits:
+                doc = hit['_source']
+                if not doc.get('source_ip'):
+                    continue
+                detected_at = datetime.fromtimestamp(hit['sort'][0] / 1000, timezone.utc)
+                events.append((detected_at, doc['source_ip'], doc.get('target_port'),
+                               doc.get('attack_type') or 'unknown', doc.get('severity'), doc.get('packet_count') or 1))
+            search_after = hits[-1]['sort']
+            yield events, datetime.fromtimestamp(search_after[0] / 1000, timezone.utc)
+    finally:
+        client.close_point_in_time(id=pit)
+
+
+class CampaignCorrelator:
+    """Folds new detections into AttackCampaign rows, one committed chunk at a time"""
+
+    def __init__(
+        self,
+        source: str = settings.CORRELATION_SOURCE,
+        batch_size: int = settings.CORRELATION_BATCH_SIZE,
+        ipv4_prefix: int = settings.CORRELATION_IPV4_PREFIX,
+        ipv6_prefix: int = settings.CORRELATION_IPV6_PREFIX,
+        gap_hours: int = settings.CORRELATION_CAMPAIGN_GAP_HOURS,
+        min_sources: int = settings.CORRELATION_MIN_SOURCES,
+        min_ports: int = settings.CORRELATION_MIN_PORTS,
+        slow_scan_min_hours: float = settings.CORRELATION_SLOW_SCAN_MIN_HOURS,
+        asn_lookup=None
+    ):
+        if source not in CORRELATION_SOURCES:
+            raise ValueError(f"Unknown correlation source: {source} (choose from {', '.join(CORRELATION_SOURCES)})")
+
+        self.source = source
+        self.batch_size = batch_size
+        self.ipv4_prefix = ipv4_prefix
+        self.ipv6_prefix = ipv6_prefix
+        self.gap = timedelta(hours=gap_hours)
+        self.min_sources = min_sources
+        self.min_ports = min_ports
+        self.slow_scan_duration = timedelta(hours=slow_scan_min_hours)
+
+        if asn_lookup is None:
+            from services.geoip_service import geoip_service
+            asn_lookup = geoip_service.lookup_asn
+        self.lookup_asn = lru_cache(maxsize=65536)(asn_lookup)
+
+    # Grouping
+
+    def _groups(self, source_ip: str):
+        """(group_type, group_key, asn, asn_org) for every group a source belongs to"""
+        try:
+            address = ipaddress.ip_address(source_ip)
+        except ValueError:
+            return []
+        prefix = self.ipv4_prefix if address.version == 4 else self.ipv6_prefix
+        groups = [('prefix', str(ipaddress.ip_network((address, prefix), strict=False)), None, None)]
+        asn = self.lookup_asn(source_ip)
+        if asn is not None:
+            groups.append(('asn', f"AS{asn[0]}", asn[0], asn[1]))
+        return groups
+
+    def fold(self, events: List[Event]) -> Dict[Tuple[str, str], List[Burst]]:
+        """Group one chunk: (group_type, group_key) -> bursts in time order"""
+        groups: Dict[Tuple[str, str], List[Burst]] = {}
+        for event in events:
+            for group_type, group_key, asn, asn_org in self._groups(event[1]):
+                bursts = groups.get((group_type, group_key))
+                if bursts is None:
+                    bursts = groups[(group_type, group_key)] = [Burst(event[0], asn, asn_org)]
+                elif event[0] - bursts[-1].last > self.gap:
+                    bursts.append(Burst(event[0], asn, asn_org))
+                bursts[-1].add(event)
+        return groups
+
+    # Campaign rows
+
+    def _open_campaigns(self, session, keys) -> Dict[Tuple[str, str], AttackCampaign]:
+        campaigns = {}
+        for start in range(0, len(keys), KEYS_PER_QUERY):
+            query = select(AttackCampaign).where(
+                AttackCampaign.status.in_(OPEN_STATUSES),
+                tuple_(AttackCampaign.group_type, AttackCampaign.group_key).in_(keys[start:start + KEYS_PER_QUERY])
+            )
+            for campaign in session.execute(query).scalars():
+                campaigns[(campaign.group_type, campaign.group_key)] = campaign
+        return campaigns
+
+    def _end(self, session, campaign: AttackCampaign) -> None:
+        """A campaign's burst is over: keep it if it crossed a threshold, drop it otherwise"""
+        if campaign.status == 'active':
+            campaign.status = 'closed'
+        elif campaign.id is None:
+            session.expunge(campaign)
+        else:
+            session.delete(campaign)
+
+    def _merge(self, campaign: AttackCampaign, burst: Burst) -> None:
+        sources = HyperLogLog(campaign.source_sketch)
+        sources.merge(burst.sources)
+        ports = HyperLogLog(campaign.port_sketch)
+        ports.merge(burst.ports)
+
+        campaign.source_sketch = bytes(sources.registers)
+        campaign.port_sketch = bytes(ports.registers)
+        campaign.source_count = sources.estimate()
+        campaign.port_count = ports.estimate()
+        campaign.first_seen = min(campaign.first_seen, burst.first)
+        campaign.last_seen = max(campaign.last_seen, burst.last)
+        campaign.event_count = (campaign.event_count or 0) + burst.events
+        campaign.packet_count = (campaign.packet_count or 0) + burst.packets
+
+        # New objects so the JSONB columns are flagged as changed
+        types = dict(campaign.attack_types or {})
+        for attack_type, count in burst.types.items():
+            types[attack_type] = types.get(attack_type, 0) + count
+        campaign.attack_types = types
+        samples = list(campaign.sample_sources or [])
+        campaign.sample_sources = samples + [ip for ip in burst.samples if ip not in samples][:SAMPLE_SOURCES - len(samples)]
+
+        if SEVERITY_ORDER.get(burst.severity, -1) > SEVERITY_ORDER.get(campaign.max_severity, -1):
+            campaign.max_severity = burst.severity
+        if burst.asn is not None:
+            campaign.asn, campaign.asn_org = burst.asn, burst.asn_org
+
+        if campaign.source_count >= self.min_sources:
+            campaign.kind = 'distributed_scan'
+            campaign.status = 'active'
+        elif (campaign.port_count >= self.min_ports
+              and campaign.last_seen - campaign.first_seen >= self.slow_scan_duration):
+            campaign.kind = 'slow_scan'
+            campaign.status = 'active'
+
+    def apply(self, session, groups: Dict[Tuple[str, str], List[Burst]]) -> int:
+        """Merge one chunk's bursts into open campaigns (or start new ones); returns campaigns touched"""
+        campaigns = self._open_campaigns(session, list(groups))
+        touched = 0
+        for (group_type, group_key), bursts in groups.items():
+            campaign = campaigns.get((group_type, group_key))
+            for burst in bursts:
+                if campaign is not None and (burst.first - campaign.last_seen > self.gap
+                                             or campaign.first_seen - burst.last > self.gap):
+                    self._end(session, campaign)
+                    campaign = None
+                if campaign is None:
+                    campaign = AttackCampaign(group_type=group_type, group_key=group_key, status='candidate',
+                                              first_seen=burst.first, last_seen=burst.last)
+                    session.add(campaign)
+                self._merge(campaign, burst)
+                touched += 1
+        return touched
+
+    def close_stale(self, session, now: datetime) -> None:
+        """End campaigns quiet for the campaign gap (below-threshold candidates are deleted)"""
+        cutoff = now - self.gap
+        session.execute(
+            update(AttackCampaign)
+            .where(AttackCampaign.status == 'active', AttackCampaign.last_seen < cutoff)
+            .values(status='closed')
+        )
+        session.execute(
+            delete(AttackCampaign)
+            .where(AttackCampaign.status == 'candidate', AttackCampaign.last_seen < cutoff)
+        )
+
+    # Runs
+
+    def _lock_watermark(self, session) -> CorrelationWatermark:
+        """This input's watermark row, locked until commit (serializes concurrent runs)"""
+        watermark = session.get(CorrelationWatermark, self.source, with_for_update=True)
+        if watermark is None:
+            watermark = CorrelationWatermark(source=self.source, last_id=0, rows_processed=0)
+            session.add(watermark)
+            session.flush()
+        return watermark
+
+    def _position(self, watermark: CorrelationWatermark):
+        return watermark.last_id if self.source == 'database' else watermark.last_timestamp
+
+    def _stream(self, reader, position):
+        now = datetime.now(timezone.utc)
+        if self.source == 'database':
+            settled_before = now - timedelta(minutes=settings.IDS_ATTACK_AGGREGATION_MINUTES)
+            return stream_attack_logs(reader, position or 0, settled_before, self.batch_size)
+
+        from services.elasticsearch_service import elasticsearch_service
+        if elasticsearch_service.client is None:
+            raise RuntimeError("Elasticsearch is disabled or unreachable")
+        settled_before = now - timedelta(seconds=settings.CORRELATION_ES_LAG_SECONDS)
+        return stream_elasticsearch_attacks(elasticsearch_service.client, f"{settings.ELASTICSEARCH_IDS_INDEX}-*",
+                                            position, settled_before, self.batch_size)
+
+    def run_once(self) -> Dict[str, int]:
+        """Correlate everything new since the watermark"""
+        stats = {'chunks': 0, 'events': 0, 'campaigns_touched': 0}
+        started = time.monotonic()
+        reader = SessionLocal()  # Holds the streaming cursor; chunks commit on `session`
+        session = SessionLocal()
+        try:
+            position = self._position(self._lock_watermark(session))
+            session.commit()
+
+            for events, next_position in self._stream(reader, position):
+                watermark = self._lock_watermark(session)
+                if self._position(watermark) != position:
+                    print(f"[CORRELATOR] {self.source} watermark moved by another run, stopping")
+                    session.rollback()
+                    break
+
+                if events:
+                    stats['campaigns_touched'] += self.apply(session, self.fold(events))
+                if self.source == 'database':
+                    watermark.last_id = next_position
+                else:
+                    watermark.last_timestamp = next_position
+                watermark.rows_processed = (watermark.rows_processed or 0) + len(events)
+                session.commit()
+
+                position = next_position
+                stats['chunks'] += 1
+                stats['events'] += len(events)
+
+            self.close_stale(session, datetime.now(timezone.utc))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            reader.close()
+            session.close()
+
+        print(f"[CORRELATOR] {self.source}: {stats['events']} events in {stats['chunks']} chunks, "
+              f"{stats['campaigns_touched']} campaign updates ({time.monotonic() - started:.1f}s)")
+        return stats
+
+    def run_forever(self, interval: int = settings.CORRELATION_INTERVAL_SECONDS) -> None:
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[CORRELATOR] Run failed: {e}")
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Correlate IDS detections into attack campaigns")
+    parser.add_argument('--source', choices=CORRELATION_SOURCES, default=settings.CORRELATION_SOURCE)
+    parser.add_argument('--once', action='store_true', help="Single run instead of every --interval seconds")
+    parser.add_argument('--interval', type=int, default=settings.CORRELATION_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    correlator = CampaignCorrelator(source=args.source)
+    if args.once:
+        correlator.run_once()
+    else:
+        correlator.run_forever(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Elasticsearch Bulk Indexer
+Buffered, background bulk indexing shared by the IDS and honeypot logging
+
+Documents are buffered in memory and shipped with helpers.streaming_bulk
+when the buffer reaches ELASTICSEARCH_BULK_FLUSH_ACTIONS documents or
+ELASTICSEARCH_BULK_FLUSH_INTERVAL_MS has passed. Documents rejected with
+429 (Too Many Requests) are retried with exponential backoff by
+streaming_bulk itself. The buffer is bounded: when Elasticsearch falls
+behind, new documents are dropped and counted instead of growing memory.
+
+Documents added with the same coalesce key while still buffered are
+merged (e.g. one attacker burst becomes one document with the summed
+packet_count).
+"""
+
+from elasticsearch import helpers
+from typing import Any, Callable, Dict, Hashable, Optional
+import threading
+import time
+import json
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from services.elasticsearch_service import elasticsearch_service
+
+
+def merge_attack_documents(buffered: Dict[str, Any], doc: Dict[str, Any]) -> None:
+    """Fold a later document for the same attacker burst into the buffered one"""
+    buffered['packet_count'] = buffered.get('packet_count', 1) + doc.get('packet_count', 1)
+    last_seen = doc.get('@timestamp')
+    if last_seen and last_seen > buffered.get('last_seen', buffered.get('@timestamp', '')):
+        buffered['last_seen'] = last_seen
+
+
+class BulkIndexer:
+    """Bounded buffer + flush thread in front of helpers.streaming_bulk"""
+
+    def __init__(
+        self,
+        service=elasticsearch_service,
+        flush_actions: int = settings.ELASTICSEARCH_BULK_FLUSH_ACTIONS,
+        flush_bytes: int = settings.ELASTICSEARCH_BULK_FLUSH_BYTES,
+        flush_interval_ms: int = settings.ELASTICSEARCH_BULK_FLUSH_INTERVAL_MS,
+        max_buffer: int = settings.ELASTICSEARCH_BULK_MAX_BUFFER,
+        max_retries: int = settings.ELASTICSEARCH_BULK_MAX_RETRIES,
+        initial_backoff: float = settings.ELASTICSEARCH_BULK_INITIAL_BACKOFF,
+        max_backoff: float = settings.ELASTICSEARCH_BULK_MAX_BACKOFF
+    ):
+        self.service = service
+        self.flush_actions = flush_actions
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_buffer = max_buffer
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        # key -> (index, doc); insertion order is flush order
+        self.buffer: Dict[Hashable, tuple] = {}
+        self.sequence = 0
+        self.condition = threading.Condition()
+        self.worker: Optional[threading.Thread] = None
+        self.stopping = False
+
+        self.stats = {
+            'added': 0,
+            'coalesced': 0,
+            'dropped': 0,
+            'indexed': 0,
+            'failed': 0,
+            'flushes': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.service.enabled and self.service.client)
+
+    def start(self):
+        with self.condition:
+            if self.worker is None:
+                self.stopping = False
+                self.worker = threading.Thread(target=self._run, name='es-bulk-indexer', daemon=True)
+                self.worker.start()
+
+    def stop(self, timeout: float = 30):
+        """Flush the buffer and stop the worker"""
+        with self.condition:
+            worker = self.worker
+            if worker is None:
+                return
+            self.stopping = True
+            self.condition.notify()
+        worker.join(timeout)
+        self.worker = None
+
+    def add(
+        self,
+        index: str,
+        doc: Dict[str, Any],
+        coalesce_key: Optional[Hashable] = None,
+        merge: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None
+    ) -> bool:
+        """
+        Buffer a document for bulk indexing (non-blocking)
+
+        Returns:
+            bool: False if Elasticsearch is disabled or the buffer is full
+        """
+        if not self.enabled:
+            return False
+        if self.worker is None:
+            self.start()
+
+        with self.condition:
+            if coalesce_key is not None:
+                key = (index, coalesce_key)
+                buffered = self.buffer.get(key)
+                if buffered is not None and merge is not None:
+                    merge(buffered[1], doc)
+                    self.stats['coalesced'] += 1
+                    return True
+            else:
+                self.sequence += 1
+                key = self.sequence
+
+            if len(self.buffer) >= self.max_buffer:
+                self.stats['dropped'] += 1
+                return False
+
+            self.buffer[key] = (index, doc)
+            self.stats['added'] += 1
+            if len(self.buffer) >= self.flush_actions:
+                self.condition.notify()
+        return True
+
+    def add_attack(self, attack_data: Dict[str, Any], coalesce_key: Optional[Hashable] = None) -> bool:
+        """Buffer an IDS attack document; same key while buffered = one document"""
+        return self.add(
+            self.service.attack_index_name(),
+            self.service.attack_document(attack_data),
+            coalesce_key,
+            merge_attack_documents
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.condition:
+            stats = dict(self.stats)
+            stats['buffered'] = len(self.buffer)
+        return stats
+
+    def _run(self):
+        """Flush when the buffer is full enough or the interval elapses"""
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            with self.condition:
+                while (not self.stopping and len(self.buffer) < self.flush_actions
+                       and time.monotonic() < deadline):
+                    self.condition.wait(max(0.0, deadline - time.monotonic()))
+                batch = list(self.buffer.values())
+                self.buffer = {}
+                stopping = self.stopping
+
+            if batch:
+                self._flush(batch)
+            if stopping:
+                return
+            deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        actions = ({'_index': index, '_source': doc} for index, doc in batch)
+        failed = 0
+
+        try:
+            for ok, item in helpers.streaming_bulk(
+                self.service.client,
+                actions,
+                chunk_size=self.flush_actions,
+                max_chunk_bytes=self.flush_bytes,
+                max_retries=self.max_retries,
+                initial_backoff=self.initial_backoff,
+                max_backoff=self.max_backoff,
+                raise_on_error=False,
+                raise_on_exception=False,
+                yield_ok=False
+            ):
+                # Only failures are yielded (after 429 retries are exhausted)
+                failed += 1
+                if failed == 1:
+                    print(f"[ELASTICSEARCH] Bulk item failed: {json.dumps(item, default=str)[:300]}")
+        except Exception as e:
+            failed = len(batch)
+            print(f"[ELASTICSEARCH] Bulk flush of {len(batch)} documents failed: {e}")
+        indexed = len(batch) - failed
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.condition:
+            self.stats['flushes'] += 1
+            self.stats['indexed'] += indexed
+            self.stats['failed'] += failed
+            self.stats['last_flush_ms'] = elapsed_ms
+            self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], elapsed_ms)
+
+
+# Global instance (worker starts on first add)
+bulk_indexer = BulkIndexer()
@@ -267,48 +267,52 @@ class ElasticsearchService:
             return False
         
         try:
-            # Get current date for index name (daily indices)
-            date_suffix = datetime.now().strftime("%Y.%m.%d")
-            index_name = f"{settings.ELASTICSEARCH_IDS_INDEX}-{date_suffix}"
-            
-            # Prepare document
-            doc = {
-                "@timestamp": attack_data.get('detected_at', datetime.now().isoformat()),
-                "source_ip": attack_data.get('source_ip'),
-                "source_port": attack_data.get('source_port'),
-                "target_ip": attack_data.get('target_ip'),
-                "target_port": attack_data.get('target_port'),
-                "attack_type": attack_data.get('attack_type'),
-                "severity": attack_data.get('severity'),
-                "packet_count": attack_data.get('packet_count', 1),
-                "protocol": attack_data.get('protocol'),
-                "flags": attack_data.get('flags'),
-                "payload_sample": attack_data.get('payload_sample'),
-                "country": attack_data.get('country'),
-                "city": attack_data.get('city'),
-                "detected_tool": attack_data.get('detected_tool'),
-                "confidence": attack_data.get('confidence', 0),
-                "raw_packet_info": attack_data.get('raw_packet_info'),
-            }
-            
-            # Add geo_point if coordinates available
-            if attack_data.get('latitude') and attack_data.get('longitude'):
-                try:
-                    doc['location'] = {
-                        "lat": float(attack_data['latitude']),
-                        "lon": float(attack_data['longitude'])
-                    }
-                except:
-                    pass
-            
             # Index document
-            self.client.index(index=index_name, document=doc)
+            self.client.index(index=self.attack_index_name(), document=self.attack_document(attack_data))
             return True
             
         except Exception as e:
             print(f"[ELASTICSEARCH] Error logging attack: {e}")
             return False
     
+    def attack_index_name(self) -> str:
+        """Daily IDS index name"""
+        date_suffix = datetime.now().strftime("%Y.%m.%d")
+        return f"{settings.ELASTICSEARCH_IDS_INDEX}-{date_suffix}"
+    
+    def attack_document(self, attack_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the IDS index document for an attack (used by log_attack and the bulk indexer)"""
+        doc = {
+            "@timestamp": attack_data.get('detected_at', datetime.now().isoformat()),
+            "source_ip": attack_data.get('source_ip'),
+            "source_port": attack_data.get('source_port'),
+            "target_ip": attack_data.get('target_ip'),
+            "target_port": attack_data.get('target_port'),
+            "attack_type": attack_data.get('attack_type'),
+            "severity": attack_data.get('severity'),
+            "packet_count": attack_data.get('packet_count', 1),
+            "protocol": attack_data.get('protocol'),
+            "flags": attack_data.get('flags'),
+            "payload_sample": attack_data.get('payload_sample'),
+            "country": attack_data.get('country'),
+            "city": attack_data.get('city'),
+            "detected_tool": attack_data.get('detected_tool'),
+            "confidence": attack_data.get('confidence', 0),
+            "raw_packet_info": attack_data.get('raw_packet_info'),
+        }
+        
+        # Add geo_point if coordinates available
+        if attack_data.get('latitude') and attack_data.get('longitude'):
+            try:
+                doc['location'] = {
+                    "lat": float(attack_data['latitude']),
+                    "lon": float(attack_data['longitude'])
+                }
+            except:
+                pass
+        
+        return doc
+    
     def search_attacks(self, query: Dict[str, Any], size: int = 100) -> List[Dict]:
         """
         Search IDS attacks in Elasticsearch
@@ -14,74 +14,151 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import settings
 
-def send_attack_alert(attack_log):
-    """Send email alert for detected attack"""
+def _is_configured():
+    return bool(settings.SMTP_USER and settings.SMTP_PASSWORD)
+
+
+def format_attack_alert(attack):
+    """Subject and body for a single attack (AttackLog row or dict with the same fields)"""
+    get = attack.get if isinstance(attack, dict) else lambda name: getattr(attack, name)
+    payload_sample = get('payload_sample')
     
-    if not settings.SMTP_USER or not settings.SMTP_PASSWORD:
-        print("[WARNING] SMTP not configured, skipping email")
-        return False
+    subject = f"[SECURITY ALERT] {get('attack_type').upper()} detected from {get('source_ip')}"
     
-    try:
-        # Email content
-        subject = f"[SECURITY ALERT] {attack_log.attack_type.upper()} detected from {attack_log.source_ip}"
-        
-        body = f"""
+    body = f"""
 PANDORA SECURITY PLATFORM - INTRUSION ALERT
 
 Attack Detected: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 
 ATTACKER INFORMATION:
-- IP Address: {attack_log.source_ip}
-- Port: {attack_log.source_port}
-- Country: {attack_log.country}
-- City: {attack_log.city}
-- Location: {attack_log.latitude}, {attack_log.longitude}
+- IP Address: {get('source_ip')}
+- Port: {get('source_port')}
+- Country: {get('country')}
+- City: {get('city')}
+- Location: {get('latitude')}, {get('longitude')}
 
 ATTACK DETAILS:
-- Type: {attack_log.attack_type}
-- Severity: {attack_log.severity.upper()}
-- Tool Detected: {attack_log.detected_tool}
-- Confidence: {attack_log.confidence}%
-- Protocol: {attack_log.protocol}
-- Flags: {attack_log.flags}
+- Type: {get('attack_type')}
+- Severity: {get('severity').upper()}
+- Tool Detected: {get('detected_tool')}
+- Confidence: {get('confidence')}%
+- Protocol: {get('protocol')}
+- Flags: {get('flags')}
 
 TARGET:
-- IP: {attack_log.target_ip}
-- Port: {attack_log.target_port}
+- IP: {get('target_ip')}
+- Port: {get('target_port')}
 
 PACKET INFO:
-- Count: {attack_log.packet_count}
-- Payload Sample: {attack_log.payload_sample[:100] if attack_log.payload_sample else 'N/A'}...
+- Count: {get('packet_count')}
+- Payload Sample: {payload_sample[:100] if payload_sample else 'N/A'}...
 
 TIME:
-- First Seen: {attack_log.first_seen}
-- Last Seen: {attack_log.last_seen}
+- First Seen: {get('first_seen')}
+- Last Seen: {get('last_seen')}
 
 ---
 This is an automated alert from Pandora IDS
 Dashboard: http://localhost:3000/attacks
         """
-        
-        # Create message
+    return subject, body
+
+
+def format_attack_digest(attacks, window_seconds):
+    """Subject and body for one mail listing several new attackers"""
+    severities = {}
+    for attack in attacks:
+        severities[attack['severity']] = severities.get(attack['severity'], 0) + 1
+    worst = next((s for s in ('critical', 'high', 'medium', 'low') if s in severities), 'low')
+    
+    subject = f"[SECURITY ALERT] {len(attacks)} new attackers in the last {window_seconds}s ({worst.upper()})"
+    
+    lines = [
+        f"{a['detected_at']:%H:%M:%S}  {a['severity'].upper():<8} {a['attack_type']:<28} "
+        f"{a['source_ip']}:{a['source_port']} -> {a['target_ip']}:{a['target_port']}  "
+        f"{a['detected_tool']} ({a['confidence']}%)  {a['country'] or 'Unknown'}"
+        for a in sorted(attacks, key=lambda a: a['detected_at'])
+    ]
+    body = f"""
+PANDORA SECURITY PLATFORM - INTRUSION DIGEST
+
+Window: {window_seconds}s ending {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+New attackers: {len(attacks)}
+By severity: {', '.join(f'{s}={n}' for s, n in sorted(severities.items()))}
+
+{chr(10).join(lines)}
+
+---
+This is an automated alert from Pandora IDS
+Dashboard: http://localhost:3000/attacks
+        """
+    return subject, body
+
+
+class SMTPMailer:
+    """
+    Reusable SMTP session: one connect + STARTTLS + login, reused for every
+    message and re-opened transparently if the server drops it
+    """
+    
+    def __init__(self, host=None, port=None, user=None, password=None, timeout=30):
+        self.host = host or settings.SMTP_HOST
+        self.port = port or settings.SMTP_PORT
+        self.user = user or settings.SMTP_USER
+        self.password = password or settings.SMTP_PASSWORD
+        self.timeout = timeout
+        self.server = None
+    
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.starttls()
+        server.login(self.user, self.password)
+        self.server = server
+    
+    def send(self, subject, body, to=None):
         msg = MIMEMultipart()
         msg['From'] = settings.EMAIL_FROM
-        msg['To'] = settings.SMTP_USER  # Send to yourself
+        msg['To'] = to or self.user  # Send to yourself
         msg['Subject'] = subject
         msg.attach(MIMEText(body, 'plain'))
         
-        # Send email
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
-            server.starttls()
-            server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            server.send_message(msg)
-        
+        if self.server is None:
+            self._connect()
+        try:
+            self.server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, OSError):
+            # Idle connection was closed by the server; retry once on a fresh one
+            self.close()
+            self._connect()
+            self.server.send_message(msg)
+    
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+
+def send_attack_alert(attack_log):
+    """Send email alert for detected attack (one-off connection; the IDS uses AlertDispatcher)"""
+    
+    if not _is_configured():
+        print("[WARNING] SMTP not configured, skipping email")
+        return False
+    
+    mailer = SMTPMailer()
+    try:
+        mailer.send(*format_attack_alert(attack_log))
         print(f"[EMAIL] Alert sent for {attack_log.attack_type} from {attack_log.source_ip}")
         
         # Update log
         from database.database import SessionLocal
+        from models.attack import AttackLog
         db = SessionLocal()
         try:
-            attack_log.email_sent = True
+            db.query(AttackLog).filter(AttackLog.id == attack_log.id).update({AttackLog.email_sent: True})
             db.commit()
         finally:
             db.close()
@@ -91,4 +168,5 @@ Dashboard: http://localhost:3000/attacks
     except Exception as e:
         print(f"[ERROR] Failed to send email: {e}")
         return False
-
+    finally:
+        mailer.close()
@@ -5,7 +5,7 @@ IP geolocation lookup
 
 import geoip2.database
 import geoip2.errors
-from typing import Optional, Dict
+from typing import Optional, Dict, Tuple
 import sys
 import os
 
@@ -28,6 +28,15 @@ class GeoIPService:
         else:
             print(f"[WARNING] GeoIP database not found: {settings.GEOIP_DB_PATH}")
             print("   Download from: https://dev.maxmind.com/geoip/geolite2-free-geolocation-data")
+        
+        # Optional ASN database (campaign correlation groups sources by ASN)
+        self.asn_reader = None
+        if os.path.exists(settings.GEOIP_ASN_DB_PATH):
+            try:
+                self.asn_reader = geoip2.database.Reader(settings.GEOIP_ASN_DB_PATH)
+                print(f"[OK] GeoIP ASN database loaded: {settings.GEOIP_ASN_DB_PATH}")
+            except Exception as e:
+                print(f"[ERROR] Error loading GeoIP ASN database: {e}")
     
     def lookup(self, ip_address: str) -> Optional[Dict]:
         """
@@ -58,6 +67,24 @@ class GeoIPService:
             print(f"❌ GeoIP lookup error: {e}")
             return self._get_default_location(ip_address)
     
+    def lookup_asn(self, ip_address: str) -> Optional[Tuple[int, str]]:
+        """
+        Lookup the autonomous system announcing an IP address
+        
+        Returns:
+            (asn, organization) or None (no ASN database, private or unknown address)
+        """
+        if not self.asn_reader:
+            return None
+        
+        try:
+            response = self.asn_reader.asn(ip_address)
+        except (geoip2.errors.AddressNotFoundError, ValueError):
+            return None
+        if response.autonomous_system_number is None:
+            return None
+        return response.autonomous_system_number, response.autonomous_system_organization or ""
+    
     def _get_default_location(self, ip_address: str) -> Dict:
         """Return default location for private/local IPs"""
         # Check if private IP
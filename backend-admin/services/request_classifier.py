@@ -0,0 +1,432 @@
+"""
+Request Classifier
+Suspicious score, reasons and activity type of an HTTP request, from versioned signatures
+
+Shared by the Honeypot Server, the FastAPI webserver, the legacy port 443
+server and the admin log ingest (which scores records sent without a
+score). request_signatures.json holds the scoring rules and the activity
+type patterns; compile_signatures() turns it into a RequestClassifier:
+
+- the "contains" literals of every path rule and activity type become
+  one trie-shaped regex, scanned once over the path with a zero-width
+  lookahead so overlapping hits are all seen ("../admin" is both
+  traversal and /admin). Each hit also counts for the literals that are
+  its prefixes ("/administrator" -> "/admin").
+- "prefix" / "suffix" rules are one str.startswith / str.endswith call
+  with a tuple.
+- user agent and body rules use substring search, stopping at the
+  first listed pattern found. Those fields are long (a browser user agent
+  is ~100 characters of letters the signatures start with, a body is
+  kilobytes), and there the regex engine's per-position cost is higher
+  than a few C-level substring searches; the --bench comparison is how
+  this split was chosen.
+
+A rule's "when" limits it to decoy paths (is_fake), request methods or
+declared activity types; a rule without "field" scores on "when" alone.
+Each rule counts once, with the reason naming its first listed pattern
+that matched.
+
+Usage:
+    python services/request_classifier.py --bench [--iterations 20000]
+"""
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import argparse
+import json
+import time
+import re
+import os
+
+DEFAULT_SIGNATURES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'request_signatures.json')
+
+# Accepted by the admin log API (HoneypotLogRequest.activity_type)
+ACTIVITY_TYPES = (
+    'scan', 'login_attempt', 'failed_login', 'page_view', 'api_call', 'legitimate_access',
+    'fake_probe', 'admin_probe', 'database_probe', 'wordpress_probe', 'file_access_probe', 'api_probe'
+)
+
+FIELDS = ('path', 'user_agent', 'body')
+MATCH_MODES = ('contains', 'prefix', 'suffix')
+
+
+class Classification(NamedTuple):
+    score: int
+    reasons: List[str]
+    activity_type: str
+
+
+class SignatureRule:
+    """One scoring rule with its reasons preformatted per pattern"""
+
+    __slots__ = ('id', 'field', 'match', 'patterns', 'score', 'reasons', 'is_fake', 'methods', 'activity_types')
+
+    def __init__(self, rule_id, field, match, patterns, score, reason, is_fake, methods, activity_types):
+        self.id = rule_id
+        self.field = field
+        self.match = match
+        self.patterns = patterns
+        self.score = score
+        self.reasons = [reason.format(pattern=pattern) for pattern in patterns] or [reason]
+        self.is_fake = is_fake
+        self.methods = methods
+        self.activity_types = activity_types
+
+    def applies(self, is_fake: bool, method: str, activity_type: str) -> bool:
+        return ((self.is_fake is None or self.is_fake == is_fake)
+                and (self.methods is None or method in self.methods)
+                and (self.activity_types is None or activity_type in self.activity_types))
+
+
+class ActivityRule:
+    """Activity type assigned when one of its path patterns matches"""
+
+    __slots__ = ('type', 'match', 'patterns')
+
+    def __init__(self, activity_type, match, patterns):
+        self.type = activity_type
+        self.match = match
+        self.patterns = patterns
+
+
+def _trie_pattern(literals) -> str:
+    """Regex alternation shaped as a prefix trie (longest literal first at each position)"""
+    root = {}
+    for literal in literals:
+        node = root
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return emit(root)
+
+
+class RequestClassifier:
+    """Immutable compiled signatures (load a new file to change them)"""
+
+    def __init__(self, spec, rules, decoy, app, defaults, source=None):
+        self.spec = spec
+        self.version = spec.get('version')
+        self.source = source
+        self.max_score = int(spec.get('max_score', 100))
+        self.rules = rules
+        self.decoy = decoy
+        self.app = app
+        self.decoy_default, self.app_default, self.app_default_write = defaults
+
+        # Hit slots: rules first, then decoy and app activity types
+        self.context_slots = [slot for slot, rule in enumerate(rules) if rule.field is None]
+        self.decoy_slots = range(len(rules), len(rules) + len(decoy))
+        self.app_slots = range(len(rules) + len(decoy), len(rules) + len(decoy) + len(app))
+        targets = [(rule.field, rule.match, rule.patterns) for rule in rules]
+        targets += [('path', entry.match, entry.patterns) for entry in decoy + app]
+
+        # Path literal -> [(slot, pattern index)]
+        direct = {}
+        self.affix = []     # (slot, field, match, patterns)
+        self.searched = {'user_agent': [], 'body': []}  # field -> [(slot, patterns)]
+        for slot, (field, match, patterns) in enumerate(targets):
+            if field is None:
+                continue
+            if match != 'contains':
+                self.affix.append((slot, field, match, patterns))
+            elif field != 'path':
+                self.searched[field].append((slot, patterns))
+            else:
+                for index, pattern in enumerate(patterns):
+                    direct.setdefault(pattern, []).append((slot, index))
+
+        # Each hit also counts for the literals that are its prefixes
+        self.closure = {
+            literal: [hit for prefix, hits in direct.items() if literal.startswith(prefix) for hit in hits]
+            for literal in direct
+        }
+        self.scanner = None
+        if direct:
+            first_chars = ''.join(sorted({re.escape(literal[0]) for literal in direct}))
+            self.scanner = re.compile(f'(?=[{first_chars}])(?=({_trie_pattern(direct)}))')
+
+    def _search(self, found: Dict[int, int], field: str, text: str, is_fake, method, activity_type) -> None:
+        for slot, patterns in self.searched[field]:
+            if not self.rules[slot].applies(is_fake, method, activity_type):
+                continue
+            for index, pattern in enumerate(patterns):
+                if pattern in text:
+                    found[slot] = index
+                    break
+
+    def _scan(self, found: Dict[int, int], text: str) -> None:
+        closure = self.closure
+        for literal in self.scanner.findall(text):
+            for slot, index in closure[literal]:
+                known = found.get(slot)
+                if known is None or index < known:
+                    found[slot] = index
+
+    def classify(
+        self,
+        path: str,
+        user_agent: Optional[str] = '',
+        body: Optional[str] = None,
+        method: str = 'GET',
+        is_fake: bool = False,
+        activity_type: Optional[str] = None
+    ) -> Classification:
+        """
+        Score one request
+
+        Args:
+            activity_type: declared by the caller (e.g. failed_login); derived
+                from the path when None
+
+        Returns:
+            Classification: score (0 - max_score), reasons, activity type
+        """
+        path_lower = path.lower()
+        agent_lower = user_agent.lower() if user_agent else ''
+        method = method.upper()
+        found: Dict[int, int] = {}
+
+        if self.scanner is not None:
+            self._scan(found, path_lower)
+
+        for slot, field, match, patterns in self.affix:
+            text = path_lower if field == 'path' else agent_lower
+            test = text.startswith if match == 'prefix' else text.endswith
+            if test(patterns):
+                found[slot] = next(index for index, pattern in enumerate(patterns) if test(pattern))
+
+        if activity_type is None:
+            activity_type = self._activity_type(found, method, is_fake)
+
+        # Searched fields skip rules whose "when" already excludes them
+        if agent_lower and self.searched['user_agent']:
+            self._search(found, 'user_agent', agent_lower, is_fake, method, activity_type)
+        if body and self.searched['body']:
+            self._search(found, 'body', body.lower(), is_fake, method, activity_type)
+
+        # Context-only rules always "hit"; activity slots are past the rules
+        for slot in self.context_slots:
+            found[slot] = 0
+        rules = self.rules
+        score = 0
+        reasons = []
+        for slot in sorted(found):
+            if slot >= len(rules):
+                break
+            rule = rules[slot]
+            if rule.applies(is_fake, method, activity_type):
+                score += rule.score
+                reasons.append(rule.reasons[found[slot]])
+
+        return Classification(max(0, min(self.max_score, score)), reasons, activity_type)
+
+    def _activity_type(self, found: Dict[int, int], method: str, is_fake: bool) -> str:
+        if is_fake:
+            for slot, entry in zip(self.decoy_slots, self.decoy):
+                if slot in found:
+                    return entry.type
+            return self.decoy_default
+        for slot, entry in zip(self.app_slots, self.app):
+            if slot in found:
+                return entry.type
+        return self.app_default if method == 'GET' else self.app_default_write
+
+    def describe(self):
+        return {
+            'source': self.source,
+            'version': self.version,
+            'rules': len(self.rules),
+            'activity_types': len(self.decoy) + len(self.app)
+        }
+
+
+def _patterns(entry, what) -> Tuple[str, ...]:
+    patterns = entry.get('patterns', [])
+    if not isinstance(patterns, list) or not all(isinstance(p, str) and p for p in patterns):
+        raise ValueError(f"{what}: patterns must be a list of non-empty strings")
+    return tuple(dict.fromkeys(p.lower() for p in patterns))
+
+
+def _match(entry, what) -> str:
+    match = entry.get('match', 'contains')
+    if match not in MATCH_MODES:
+        raise ValueError(f"{what}: unknown match {match!r} (choose from {', '.join(MATCH_MODES)})")
+    return match
+
+
+def _activity_type(value, what) -> str:
+    if value not in ACTIVITY_TYPES:
+        raise ValueError(f"{what}: unknown activity type {value!r}")
+    return value
+
+
+def compile_signatures(spec, source=None) -> RequestClassifier:
+    """
+    Validate a signature spec (parsed request_signatures.json) and build the classifier
+
+    Raises:
+        ValueError: unknown field, match mode or activity type, bad patterns or score
+    """
+    rules = []
+    for position, entry in enumerate(spec.get('rules', [])):
+        what = f"rule {entry.get('id', position)}"
+        field = entry.get('field')
+        if field is not None and field not in FIELDS:
+            raise ValueError(f"{what}: unknown field {field!r} (choose from {', '.join(FIELDS)})")
+        match = _match(entry, what)
+        if field == 'body' and match != 'contains':
+            raise ValueError(f"{what}: body rules only support 'contains'")
+        patterns = _patterns(entry, what)
+        if field is not None and not patterns:
+            raise ValueError(f"{what}: a {field} rule needs patterns")
+        try:
+            score = int(entry['score'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"{what}: score must be a number")
+
+        when = entry.get('when', {})
+        methods = when.get('methods')
+        activity_types = when.get('activity_types')
+        rules.append(SignatureRule(
+            entry.get('id', str(position)), field, match, patterns, score,
+            entry.get('reason', entry.get('id', 'Suspicious request')),
+            when.get('is_fake'),
+            frozenset(m.upper() for m in methods) if methods is not None else None,
+            frozenset(_activity_type(t, what) for t in activity_types) if activity_types is not None else None
+        ))
+
+    activities = spec.get('activity_types', {})
+    groups = {}
+    for group in ('decoy', 'app'):
+        groups[group] = [
+            ActivityRule(_activity_type(entry.get('type'), f"{group} activity"),
+                         _match(entry, f"{group} activity {entry.get('type')}"),
+                         _patterns(entry, f"{group} activity {entry.get('type')}"))
+            for entry in activities.get(group, [])
+        ]
+    defaults = (
+        _activity_type(activities.get('decoy_default', 'fake_probe'), 'decoy_default'),
+        _activity_type(activities.get('app_default', 'page_view'), 'app_default'),
+        _activity_type(activities.get('app_default_write', 'api_call'), 'app_default_write')
+    )
+    return RequestClassifier(spec, rules, groups['decoy'], groups['app'], defaults, source)
+
+
+def load_signatures(path=DEFAULT_SIGNATURES_FILE) -> RequestClassifier:
+    """Read and compile a signature file"""
+    with open(path) as f:
+        return compile_signatures(json.load(f), path)
+
+
+# ========================================
+# MICRO-BENCHMARK
+# ========================================
+
+BENCH_REQUESTS = [
+    # (method, path, user agent, body, is_fake)
+    ('GET', '/', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/120.0 Safari/537.36', None, False),
+    ('GET', '/static/js/app.3f2a1c.js', 'Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0', None, False),
+    ('GET', '/api/v1/users/me', 'Mozilla/5.0 (Macintosh; Intel Mac OS X 14_2) AppleWebKit/605.1.15 Safari/605.1.15', None, False),
+    ('POST', '/api/v1/auth/login', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0',
+     '{"username": "alice", "password": "correct horse battery staple"}', False),
+    ('POST', '/api/v1/scanner/ip', 'Mozilla/5.0 (X11; Linux x86_64) Chrome/120.0',
+     '{"ip_address": "203.0.113.7", "options": {"deep": true}}' * 20, False),
+    ('GET', "/products?id=1' UNION SELECT username,password FROM users--", 'sqlmap/1.7.12#stable (https://sqlmap.org)', None, False),
+    ('GET', '/../../etc/passwd', 'curl/8.5.0', None, False),
+    ('GET', '/search?q=<script>alert(1)</script>', 'Mozilla/5.0 Nikto/2.5.0', None, False),
+    ('GET', '/wp-admin/admin-ajax.php', 'Mozilla/5.0 (compatible; Nmap Scripting Engine)', None, True),
+    ('POST', '/phpmyadmin/index.php', 'python-requests/2.31.0', 'pma_username=root&pma_password=root&server=1', True),
+    ('GET', '/.env', 'Wget/1.21.4', None, True),
+    ('GET', '/administrator/index.php', 'Mozilla/5.0 zgrab/0.x', None, True),
+    ('POST', '/admin', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/120.0',
+     'username=admin&password=admin123&submit=Login' * 10, True),
+]
+
+
+def _reference_classify(classifier: RequestClassifier, path, user_agent, body, method, is_fake):
+    """Same semantics with one substring pass per pattern (the pre-classifier approach)"""
+    path_lower = path.lower()
+    agent_lower = (user_agent or '').lower()
+    body_lower = body.lower() if body else ''
+    texts = {'path': path_lower, 'user_agent': agent_lower, 'body': body_lower}
+
+    def first(field, match, patterns):
+        text = texts[field]
+        for index, pattern in enumerate(patterns):
+            if (match == 'contains' and pattern in text) or (match == 'prefix' and text.startswith(pattern)) \
+                    or (match == 'suffix' and text.endswith(pattern)):
+                return index
+        return None
+
+    activity_type = None
+    for entry in (classifier.decoy if is_fake else classifier.app):
+        if first('path', entry.match, entry.patterns) is not None:
+            activity_type = entry.type
+            break
+    if activity_type is None:
+        activity_type = classifier.decoy_default if is_fake else (
+            classifier.app_default if method == 'GET' else classifier.app_default_write)
+
+    score = 0
+    reasons = []
+    for rule in classifier.rules:
+        if not rule.applies(is_fake, method, activity_type):
+            continue
+        index = 0 if rule.field is None else first(rule.field, rule.match, rule.patterns)
+        if index is not None:
+            score += rule.score
+            reasons.append(rule.reasons[index])
+    return Classification(max(0, min(classifier.max_score, score)), reasons, activity_type)
+
+
+def bench(iterations: int = 20000, path: str = DEFAULT_SIGNATURES_FILE) -> None:
+    classifier = load_signatures(path)
+    for method, request_path, agent, body, is_fake in BENCH_REQUESTS:
+        compiled = classifier.classify(request_path, agent, body, method, is_fake)
+        reference = _reference_classify(classifier, request_path, agent, body, method, is_fake)
+        if compiled != reference:
+            raise AssertionError(f"{method} {request_path}: {compiled} != {reference}")
+
+    total = iterations * len(BENCH_REQUESTS)
+    results = {}
+    for name, run in (('compiled', lambda m, p, a, b, f: classifier.classify(p, a, b, m, f)),
+                      ('reference', lambda m, p, a, b, f: _reference_classify(classifier, p, a, b, m, f))):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for method, request_path, agent, body, is_fake in BENCH_REQUESTS:
+                run(method, request_path, agent, body, is_fake)
+        results[name] = (time.perf_counter() - started) / total * 1e6
+
+    print(f"[BENCH] Signatures v{classifier.version}: {len(classifier.rules)} rules, "
+          f"{len(BENCH_REQUESTS)} sample requests x {iterations}")
+    for name, micros in results.items():
+        print(f"[BENCH] {name:<10} {micros:7.2f} us/request  {1e6 / micros:12,.0f} requests/s")
+    print(f"[BENCH] speedup    {results['reference'] / results['compiled']:7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Request classifier signatures")
+    parser.add_argument('--bench', action='store_true', help="Micro-benchmark against per-pattern substring scans")
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--signatures', default=DEFAULT_SIGNATURES_FILE)
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.iterations, args.signatures)
+    else:
+        print(json.dumps(load_signatures(args.signatures).describe(), indent=2))
+
+
+# Global instance
+request_classifier = load_signatures()
+
+
+if __name__ == '__main__':
+    main()
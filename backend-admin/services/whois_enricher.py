@@ -0,0 +1,236 @@
+"""
+WHOIS Enricher
+Deferred WHOIS enrichment of honeypot logs with a persistent per-IP cache
+
+A WHOIS query is a blocking socket round-trip to a registry server that
+can take seconds. Ingest no longer does one per logged request: it reads
+whois_records once per batch (whois_from_cache) and inserts rows right
+away, with whois_data taken from the cache when the IP is known and NULL
+otherwise. Unknown or expired IPs are queued as 'pending' records in the
+same transaction.
+
+This job drains the queue a batch (WHOIS_BATCH_SIZE) at a time with
+WHOIS_WORKERS concurrent lookups, stores each result in the cache
+(WHOIS_CACHE_TTL_DAYS for answers, WHOIS_RETRY_HOURS before a failed
+address is tried again) and back-fills whois_data on the honeypot_logs
+rows of the resolved IPs. Pending records are claimed with FOR UPDATE
+SKIP LOCKED, so a second instance takes different addresses.
+
+Usage:
+    python services/whois_enricher.py           # every WHOIS_ENRICH_INTERVAL_SECONDS
+    python services/whois_enricher.py --once
+"""
+
+from sqlalchemy import select, update, bindparam, func, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+import ipaddress
+import argparse
+import socket
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import settings
+from database.database import SessionLocal
+from models.honeypot import HoneypotLog
+from models.whois import WhoisRecord
+from services.whois_service import whois_service
+
+IPS_PER_QUERY = 1000
+
+
+def _is_public(ip: str) -> bool:
+    """Only globally routed addresses have a WHOIS record worth asking for"""
+    try:
+        return ipaddress.ip_address(ip).is_global
+    except ValueError:
+        return False
+
+
+def whois_from_cache(db, ips: Iterable[str]) -> Dict[str, dict]:
+    """
+    Cached WHOIS results for the given client IPs (ingest path: never does a lookup)
+
+    Public IPs with no record, or whose record has expired, are queued for
+    the enrichment job in the caller's transaction. An expired answer is
+    still returned until the new one replaces it.
+
+    Returns:
+        Dict: ip -> lookup_whois() result, for IPs with a successful lookup
+    """
+    ips = sorted({ip for ip in ips if _is_public(ip)})
+    now = datetime.now(timezone.utc)
+    found = {}
+    queue = []
+
+    for start in range(0, len(ips), IPS_PER_QUERY):
+        chunk = ips[start:start + IPS_PER_QUERY]
+        known = set()
+        rows = db.execute(
+            select(WhoisRecord.ip_address, WhoisRecord.status, WhoisRecord.whois_data, WhoisRecord.expires_at)
+            .where(WhoisRecord.ip_address.in_(chunk))
+        )
+        for ip, record_status, whois_data, expires_at in rows:
+            known.add(ip)
+            if record_status == 'ok' and whois_data:
+                found[ip] = whois_data
+            if record_status != 'pending' and expires_at is not None and expires_at <= now:
+                queue.append(ip)
+        queue.extend(ip for ip in chunk if ip not in known)
+
+    if queue:
+        # Sorted keys: concurrent batches lock conflicting rows in the same order
+        table = WhoisRecord.__table__
+        stmt = pg_insert(table).values([{'ip_address': ip, 'status': 'pending'} for ip in sorted(queue)])
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[table.c.ip_address],
+                set_={'status': 'pending', 'requested_at': func.now()},
+                where=(table.c.status != 'pending') & (table.c.expires_at <= now)
+            )
+        )
+    return found
+
+
+class WhoisEnricher:
+    """Looks up queued IPs and back-fills honeypot_logs.whois_data"""
+
+    def __init__(
+        self,
+        batch_size: int = settings.WHOIS_BATCH_SIZE,
+        workers: int = settings.WHOIS_WORKERS,
+        cache_ttl: timedelta = timedelta(days=settings.WHOIS_CACHE_TTL_DAYS),
+        retry_after: timedelta = timedelta(hours=settings.WHOIS_RETRY_HOURS)
+    ):
+        self.batch_size = batch_size
+        self.cache_ttl = cache_ttl
+        self.retry_after = retry_after
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='whois')
+        self.last_run_started: Optional[datetime] = None
+
+    def claim(self, session) -> List[str]:
+        """Lock the next batch of pending IPs until commit (other instances skip them)"""
+        return list(session.execute(
+            select(WhoisRecord.ip_address)
+            .where(WhoisRecord.status == 'pending')
+            .order_by(WhoisRecord.requested_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        ).scalars())
+
+    def lookup(self, ips: List[str]) -> Dict[str, dict]:
+        return dict(zip(ips, self.pool.map(whois_service.lookup_whois, ips)))
+
+    def store(self, session, results: Dict[str, dict], now: datetime) -> None:
+        table = WhoisRecord.__table__
+        session.execute(
+            update(table)
+            .where(table.c.ip_address == bindparam('ip'))
+            .values(
+                status=bindparam('new_status'),
+                whois_data=bindparam('data'),
+                error=bindparam('err'),
+                attempts=table.c.attempts + 1,
+                looked_up_at=now,
+                expires_at=bindparam('expires')
+            ),
+            [
+                {
+                    'ip': ip,
+                    'new_status': 'ok' if result.get('success') else 'failed',
+                    'data': result if result.get('success') else None,
+                    'err': None if result.get('success') else result.get('error'),
+                    'expires': now + (self.cache_ttl if result.get('success') else self.retry_after)
+                }
+                for ip, result in results.items()
+            ]
+        )
+
+    def backfill(self, session, ips: Optional[List[str]] = None, since: Optional[datetime] = None) -> int:
+        """Copy cached answers into honeypot_logs rows still without WHOIS data"""
+        logs = HoneypotLog.__table__
+        records = WhoisRecord.__table__
+        stmt = (
+            update(logs)
+            .where(logs.c.ip_address == records.c.ip_address,
+                   # Inserted None is stored as JSON null, not SQL NULL
+                   or_(logs.c.whois_data.is_(None), func.jsonb_typeof(logs.c.whois_data) == 'null'),
+                   records.c.status == 'ok')
+            .values(whois_data=records.c.whois_data)
+        )
+        if ips is not None:
+            stmt = stmt.where(records.c.ip_address.in_(ips))
+        if since is not None:
+            stmt = stmt.where(records.c.looked_up_at >= since)
+        return session.execute(stmt).rowcount
+
+    def run_once(self) -> Dict[str, int]:
+        """Resolve everything queued, one committed batch at a time"""
+        stats = {'lookups': 0, 'failed': 0, 'rows_backfilled': 0}
+        started = datetime.now(timezone.utc)
+        session = SessionLocal()
+        try:
+            while True:
+                ips = self.claim(session)
+                if not ips:
+                    break
+                results = self.lookup(ips)
+                self.store(session, results, datetime.now(timezone.utc))
+                resolved = [ip for ip, result in results.items() if result.get('success')]
+                if resolved:
+                    stats['rows_backfilled'] += self.backfill(session, ips=resolved)
+                session.commit()
+
+                stats['lookups'] += len(ips)
+                stats['failed'] += len(ips) - len(resolved)
+                if len(ips) < self.batch_size:
+                    break
+
+            # Rows whose ingest read the cache just before a lookup committed
+            # (all answered records after a restart)
+            stats['rows_backfilled'] += self.backfill(session, since=self.last_run_started)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        self.last_run_started = started
+        elapsed = (datetime.now(timezone.utc) - started).total_seconds()
+        print(f"[WHOIS] {stats['lookups']} lookups ({stats['failed']} failed), "
+              f"{stats['rows_backfilled']} log rows back-filled ({elapsed:.1f}s)")
+        return stats
+
+    def run_forever(self, interval: int = settings.WHOIS_ENRICH_INTERVAL_SECONDS) -> None:
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[WHOIS] Run failed: {e}")
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back-fill WHOIS data on honeypot logs")
+    parser.add_argument('--once', action='store_true', help="Single run instead of every --interval seconds")
+    parser.add_argument('--interval', type=int, default=settings.WHOIS_ENRICH_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    # python-whois has no per-query timeout; bound every socket of this process
+    socket.setdefaulttimeout(settings.WHOIS_TIMEOUT_SECONDS)
+
+    enricher = WhoisEnricher()
+    if args.once:
+        enricher.run_once()
+    else:
+        enricher.run_forever(args.interval)
+
+
+if __name__ == '__main__':
+    main()
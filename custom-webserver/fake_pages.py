@@ -0,0 +1,417 @@
+"""
+Fake Page Cache
+Decoy pages rendered once at startup into precompressed, ETagged responses
+
+Scanners request the same handful of decoy paths over and over. Instead of
+building an HTMLResponse from a string literal per request, every page is
+rendered at startup into:
+
+- identity, gzip and (when the brotli package is installed) br bodies
+- a strong ETag per encoding, Content-Length and the full raw header list
+- a 304 header list for conditional requests (If-None-Match)
+
+so a request costs an encoding lookup (memoized per Accept-Encoding value),
+an ETag comparison and a copy of the header list.
+
+Fingerprinting: each page exists in FAKE_PAGE_VARIANTS "personas" (product
+versions, copyright year, site name, keys and passwords). A persona is
+generated from FAKE_PAGE_SEED, so every worker process renders the same
+bytes and ETags, and a client IP always sees the same persona; different
+clients (or a new seed) see different, internally consistent sites.
+"""
+
+from string import Template
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import random
+import string
+import json
+import gzip
+import zlib
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+HTML = "text/html; charset=utf-8"
+TEXT = "text/plain; charset=utf-8"
+JSON = "application/json"
+
+ENCODING_PREFERENCE = ('br', 'gzip')  # Smallest first
+MAX_ENCODING_KEYS = 256  # Distinct Accept-Encoding values remembered (scanners send odd ones)
+ALPHANUMERIC = string.ascii_letters + string.digits
+
+
+# ========================================================================
+# Personas (values substituted into the templates)
+# ========================================================================
+
+def _token(rng: random.Random, length: int) -> str:
+    return ''.join(rng.choice(ALPHANUMERIC) for _ in range(length))
+
+
+def make_persona(rng: random.Random) -> Dict[str, str]:
+    """One internally consistent fake site"""
+    year = rng.choice(['2023', '2024', '2025'])
+    return {
+        'site_version': rng.choice(['2.4.1', '2.4.3', '2.5.0', '2.6.2', '3.0.1']),
+        'year': year,
+        'updated': f"{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        'pma_version': rng.choice(['4.9.5', '4.9.7', '5.0.4', '5.1.1', '5.2.0']),
+        'mysql_version': rng.choice(['5.7.34', '5.7.40', '8.0.28', '8.0.33']),
+        'wp_site': rng.choice(['My Site', 'Company Blog', 'News', 'Shop', 'Portfolio']),
+        'app_name': rng.choice(['ProductionApp', 'Portal', 'CRM', 'Backoffice']),
+        'app_key': _token(rng, 43),
+        'db_name': rng.choice(['production', 'production_db', 'app', 'main']),
+        'db_password': _token(rng, 12),
+        'secret_key': _token(rng, 24),
+        'redis_password': _token(rng, 10),
+        'php_line': str(rng.randint(12, 140)),
+        'jwt': f"eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.{_token(rng, 48)}.{_token(rng, 43)}"
+    }
+
+
+# ========================================================================
+# Templates ($name = persona value)
+# ========================================================================
+
+ADMIN_PAGE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Admin Panel - Login</title>
+    <style>
+        body { font-family: Arial; background: #f0f0f0; padding: 50px; }
+        .login-box { max-width: 400px; margin: 0 auto; background: white; padding: 30px; border: 1px solid #ccc; }
+        input { width: 100%; padding: 10px; margin: 10px 0; }
+        button { width: 100%; padding: 10px; background: #007bff; color: white; border: none; cursor: pointer; }
+    </style>
+</head>
+<body>
+    <div class="login-box">
+        <h2>Admin Panel</h2>
+        <form method="post">
+            <input type="text" name="username" placeholder="Username" required>
+            <input type="password" name="password" placeholder="Password" required>
+            <button type="submit">Login</button>
+        </form>
+        <p style="color: #666; font-size: 12px;">Version $site_version | &copy; $year</p>
+    </div>
+</body>
+</html>
+    """
+
+PHPMYADMIN_PAGE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>phpMyAdmin</title>
+    <style>
+        body { font-family: Arial; margin: 0; }
+        .header { background: #465457; color: white; padding: 10px; }
+        .content { padding: 20px; }
+        input { padding: 5px; margin: 5px 0; }
+        button { padding: 5px 15px; background: #0099cc; color: white; border: none; }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>phpMyAdmin $pma_version</h1>
+    </div>
+    <div class="content">
+        <h3>Database server</h3>
+        <form>
+            <input type="text" name="pma_username" placeholder="Username" /><br>
+            <input type="password" name="pma_password" placeholder="Password" /><br>
+            <button type="submit">Go</button>
+        </form>
+        <p style="color: #666; font-size: 11px;">MySQL $mysql_version - localhost via TCP/IP</p>
+    </div>
+</body>
+</html>
+    """
+
+WORDPRESS_PAGE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Log In ‹ $wp_site — WordPress</title>
+    <style>
+        body { background: #f1f1f1; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto; }
+        #loginform { background: white; padding: 26px 24px; margin: 100px auto; max-width: 320px; box-shadow: 0 1px 3px rgba(0,0,0,.13); }
+        input { width: 100%; padding: 8px; margin: 5px 0; border: 1px solid #ddd; }
+        .button { background: #2271b1; color: white; border: none; padding: 10px; cursor: pointer; width: 100%; }
+    </style>
+</head>
+<body>
+    <form id="loginform">
+        <h1 style="text-align: center;">$wp_site</h1>
+        <p><label>Username or Email Address<br><input type="text" name="log" /></label></p>
+        <p><label>Password<br><input type="password" name="pwd" /></label></p>
+        <p><button type="submit" class="button">Log In</button></p>
+        <p style="font-size: 13px;"><a href="#">Lost your password?</a></p>
+    </form>
+</body>
+</html>
+    """
+
+ENV_FILE = """
+APP_NAME=$app_name
+APP_ENV=production
+APP_KEY=base64:$app_key
+APP_DEBUG=false
+APP_URL=http://localhost
+
+DB_CONNECTION=mysql
+DB_HOST=127.0.0.1
+DB_PORT=3306
+DB_DATABASE=$db_name
+DB_USERNAME=root
+DB_PASSWORD=$db_password
+
+CACHE_DRIVER=redis
+QUEUE_CONNECTION=redis
+SESSION_DRIVER=redis
+"""
+
+CONFIG_PHP = """
+<?php
+define('DB_HOST', 'localhost');
+define('DB_USER', 'admin');
+define('DB_PASS', '$db_password');
+define('DB_NAME', '$db_name');
+define('SECRET_KEY', '$secret_key');
+?>
+"""
+
+NOT_FOUND_PAGE = "<h1>404 Not Found</h1><p>The requested resource was not found on this server.</p>"
+
+PHP_ERROR_PAGE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>PHP Error</title>
+    <style>
+        body { font-family: Arial; background: #f0f0f0; padding: 50px; }
+        .error { background: white; padding: 20px; border: 1px solid #ccc; }
+    </style>
+</head>
+<body>
+    <div class="error">
+        <h2>PHP Fatal Error</h2>
+        <p>Call to undefined function mysql_connect() in /var/www/html/index.php on line $php_line</p>
+        <p>Please check your database configuration.</p>
+    </div>
+</body>
+</html>
+    """
+
+HOMEPAGE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Welcome to Our Server</title>
+    <style>
+        body { font-family: Arial; background: #f0f0f0; padding: 50px; text-align: center; }
+        .container { max-width: 600px; margin: 0 auto; background: white; padding: 30px; border: 1px solid #ccc; }
+        h1 { color: #333; }
+        p { color: #666; line-height: 1.6; }
+        .links { margin: 20px 0; }
+        .links a { display: inline-block; margin: 10px; padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; }
+        .links a:hover { background: #0056b3; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>Welcome to Our Server</h1>
+        <p>This is a production server running various services.</p>
+        <p>Please use the links below to access different areas:</p>
+        <div class="links">
+            <a href="/admin">Admin Panel</a>
+            <a href="/phpmyadmin">Database</a>
+            <a href="/wp-admin">WordPress</a>
+        </div>
+        <p style="font-size: 12px; color: #999;">Server v$site_version | Last updated: $updated</p>
+    </div>
+</body>
+</html>
+    """
+
+API_ROOT = {
+    "version": "1.0.0",
+    "status": "active",
+    "endpoints": [
+        "/api/v1/auth/login",
+        "/api/v1/users",
+        "/api/v1/config",
+        "/api/v1/database"
+    ]
+}
+
+API_LOGIN = {
+    "success": True,
+    "message": "Login successful",
+    "token": "$jwt",
+    "user": {
+        "id": 1,
+        "email": "admin@example.com",
+        "role": "admin"
+    }
+}
+
+API_USERS = {
+    "users": [
+        {"id": 1, "email": "admin@example.com", "role": "admin"},
+        {"id": 2, "email": "user@example.com", "role": "user"}
+    ]
+}
+
+API_CONFIG = {
+    "database": {
+        "host": "localhost",
+        "port": 3306,
+        "username": "root",
+        "password": "$db_password"
+    },
+    "redis": {
+        "host": "localhost",
+        "port": 6379,
+        "password": "$redis_password"
+    }
+}
+
+
+def _json(document) -> str:
+    # Same serialization as JSONResponse
+    return json.dumps(document, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+
+
+# name -> (media type, status, template)
+PAGES = {
+    'admin': (HTML, 200, ADMIN_PAGE),
+    'phpmyadmin': (HTML, 200, PHPMYADMIN_PAGE),
+    'wordpress': (HTML, 200, WORDPRESS_PAGE),
+    'env': (TEXT, 200, ENV_FILE),
+    'config_php': (TEXT, 200, CONFIG_PHP),
+    'not_found': (HTML, 404, NOT_FOUND_PAGE),
+    'php_error': (HTML, 200, PHP_ERROR_PAGE),
+    'homepage': (HTML, 200, HOMEPAGE),
+    'api_root': (JSON, 200, _json(API_ROOT)),
+    'api_login': (JSON, 200, _json(API_LOGIN)),
+    'api_users': (JSON, 200, _json(API_USERS)),
+    'api_config': (JSON, 200, _json(API_CONFIG))
+}
+
+
+# ========================================================================
+# Precomputed responses
+# ========================================================================
+
+class CachedResponse(Response):
+    """Response whose body and headers were built at startup"""
+
+    def __init__(self, status_code: int, body: bytes, raw_headers: List[Tuple[bytes, bytes]]):
+        self.status_code = status_code
+        self.body = body
+        self.raw_headers = list(raw_headers)  # Middleware may append to it (CORS)
+        self.background = None
+
+
+class EncodedPage:
+    """One persona of one page in one content encoding"""
+
+    __slots__ = ('status', 'body', 'etag', 'headers', 'not_modified_headers')
+
+    def __init__(self, status: int, media_type: str, body: bytes, etag: str, encoding: str):
+        self.status = status
+        self.body = body
+        self.etag = etag
+        common = [(b"etag", etag.encode()), (b"vary", b"accept-encoding"), (b"cache-control", b"no-cache")]
+        self.headers = [(b"content-type", media_type.encode()), (b"content-length", str(len(body)).encode())]
+        if encoding != 'identity':
+            self.headers.append((b"content-encoding", encoding.encode()))
+        self.headers += common
+        self.not_modified_headers = common
+
+
+def negotiate_encoding(accept_encoding: str, available: Tuple[str, ...]) -> str:
+    """Preferred available content coding for an Accept-Encoding value ('identity' if none)"""
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q=') and not params[2:].strip('0.'):
+            continue  # q=0: refused
+        accepted.add(coding.strip())
+    for coding in available:
+        if coding in accepted or '*' in accepted:
+            return coding
+    return 'identity'
+
+
+class FakePageCache:
+    """All decoy pages x personas x encodings, rendered once"""
+
+    def __init__(self, seed: str, variants: int = 4):
+        self.seed = seed
+        self.variants = max(1, variants)
+        self.available = tuple(c for c in ENCODING_PREFERENCE if c != 'br' or brotli is not None)
+        self.pages: Dict[str, List[Dict[str, EncodedPage]]] = {}
+        self.encodings: Dict[str, str] = {}  # Accept-Encoding value -> negotiated coding
+        self.stats = {'served': 0, 'not_modified': 0, 'identity': 0, 'gzip': 0, 'br': 0}
+
+        personas = [make_persona(random.Random(f"{seed}:{index}")) for index in range(self.variants)]
+        self.rendered_bytes = 0
+        for name, (media_type, status, template) in PAGES.items():
+            self.pages[name] = [self._render(media_type, status, Template(template).substitute(persona))
+                                for persona in personas]
+
+    def _render(self, media_type: str, status: int, text: str) -> Dict[str, EncodedPage]:
+        body = text.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:20]
+        bodies = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            bodies['br'] = brotli.compress(body, quality=11)
+
+        encoded = {}
+        for encoding, data in bodies.items():
+            # A different representation needs a different strong ETag
+            etag = f'"{digest}"' if encoding == 'identity' else f'"{digest}-{encoding}"'
+            encoded[encoding] = EncodedPage(status, media_type, data, etag, encoding)
+            self.rendered_bytes += len(data)
+        return encoded
+
+    def respond(self, name: str, request: Request, client_ip: Optional[str] = None) -> Response:
+        """The page for this client's persona, in its preferred encoding (304 if unchanged)"""
+        headers = request.headers
+        accept_encoding = headers.get('accept-encoding', '')
+        encoding = self.encodings.get(accept_encoding)
+        if encoding is None:
+            if len(self.encodings) >= MAX_ENCODING_KEYS:
+                self.encodings.clear()
+            encoding = self.encodings[accept_encoding] = negotiate_encoding(accept_encoding, self.available)
+
+        variants = self.pages[name]
+        variant = variants[zlib.crc32(client_ip.encode()) % self.variants] if client_ip and self.variants > 1 else variants[0]
+        page = variant[encoding]
+
+        self.stats['served'] += 1
+        if page.status == 200:
+            if_none_match = headers.get('if-none-match')
+            if if_none_match and (page.etag in if_none_match or if_none_match.strip() == '*'):
+                self.stats['not_modified'] += 1
+                return CachedResponse(304, b"", page.not_modified_headers)
+        self.stats[encoding] += 1
+        return CachedResponse(page.status, page.body, page.headers)
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats)
+        stats['pages'] = len(self.pages)
+        stats['variants'] = self.variants
+        stats['encodings'] = ['identity', *self.available]
+        stats['rendered_bytes'] = self.rendered_bytes
+        return stats
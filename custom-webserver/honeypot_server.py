@@ -11,19 +11,29 @@ Architecture:
 """
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, PlainTextResponse
+from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import os
 import sys
 import time
-import httpx
+import socket
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
 import jwt
 
+from log_shipper import LogShipper
+from fake_pages import FakePageCache
+
+# Shared request classifier (signatures live in backend-admin/services)
+backend_admin_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend-admin'))
+if backend_admin_dir not in sys.path:
+    sys.path.insert(0, backend_admin_dir)
+
+from services.request_classifier import request_classifier
+
 # ========================================================================
 # Configuration
 # ========================================================================
@@ -35,10 +45,36 @@ class Config:
     CENTRAL_MONITOR_URL = os.getenv("CENTRAL_MONITOR_URL", "https://central-monitor.local")
     CENTRAL_MONITOR_API_KEY = os.getenv("CENTRAL_MONITOR_API_KEY", "your-secret-key")
     
+    # Log batching (see log_shipper.py)
+    LOG_BATCH_INTERVAL_MS = int(os.getenv("LOG_BATCH_INTERVAL_MS", "500"))
+    LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "100"))
+    LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", "10000"))
+    LOG_SPILL_DIR = os.getenv("LOG_SPILL_DIR", str(Path(__file__).parent / "spool"))
+    LOG_SPILL_MAX_MB = int(os.getenv("LOG_SPILL_MAX_MB", "100"))
+    
+    # Fake pages (see fake_pages.py): personas per page, same seed = same pages and ETags
+    FAKE_PAGE_VARIANTS = int(os.getenv("FAKE_PAGE_VARIANTS", "4"))
+    FAKE_PAGE_SEED = os.getenv("FAKE_PAGE_SEED", socket.gethostname())
+    
     # No backend user API on honeypot server (pure honeypot)
 
 config = Config()
 
+# One pooled client + batch queue per worker process
+log_shipper = LogShipper(
+    batch_url=f"{config.CENTRAL_MONITOR_URL}/api/admin/honeypot/log/batch",
+    single_url=f"{config.CENTRAL_MONITOR_URL}/api/admin/honeypot/log",
+    api_key=config.CENTRAL_MONITOR_API_KEY,
+    flush_interval_ms=config.LOG_BATCH_INTERVAL_MS,
+    flush_records=config.LOG_BATCH_SIZE,
+    max_buffer=config.LOG_BUFFER_SIZE,
+    spill_dir=config.LOG_SPILL_DIR,
+    spill_max_bytes=config.LOG_SPILL_MAX_MB * 1024 * 1024
+)
+
+# Every decoy page rendered and compressed once, at import
+fake_pages = FakePageCache(seed=config.FAKE_PAGE_SEED, variants=config.FAKE_PAGE_VARIANTS)
+
 # ========================================================================
 # Lifespan
 # ========================================================================
@@ -50,13 +86,26 @@ async def lifespan(app: FastAPI):
     print(f"[OK] Host: {config.HOST}:{config.PORT}")
     print(f"[OK] Mode: Pure Honeypot")
     print(f"[OK] Central Monitor: {config.CENTRAL_MONITOR_URL}")
+    print(f"[OK] Log batching: {config.LOG_BATCH_SIZE} records / {config.LOG_BATCH_INTERVAL_MS}ms, "
+          f"buffer {config.LOG_BUFFER_SIZE}, spill {config.LOG_SPILL_DIR}")
+    page_stats = fake_pages.get_stats()
+    print(f"[OK] Fake pages: {page_stats['pages']} x {page_stats['variants']} variants, "
+          f"encodings {'/'.join(page_stats['encodings'])}, {page_stats['rendered_bytes'] // 1024}KB precomputed")
     print("="*70)
     print("[FEATURES]")
     print("  Fake paths: /admin, /phpmyadmin, /wp-admin, /.env, /api/v1/*, etc")
     print("  Pure honeypot: NO real user app")
     print("  All logs → Central Monitor")
     print("="*70)
+    await log_shipper.start()
     yield
+    await log_shipper.stop()
+    stats = log_shipper.get_stats()
+    print(f"[LOGS] sent={stats['sent']} batches={stats['batches']} spilled={stats['spilled']} "
+          f"dropped={stats['dropped']} avg_flush={stats['avg_flush_ms']:.1f}ms max_flush={stats['max_flush_ms']:.1f}ms")
+    page_stats = fake_pages.get_stats()
+    print(f"[PAGES] served={page_stats['served']} not_modified={page_stats['not_modified']} "
+          f"br={page_stats['br']} gzip={page_stats['gzip']} identity={page_stats['identity']}")
     print("\n[SHUTDOWN] Honeypot stopped")
 
 # ========================================================================
@@ -98,14 +147,10 @@ async def log_to_central_monitor(
     response_status: int,
     is_fake: bool = False
 ):
-    """Send log to Central Monitor Server"""
+    """Queue a log record for the Central Monitor (sent in batches by log_shipper)"""
     try:
         client_ip = get_client_ip(request)
         
-        # Calculate suspicious score based on path and request
-        suspicious_score = calculate_suspicious_score(path, request, is_fake)
-        activity_type = detect_activity_type(path, request, is_fake)
-        
         # Read request body for POST requests
         request_body = None
         if request.method in ["POST", "PUT", "PATCH"]:
@@ -115,6 +160,16 @@ async def log_to_central_monitor(
             except:
                 request_body = None
         
+        # Score path, user agent and body in one classifier call
+        suspicious_score, suspicious_reasons, activity_type = request_classifier.classify(
+            path,
+            request.headers.get("User-Agent", ""),
+            request_body,
+            request.method,
+            is_fake=is_fake,
+            activity_type=None if is_fake else "legitimate_access"
+        )
+        
         log_data = {
             "client_ip": client_ip,
             "user_agent": request.headers.get("User-Agent", ""),
@@ -125,93 +180,16 @@ async def log_to_central_monitor(
             "response_status": response_status,
             "is_fake_path": is_fake,
             "suspicious_score": suspicious_score,
+            "suspicious_reasons": suspicious_reasons,
             "activity_type": activity_type,
             "timestamp": datetime.now().isoformat()
         }
         
-        async with httpx.AsyncClient(verify=False) as client:
-            await client.post(
-                f"{config.CENTRAL_MONITOR_URL}/api/admin/honeypot/log",
-                json=log_data,
-                headers={"X-API-Key": config.CENTRAL_MONITOR_API_KEY},
-                timeout=5
-            )
-            
+        log_shipper.submit(log_data)
+        
         print(f"[HONEYPOT] {client_ip} → {path} (score: {suspicious_score}, type: {activity_type})")
     except Exception as e:
-        print(f"[ERROR] Failed to log to Central Monitor: {e}")
-
-def calculate_suspicious_score(path: str, request: Request, is_fake: bool) -> int:
-    """Calculate suspicious score based on request characteristics"""
-    score = 0
-    path_lower = path.lower()
-    
-    # Base score for fake paths
-    if is_fake:
-        score += 50
-    
-    # High-risk paths
-    high_risk_paths = ['/admin', '/phpmyadmin', '/wp-admin', '/.env', '/config.php', '/.git', '/.htaccess']
-    for risk_path in high_risk_paths:
-        if risk_path in path_lower:
-            score += 30
-            break
-    
-    # API endpoints
-    if '/api/' in path_lower:
-        score += 20
-    
-    # File extensions
-    dangerous_extensions = ['.php', '.asp', '.jsp', '.sql', '.bak', '.backup']
-    for ext in dangerous_extensions:
-        if path_lower.endswith(ext):
-            score += 25
-            break
-    
-    # User agent analysis
-    user_agent = request.headers.get("User-Agent", "").lower()
-    suspicious_agents = ['sqlmap', 'nmap', 'nessus', 'nikto', 'burp', 'w3af', 'curl', 'wget']
-    for agent in suspicious_agents:
-        if agent in user_agent:
-            score += 40
-            break
-    
-    # Request method
-    if request.method == "POST" and is_fake:
-        score += 15
-    
-    # Ensure score is between 0-100
-    return min(100, max(0, score))
-
-def detect_activity_type(path: str, request: Request, is_fake: bool) -> str:
-    """Detect activity type based on request"""
-    path_lower = path.lower()
-    
-    if not is_fake:
-        return "legitimate_access"
-    
-    # Admin panel attempts
-    if any(admin_path in path_lower for admin_path in ['/admin', '/administrator', '/cpanel']):
-        return "admin_probe"
-    
-    # Database attempts
-    if any(db_path in path_lower for db_path in ['/phpmyadmin', '/pma', '/mysql', '/database']):
-        return "database_probe"
-    
-    # WordPress attempts
-    if any(wp_path in path_lower for wp_path in ['/wp-admin', '/wp-login', '/wp-content']):
-        return "wordpress_probe"
-    
-    # File access attempts
-    if any(file_path in path_lower for file_path in ['/.env', '/config.php', '/.htaccess', '/.git']):
-        return "file_access_probe"
-    
-    # API attempts
-    if '/api/' in path_lower:
-        return "api_probe"
-    
-    # Generic fake path
-    return "fake_probe"
+        print(f"[ERROR] Failed to queue log for Central Monitor: {e}")
 
 # ========================================================================
 # Middleware: Log All Requests
@@ -236,32 +214,7 @@ async def log_middleware(request: Request, call_next):
 async def fake_admin_panel(request: Request):
     """Fake admin login page"""
     await log_to_central_monitor(request, "/admin", 200, is_fake=True)
-    
-    return HTMLResponse("""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Admin Panel - Login</title>
-    <style>
-        body { font-family: Arial; background: #f0f0f0; padding: 50px; }
-        .login-box { max-width: 400px; margin: 0 auto; background: white; padding: 30px; border: 1px solid #ccc; }
-        input { width: 100%; padding: 10px; margin: 10px 0; }
-        button { width: 100%; padding: 10px; background: #007bff; color: white; border: none; cursor: pointer; }
-    </style>
-</head>
-<body>
-    <div class="login-box">
-        <h2>Admin Panel</h2>
-        <form method="post">
-            <input type="text" name="username" placeholder="Username" required>
-            <input type="password" name="password" placeholder="Password" required>
-            <button type="submit">Login</button>
-        </form>
-        <p style="color: #666; font-size: 12px;">Version 2.4.1 | &copy; 2024</p>
-    </div>
-</body>
-</html>
-    """)
+    return fake_pages.respond("admin", request, get_client_ip(request))
 
 @app.get("/phpmyadmin")
 @app.get("/phpMyAdmin")
@@ -269,36 +222,7 @@ async def fake_admin_panel(request: Request):
 async def fake_phpmyadmin(request: Request):
     """Fake phpMyAdmin"""
     await log_to_central_monitor(request, "/phpmyadmin", 200, is_fake=True)
-    
-    return HTMLResponse("""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>phpMyAdmin</title>
-    <style>
-        body { font-family: Arial; margin: 0; }
-        .header { background: #465457; color: white; padding: 10px; }
-        .content { padding: 20px; }
-        input { padding: 5px; margin: 5px 0; }
-        button { padding: 5px 15px; background: #0099cc; color: white; border: none; }
-    </style>
-</head>
-<body>
-    <div class="header">
-        <h1>phpMyAdmin 4.9.5</h1>
-    </div>
-    <div class="content">
-        <h3>Database server</h3>
-        <form>
-            <input type="text" name="pma_username" placeholder="Username" /><br>
-            <input type="password" name="pma_password" placeholder="Password" /><br>
-            <button type="submit">Go</button>
-        </form>
-        <p style="color: #666; font-size: 11px;">MySQL 5.7.34 - localhost via TCP/IP</p>
-    </div>
-</body>
-</html>
-    """)
+    return fake_pages.respond("phpmyadmin", request, get_client_ip(request))
 
 @app.get("/wp-admin")
 @app.get("/wp-admin/")
@@ -306,70 +230,20 @@ async def fake_phpmyadmin(request: Request):
 async def fake_wordpress(request: Request):
     """Fake WordPress admin"""
     await log_to_central_monitor(request, "/wp-admin", 200, is_fake=True)
-    
-    return HTMLResponse("""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Log In ‹ My Site — WordPress</title>
-    <style>
-        body { background: #f1f1f1; font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto; }
-        #loginform { background: white; padding: 26px 24px; margin: 100px auto; max-width: 320px; box-shadow: 0 1px 3px rgba(0,0,0,.13); }
-        input { width: 100%; padding: 8px; margin: 5px 0; border: 1px solid #ddd; }
-        .button { background: #2271b1; color: white; border: none; padding: 10px; cursor: pointer; width: 100%; }
-    </style>
-</head>
-<body>
-    <form id="loginform">
-        <h1 style="text-align: center;">My Site</h1>
-        <p><label>Username or Email Address<br><input type="text" name="log" /></label></p>
-        <p><label>Password<br><input type="password" name="pwd" /></label></p>
-        <p><button type="submit" class="button">Log In</button></p>
-        <p style="font-size: 13px;"><a href="#">Lost your password?</a></p>
-    </form>
-</body>
-</html>
-    """)
+    return fake_pages.respond("wordpress", request, get_client_ip(request))
 
 @app.get("/.env")
 async def fake_env_file(request: Request):
     """Fake .env file"""
     await log_to_central_monitor(request, "/.env", 200, is_fake=True)
-    
-    return PlainTextResponse("""
-APP_NAME=ProductionApp
-APP_ENV=production
-APP_KEY=base64:fake_key_here_12345678901234567890
-APP_DEBUG=false
-APP_URL=http://localhost
-
-DB_CONNECTION=mysql
-DB_HOST=127.0.0.1
-DB_PORT=3306
-DB_DATABASE=production_db
-DB_USERNAME=root
-DB_PASSWORD=fake_password_123
-
-CACHE_DRIVER=redis
-QUEUE_CONNECTION=redis
-SESSION_DRIVER=redis
-""")
+    return fake_pages.respond("env", request, get_client_ip(request))
 
 @app.get("/config.php")
 @app.get("/configuration.php")
 async def fake_config(request: Request):
     """Fake config file"""
     await log_to_central_monitor(request, "/config.php", 200, is_fake=True)
-    
-    return PlainTextResponse("""
-<?php
-define('DB_HOST', 'localhost');
-define('DB_USER', 'admin');
-define('DB_PASS', 'fake_pass_123');
-define('DB_NAME', 'production');
-define('SECRET_KEY', 'fake_secret_key_12345');
-?>
-""")
+    return fake_pages.respond("config_php", request, get_client_ip(request))
 
 @app.get("/administrator")
 @app.get("/cpanel")
@@ -390,7 +264,7 @@ define('SECRET_KEY', 'fake_secret_key_12345');
 async def fake_generic_paths(request: Request):
     """Generic fake paths - lure various attack vectors"""
     await log_to_central_monitor(request, request.url.path, 404, is_fake=True)
-    return HTMLResponse("<h1>404 Not Found</h1><p>The requested resource was not found on this server.</p>", status_code=404)
+    return fake_pages.respond("not_found", request, get_client_ip(request))
 
 @app.get("/login.php")
 @app.get("/admin.php")
@@ -399,25 +273,7 @@ async def fake_generic_paths(request: Request):
 async def fake_php_files(request: Request):
     """Fake PHP files"""
     await log_to_central_monitor(request, request.url.path, 200, is_fake=True)
-    return HTMLResponse("""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>PHP Error</title>
-    <style>
-        body { font-family: Arial; background: #f0f0f0; padding: 50px; }
-        .error { background: white; padding: 20px; border: 1px solid #ccc; }
-    </style>
-</head>
-<body>
-    <div class="error">
-        <h2>PHP Fatal Error</h2>
-        <p>Call to undefined function mysql_connect() in /var/www/html/index.php on line 15</p>
-        <p>Please check your database configuration.</p>
-    </div>
-</body>
-</html>
-    """)
+    return fake_pages.respond("php_error", request, get_client_ip(request))
 
 @app.get("/api/")
 @app.get("/api/v1/")
@@ -425,16 +281,7 @@ async def fake_php_files(request: Request):
 async def fake_api_root(request: Request):
     """Fake API root endpoints"""
     await log_to_central_monitor(request, request.url.path, 200, is_fake=True)
-    return JSONResponse({
-        "version": "1.0.0",
-        "status": "active",
-        "endpoints": [
-            "/api/v1/auth/login",
-            "/api/v1/users",
-            "/api/v1/config",
-            "/api/v1/database"
-        ]
-    })
+    return fake_pages.respond("api_root", request, get_client_ip(request))
 
 # ========================================================================
 # ROOT PATH (Fake landing page)
@@ -444,37 +291,7 @@ async def fake_api_root(request: Request):
 async def fake_homepage(request: Request):
     """Fake homepage - lure attackers"""
     await log_to_central_monitor(request, "/", 200, is_fake=True)
-    
-    return HTMLResponse("""
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Welcome to Our Server</title>
-    <style>
-        body { font-family: Arial; background: #f0f0f0; padding: 50px; text-align: center; }
-        .container { max-width: 600px; margin: 0 auto; background: white; padding: 30px; border: 1px solid #ccc; }
-        h1 { color: #333; }
-        p { color: #666; line-height: 1.6; }
-        .links { margin: 20px 0; }
-        .links a { display: inline-block; margin: 10px; padding: 10px 20px; background: #007bff; color: white; text-decoration: none; border-radius: 5px; }
-        .links a:hover { background: #0056b3; }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>Welcome to Our Server</h1>
-        <p>This is a production server running various services.</p>
-        <p>Please use the links below to access different areas:</p>
-        <div class="links">
-            <a href="/admin">Admin Panel</a>
-            <a href="/phpmyadmin">Database</a>
-            <a href="/wp-admin">WordPress</a>
-        </div>
-        <p style="font-size: 12px; color: #999;">Server v2.4.1 | Last updated: 2024-10-23</p>
-    </div>
-</body>
-</html>
-    """)
+    return fake_pages.respond("homepage", request, get_client_ip(request))
 
 # ========================================================================
 # FAKE API ENDPOINTS (Lure attackers)
@@ -485,55 +302,27 @@ async def fake_homepage(request: Request):
 async def fake_api_login(request: Request):
     """Fake API login endpoint"""
     await log_to_central_monitor(request, "/api/v1/auth/login", 200, is_fake=True)
-    
-    return JSONResponse({
-        "success": True,
-        "message": "Login successful",
-        "token": "fake_jwt_token_12345",
-        "user": {
-            "id": 1,
-            "email": "admin@example.com",
-            "role": "admin"
-        }
-    })
+    return fake_pages.respond("api_login", request, get_client_ip(request))
 
 @app.get("/api/v1/users")
 async def fake_api_users(request: Request):
     """Fake API users endpoint"""
     await log_to_central_monitor(request, "/api/v1/users", 200, is_fake=True)
-    
-    return JSONResponse({
-        "users": [
-            {"id": 1, "email": "admin@example.com", "role": "admin"},
-            {"id": 2, "email": "user@example.com", "role": "user"}
-        ]
-    })
+    return fake_pages.respond("api_users", request, get_client_ip(request))
 
 @app.get("/api/v1/config")
 async def fake_api_config(request: Request):
     """Fake API config endpoint"""
     await log_to_central_monitor(request, "/api/v1/config", 200, is_fake=True)
-    
-    return JSONResponse({
-        "database": {
-            "host": "localhost",
-            "port": 3306,
-            "username": "root",
-            "password": "admin123"
-        },
-        "redis": {
-            "host": "localhost",
-            "port": 6379,
-            "password": "redis123"
-        }
-    })
+    return fake_pages.respond("api_config", request, get_client_ip(request))
 
 # ========================================================================
 # Health Check
 # ========================================================================
 @app.get("/health")
 async def health():
-    return {"status": "ok", "server": "honeypot", "version": "3.0.0"}
+    return {"status": "ok", "server": "honeypot", "version": "3.0.0", "logs": log_shipper.get_stats(),
+            "pages": fake_pages.get_stats()}
 
 # ========================================================================
 # Main
@@ -0,0 +1,333 @@
+"""
+Honeypot Log Shipper
+Batched, non-blocking delivery of honeypot logs to the Central Monitor
+
+Request handlers only append a record to an in-memory buffer; a
+background task posts the buffer as a JSON array every
+LOG_BATCH_INTERVAL_MS or as soon as LOG_BATCH_SIZE records are waiting,
+over one pooled keep-alive client (no TCP/TLS handshake per log line).
+
+The buffer is bounded (LOG_BUFFER_SIZE). Records that don't fit, and
+batches the monitor couldn't take (network error / 5xx), go to a JSON
+lines spill file (one per worker process, capped at LOG_SPILL_MAX_MB);
+only beyond that cap are records dropped. Spill files are replayed a
+batch at a time once deliveries succeed again, including files left by
+a worker that has exited.
+
+If the monitor has no batch endpoint yet (404 / 405), records are sent
+one by one to the single-record endpoint over the same client.
+"""
+
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import time
+import os
+
+import httpx
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class LogShipper:
+    """Bounded batch queue + flush task in front of the Central Monitor log API"""
+
+    def __init__(
+        self,
+        batch_url: str,
+        single_url: str,
+        api_key: str,
+        flush_interval_ms: int = 500,
+        flush_records: int = 100,
+        max_buffer: int = 10000,
+        spill_dir: Optional[str] = None,
+        spill_max_bytes: int = 100 * 1024 * 1024,
+        timeout: float = 5.0
+    ):
+        self.batch_url = batch_url
+        self.single_url = single_url
+        self.headers = {"X-API-Key": api_key}
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_records = flush_records
+        self.max_buffer = max_buffer
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.spill_max_bytes = spill_max_bytes
+        self.timeout = timeout
+
+        self.buffer: deque = deque()
+        self.client: Optional[httpx.AsyncClient] = None
+        self.task: Optional[asyncio.Task] = None
+        self.wakeup: Optional[asyncio.Event] = None
+        self.batch_supported = True
+
+        # Spill file of this process (append) and the file being replayed (path, offset)
+        self.spill_path = self.spill_dir / f"spill-{os.getpid()}.jsonl" if self.spill_dir else None
+        self.spill_file = None
+        self.spill_bytes = 0
+        self.replay_path: Optional[Path] = None
+        self.replay_offset = 0
+
+        self.stats = {
+            'submitted': 0,
+            'sent': 0,
+            'batches': 0,
+            'failed_batches': 0,
+            'rejected': 0,    # Refused by the monitor (4xx), not retried
+            'spilled': 0,
+            'replayed': 0,
+            'dropped': 0,     # Buffer and spill file both full
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+    # Lifecycle (called from the app lifespan)
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            verify=False,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2, keepalive_expiry=60)
+        )
+        self.wakeup = asyncio.Event()
+        if self.spill_dir:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush what is buffered (spilling it if the monitor is down) and close the client"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        while self.buffer:
+            if not await self._flush():
+                self._spill(list(self.buffer))
+                self.buffer.clear()
+        if self.client is not None:
+            await self.client.aclose()
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
+
+    # Hot path
+
+    def submit(self, record: Dict[str, Any]) -> bool:
+        """
+        Queue one log record (never waits on the network)
+
+        Returns:
+            bool: False if the record had to be dropped
+        """
+        self.stats['submitted'] += 1
+        if len(self.buffer) >= self.max_buffer:
+            return self._spill([record])
+        self.buffer.append(record)
+        if len(self.buffer) >= self.flush_records and self.wakeup is not None:
+            self.wakeup.set()
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['buffered'] = len(self.buffer)
+        stats['spill_bytes'] = self.spill_bytes
+        stats['avg_flush_ms'] = stats['total_flush_ms'] / stats['batches'] if stats['batches'] else 0.0
+        stats['batch_endpoint'] = self.batch_supported
+        return stats
+
+    # Flush task
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+            try:
+                delivered = True
+                while self.buffer and delivered:
+                    delivered = await self._flush()
+                # Backlog from the spill files, yielding to fresh records
+                while delivered and self.spill_dir and len(self.buffer) < self.flush_records:
+                    delivered = await self._replay()
+            except (OSError, ValueError) as e:
+                print(f"[LOGS] Flush error: {e}")
+
+    async def _flush(self) -> bool:
+        """Send up to flush_records buffered records; False if the monitor is unreachable"""
+        batch = [self.buffer.popleft() for _ in range(min(self.flush_records, len(self.buffer)))]
+        done = await self._send(batch)
+        if done == len(batch):
+            return True
+        self._spill(batch[done:])
+        return False
+
+    async def _send(self, records: List[Dict[str, Any]]) -> int:
+        """
+        POST records; returns how many of them, from the start, are delivered
+        or permanently refused (4xx: resending would fail again). The rest
+        are kept for a later retry.
+        """
+        started = time.perf_counter()
+        try:
+            if self.batch_supported:
+                response = await self.client.post(self.batch_url, json=records, headers=self.headers)
+                if response.status_code in (404, 405):
+                    print("[LOGS] Central Monitor has no batch endpoint, sending records one by one")
+                    self.batch_supported = False
+            if not self.batch_supported:
+                return await self._send_each(records, started)
+        except httpx.HTTPError as e:
+            self.stats['failed_batches'] += 1
+            print(f"[LOGS] Central Monitor unreachable ({len(records)} records kept): {e}")
+            return 0
+
+        if response.status_code >= 500:
+            self.stats['failed_batches'] += 1
+            print(f"[LOGS] Central Monitor returned {response.status_code} ({len(records)} records kept)")
+            return 0
+
+        self._record_flush(started)
+        if response.status_code >= 400:
+            self.stats['rejected'] += len(records)
+            print(f"[LOGS] Central Monitor rejected {len(records)} records: {response.status_code}")
+            return len(records)
+
+        # The batch endpoint reports records that failed validation individually
+        invalid = 0
+        try:
+            invalid = int(response.json().get('invalid', 0))
+        except (ValueError, AttributeError):
+            pass
+        if invalid:
+            print(f"[LOGS] Central Monitor rejected {invalid} of {len(records)} records")
+        self.stats['rejected'] += invalid
+        self.stats['sent'] += len(records) - invalid
+        return len(records)
+
+    async def _send_each(self, records: List[Dict[str, Any]], started: float) -> int:
+        """Single-record fallback; stops at the first failure so delivered records are not resent"""
+        for done, record in enumerate(records):
+            try:
+                response = await self.client.post(self.single_url, json=record, headers=self.headers)
+            except httpx.HTTPError as e:
+                error = f"unreachable: {e}"
+            else:
+                if response.status_code < 500:
+                    self.stats['rejected' if response.status_code >= 400 else 'sent'] += 1
+                    continue
+                error = f"returned {response.status_code}"
+            self.stats['failed_batches'] += 1
+            print(f"[LOGS] Central Monitor {error} ({len(records) - done} of {len(records)} records kept)")
+            if done:
+                self._record_flush(started)
+            return done
+
+        self._record_flush(started)
+        return len(records)
+
+    def _record_flush(self, started: float):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.stats['batches'] += 1
+        self.stats['last_flush_ms'] = elapsed_ms
+        self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], elapsed_ms)
+        self.stats['total_flush_ms'] += elapsed_ms
+
+    # Spill file
+
+    def _spill(self, records: List[Dict[str, Any]]) -> bool:
+        """Append records to this process's spill file; False (dropped) without one or when it is full"""
+        if self.spill_path is None or self.spill_bytes >= self.spill_max_bytes:
+            self.stats['dropped'] += len(records)
+            return False
+        try:
+            if self.spill_file is None:
+                self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+                self.spill_file = open(self.spill_path, 'a', encoding='utf-8')
+            data = ''.join(json.dumps(record, default=str) + '\n' for record in records)
+            self.spill_file.write(data)
+            self.spill_file.flush()
+        except OSError as e:
+            self.stats['dropped'] += len(records)
+            print(f"[LOGS] Spill to {self.spill_path} failed, {len(records)} records dropped: {e}")
+            return False
+        self.spill_bytes += len(data)
+        self.stats['spilled'] += len(records)
+        return True
+
+    def _claim_spill(self) -> Optional[Path]:
+        """
+        Next file to replay: this process's spill file, or one left by an
+        exited worker; renamed first so nothing else appends to or claims it
+        """
+        for path in sorted(self.spill_dir.glob('*.jsonl')):
+            kind, _, pid = path.stem.partition('-')
+            pid = pid.split('-')[0]
+            if not pid.isdigit():
+                continue
+            own = int(pid) == os.getpid()
+            if kind == 'spill' and own:
+                if self.spill_file is not None:
+                    self.spill_file.close()
+                    self.spill_file = None
+                self.spill_bytes = 0
+            elif own or _pid_alive(int(pid)):
+                continue
+            claimed = self.spill_dir / f"replay-{os.getpid()}-{time.time_ns()}.jsonl"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue  # Another worker got it first
+            return claimed
+        return None
+
+    async def _replay(self) -> bool:
+        """Resend one batch from the spill files; False when there is nothing left or the send failed"""
+        if self.replay_path is None:
+            self.replay_path = self._claim_spill()
+            self.replay_offset = 0
+            if self.replay_path is None:
+                return False
+
+        records = []
+        offsets = []  # File offset just past each record
+        with open(self.replay_path, 'r', encoding='utf-8') as f:
+            f.seek(self.replay_offset)
+            while len(records) < self.flush_records:
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    records.append(json.loads(line))
+                    offsets.append(f.tell())
+                except ValueError:
+                    pass  # Torn last line of a crashed writer
+            offset = f.tell()
+
+        if records:
+            done = await self._send(records)
+            self.stats['replayed'] += done
+            if done < len(records):
+                # Resume after the records that did get through
+                if done:
+                    self.replay_offset = offsets[done - 1]
+                return False
+        self.replay_offset = offset
+        if len(records) < self.flush_records:
+            os.unlink(self.replay_path)
+            self.replay_path = None
+        return True
@@ -30,6 +30,8 @@ except ImportError:
     ELASTICSEARCH_AVAILABLE = False
     print("[WARNING] Elasticsearch service not available")
 
+from services.request_classifier import request_classifier
+
 class PandoraHTTPSHandler(SimpleHTTPRequestHandler):
     """Custom HTTPS handler for serving Vue.js app"""
     
@@ -108,18 +110,10 @@ class PandoraHTTPSHandler(SimpleHTTPRequestHandler):
                 if auth_header.startswith('Bearer '):
                     is_authenticated = True
 
-            # Determine activity type
-            activity_type = 'page_view' if method == 'GET' and not path.startswith('/api/') else 'api_call'
-
-            if '/api/v1/scan' in path:
-                activity_type = 'scan'
-            elif '/api/v1/auth/login' in path:
-                activity_type = 'login_attempt'
-            elif '/api/v1/auth/register' in path:
-                activity_type = 'registration'
-
-            # Calculate suspicious score
-            suspicious_score, suspicious_reasons = self.calculate_suspicious_score(path, headers, body)
+            # Suspicious score and activity type
+            suspicious_score, suspicious_reasons, activity_type = request_classifier.classify(
+                path, headers.get('User-Agent', ''), body, method
+            )
 
             # Prepare log data with user tracking
             log_data = {
@@ -182,42 +176,6 @@ class PandoraHTTPSHandler(SimpleHTTPRequestHandler):
             # Fail silently to not break webserver
             print(f"[HONEYPOT ERROR] Failed to log activity: {e}")
 
-    def calculate_suspicious_score(self, path, headers, body):
-        """Calculate suspicious score based on request patterns"""
-        score = 0
-        reasons = []
-
-        # SQL injection patterns
-        sql_patterns = ["'", '"', ';', 'union', 'select', 'drop', 'insert', 'update', 'delete']
-        path_lower = path.lower()
-
-        for pattern in sql_patterns:
-            if pattern in path_lower:
-                score += 20
-                reasons.append(f"Potential SQL injection: {pattern}")
-                break
-
-        # Path traversal attempts
-        if '../' in path_lower or '..\\' in path_lower:
-            score += 30
-            reasons.append("Path traversal attempt")
-
-        # Scanner activity
-        if '/api/v1/scanner/' in path_lower:
-            score += 15
-            reasons.append("Scanner activity detected")
-
-        # Unusual user agents
-        user_agent = headers.get('User-Agent', '').lower()
-        suspicious_uas = ['sqlmap', 'nmap', 'nessus', 'openvas', 'nikto', 'w3af', 'burp']
-        for ua in suspicious_uas:
-            if ua in user_agent:
-                score += 25
-                reasons.append(f"Suspicious user agent: {ua}")
-                break
-
-        return min(100, score), reasons
-
     def do_GET(self):
         """Handle GET requests"""
         parsed_path = urlparse(self.path)
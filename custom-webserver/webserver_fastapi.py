@@ -41,6 +41,8 @@ except ImportError:
     ELASTICSEARCH_AVAILABLE = False
     print("[WARNING] Elasticsearch service not available")
 
+from services.request_classifier import request_classifier
+
 # ========================================================================
 # Configuration
 # ========================================================================
@@ -137,59 +139,6 @@ def extract_user_from_token(request: Request) -> Optional[Dict[str, Any]]:
     except:
         return None
 
-def calculate_suspicious_score(request: Request, path: str, body: Optional[str] = None) -> tuple[int, list[str]]:
-    """Tính điểm nghi ngờ"""
-    score = 0
-    reasons = []
-    path_lower = path.lower()
-    
-    # SQL Injection
-    sql_patterns = ["'", '"', ";", "union", "select", "drop", "insert", "update", "delete", "--"]
-    for pattern in sql_patterns:
-        if pattern in path_lower:
-            score += 20
-            reasons.append(f"SQL injection: {pattern}")
-            break
-    
-    # Path Traversal
-    if "../" in path_lower or "..\\" in path_lower:
-        score += 30
-        reasons.append("Path traversal")
-    
-    # XSS
-    xss_patterns = ["<script", "javascript:", "onerror=", "onload="]
-    for pattern in xss_patterns:
-        if pattern in path_lower:
-            score += 25
-            reasons.append(f"XSS: {pattern}")
-            break
-    
-    # Suspicious User Agent
-    user_agent = request.headers.get("User-Agent", "").lower()
-    suspicious_uas = ["sqlmap", "nmap", "nessus", "openvas", "nikto", "w3af", "burp", "metasploit"]
-    for ua in suspicious_uas:
-        if ua in user_agent:
-            score += 30
-            reasons.append(f"Suspicious UA: {ua}")
-            break
-    
-    # Exploit paths
-    exploit_paths = ["/admin", "/phpmyadmin", "/.env", "/config", "/wp-admin", "/.git", "/api/"]
-    for exp_path in exploit_paths:
-        if exp_path in path_lower:
-            score += 15
-            reasons.append(f"Exploit path: {exp_path}")
-            break
-    
-    # Body analysis
-    if body:
-        body_lower = body.lower()
-        if any(p in body_lower for p in sql_patterns + xss_patterns):
-            score += 20
-            reasons.append("Suspicious payload")
-    
-    return min(100, score), reasons
-
 async def log_honeypot_activity(
     request: Request,
     method: str,
@@ -205,13 +154,9 @@ async def log_honeypot_activity(
         user_id = user_info.get("user_id") if user_info else None
         is_authenticated = user_info.get("is_authenticated", False) if user_info else False
         
-        activity_type = "page_view"
-        if method != "GET":
-            activity_type = "api_call"
-        if "/api/" in path:
-            activity_type = "api_probe"
-        
-        suspicious_score, suspicious_reasons = calculate_suspicious_score(request, path, body)
+        suspicious_score, suspicious_reasons, activity_type = request_classifier.classify(
+            path, request.headers.get("User-Agent", ""), body, method
+        )
         client_ip = get_client_ip(request)
         
         log_data = {
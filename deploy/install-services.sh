@@ -47,6 +47,8 @@ cp systemd/pandora-webserver.service "$SYSTEMD_DIR/"
 cp systemd/pandora-nginx.service "$SYSTEMD_DIR/"
 cp systemd/pandora-backend-user.service "$SYSTEMD_DIR/"
 cp systemd/pandora-backend-admin.service "$SYSTEMD_DIR/"
+cp systemd/pandora-correlator.service "$SYSTEMD_DIR/"
+cp systemd/pandora-whois.service "$SYSTEMD_DIR/"
 cp systemd/pandora-ids.service "$SYSTEMD_DIR/"
 cp systemd/pandora-central-monitor.service "$SYSTEMD_DIR/"
 
@@ -66,6 +68,8 @@ systemctl enable pandora-nginx.service
 systemctl enable pandora-webserver.service
 systemctl enable pandora-backend-user.service
 systemctl enable pandora-backend-admin.service
+systemctl enable pandora-correlator.service
+systemctl enable pandora-whois.service
 systemctl enable pandora-ids.service
 systemctl enable pandora-central-monitor.service
 
@@ -28,6 +28,8 @@ sleep 2
 
 echo -e "${GREEN}[2/6] Starting Admin Backend API...${NC}"
 systemctl start pandora-backend-admin
+systemctl start pandora-correlator
+systemctl start pandora-whois
 sleep 2
 
 echo -e "${GREEN}[3/6] Starting FastAPI Webserver...${NC}"
@@ -34,6 +34,8 @@ echo -e "${GREEN}[4/6] Stopping FastAPI Webserver...${NC}"
 systemctl stop pandora-webserver || true
 
 echo -e "${GREEN}[5/6] Stopping Admin Backend API...${NC}"
+systemctl stop pandora-correlator || true
+systemctl stop pandora-whois || true
 systemctl stop pandora-backend-admin || true
 
 echo -e "${GREEN}[6/6] Stopping User Backend API...${NC}"
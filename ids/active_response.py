@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Active Response
+Kernel-side blocking of high-confidence attackers (nftables set or ipset)
+
+log_attack() offers every detection; those at or above the configured
+severity and confidence queue the attacker's address. A worker thread
+collects addresses for IDS_ACTIVE_RESPONSE_BATCH_MS and applies them in
+one transaction (`nft -f -` or `ipset restore`), never one exec per IP.
+Set elements carry a timeout, so the kernel lifts a block on its own;
+`blocked` mirrors the set with the same deadlines (insertion order is
+deadline order, expiry pops from the front) so an address is only
+submitted again once its block ran out.
+
+AF_PACKET taps see frames before netfilter, so a blocked source still
+reaches the sniffer: the engine skips it right after the direction
+filter, and the host no longer answers it (no SYN-ACK / RST, no flow
+state). Addresses applied since the last flush are picked up by
+AttackLogWriter through drain_applied() and marked AttackLog.blocked.
+
+Needs CAP_NET_ADMIN. Rules live in their own table / set, so the whole
+thing can be tried in a network namespace:
+
+    ip netns add ids-test
+    ip netns exec ids-test python active_response.py setup
+    ip netns exec ids-test python active_response.py block 198.51.100.7 --ttl 60
+    ip netns exec ids-test python active_response.py list
+    ip netns exec ids-test python active_response.py teardown
+"""
+
+import subprocess
+import threading
+import argparse
+import queue
+import time
+import sys
+import os
+
+# Add backend-admin to path when run as a script
+backend_admin_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend-admin'))
+if backend_admin_dir not in sys.path:
+    sys.path.insert(0, backend_admin_dir)
+
+from config import settings
+from capture import ip_to_addr, addr_to_ip
+from prefix_table import PrefixTable, PRIVATE_TABLE
+
+RESPONSE_BACKENDS = ('nftables', 'ipset')
+
+SEVERITY_ORDER = {'low': 0, 'medium': 1, 'high': 2, 'critical': 3}
+
+# Detections that don't pin down one attacker (the packet's source is one of many)
+_AGGREGATE_TYPES = frozenset(('distributed_syn_flood',))
+
+_STOP = object()
+
+
+def _run(command, script=None, timeout=10):
+    """Run one command (script on stdin); raise RuntimeError with its stderr on failure"""
+    result = subprocess.run(command, input=script, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(command)}: {(result.stderr or result.stdout).strip()}")
+    return result.stdout
+
+
+class NftablesBackend:
+    """inet table with a timeout set, dropped in prerouting before conntrack"""
+
+    name = 'nftables'
+
+    def __init__(self, table='pandora_ids', runner=_run):
+        self.table = table
+        self.run = runner
+
+    def setup(self):
+        self.run(['nft', '-f', '-'], '\n'.join((
+            f"add table inet {self.table}",
+            f"add set inet {self.table} blocklist {{ type ipv4_addr; flags timeout; }}",
+            f"add chain inet {self.table} prerouting {{ type filter hook prerouting priority -300; policy accept; }}",
+            f"flush chain inet {self.table} prerouting",
+            f"add rule inet {self.table} prerouting ip saddr @blocklist drop"
+        )) + '\n')
+
+    def block(self, ips, ttl):
+        elements = ', '.join(f"{ip} timeout {ttl}s" for ip in ips)
+        self.run(['nft', '-f', '-'], f"add element inet {self.table} blocklist {{ {elements} }}\n")
+
+    def list(self):
+        return self.run(['nft', 'list', 'set', 'inet', self.table, 'blocklist'])
+
+    def teardown(self):
+        self.run(['nft', 'delete', 'table', 'inet', self.table])
+
+
+class IpsetBackend:
+    """hash:ip set with per-entry timeout, dropped in the iptables raw table"""
+
+    name = 'ipset'
+
+    def __init__(self, table='pandora_ids', runner=_run):
+        self.table = table
+        self.run = runner
+        self.rule = ['PREROUTING', '-m', 'set', '--match-set', table, 'src', '-j', 'DROP']
+
+    def setup(self):
+        self.run(['ipset', 'restore', '-exist'], f"create {self.table} hash:ip family inet timeout 0\n")
+        try:
+            self.run(['iptables', '-t', 'raw', '-C'] + self.rule)
+        except RuntimeError:
+            self.run(['iptables', '-t', 'raw', '-I'] + self.rule)
+
+    def block(self, ips, ttl):
+        # -exist: re-adding refreshes the timeout instead of failing the batch
+        self.run(['ipset', 'restore', '-exist'], ''.join(f"add {self.table} {ip} timeout {ttl}\n" for ip in ips))
+
+    def list(self):
+        return self.run(['ipset', 'list', self.table])
+
+    def teardown(self):
+        self.run(['iptables', '-t', 'raw', '-D'] + self.rule)
+        self.run(['ipset', 'destroy', self.table])
+
+
+def create_backend(name, table='pandora_ids'):
+    if name == 'nftables':
+        return NftablesBackend(table)
+    if name == 'ipset':
+        return IpsetBackend(table)
+    raise ValueError(f"Unknown active response backend: {name} (choose from {', '.join(RESPONSE_BACKENDS)})")
+
+
+class ActiveResponder:
+    """Batches high-confidence attackers into the kernel block set"""
+
+    def __init__(
+        self,
+        backend=None,
+        min_severity=settings.IDS_ACTIVE_RESPONSE_MIN_SEVERITY,
+        min_confidence=settings.IDS_ACTIVE_RESPONSE_MIN_CONFIDENCE,
+        block_seconds=settings.IDS_ACTIVE_RESPONSE_BLOCK_SECONDS,
+        batch_ms=settings.IDS_ACTIVE_RESPONSE_BATCH_MS,
+        max_pending=settings.IDS_ACTIVE_RESPONSE_MAX_PENDING,
+        block_private=settings.IDS_ACTIVE_RESPONSE_BLOCK_PRIVATE,
+        exempt=settings.ids_allowlist + settings.ids_local_networks_list
+    ):
+        if min_severity not in SEVERITY_ORDER:
+            raise ValueError(f"Unknown severity: {min_severity} (choose from {', '.join(SEVERITY_ORDER)})")
+
+        self.backend = backend or create_backend(settings.IDS_ACTIVE_RESPONSE_BACKEND,
+                                                 settings.IDS_ACTIVE_RESPONSE_TABLE)
+        self.min_severity = SEVERITY_ORDER[min_severity]
+        self.min_confidence = min_confidence
+        self.block_seconds = block_seconds
+        self.batch_interval = batch_ms / 1000.0
+        self.block_private = block_private
+        self.exempt = PrefixTable.from_cidrs(exempt)
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.running = False
+
+        # addr -> monotonic expiry, in the order blocks were applied
+        self.blocked = {}
+        self.pending = set()
+        self.applied = []
+        self.lock = threading.Lock()
+
+        self.stats = {
+            'queued': 0,
+            'dropped': 0,
+            'blocks': 0,
+            'batches': 0,
+            'errors': 0,
+            'last_error': None,
+            'last_batch_ms': 0.0
+        }
+
+        self.worker = threading.Thread(target=self._run, name='ids-active-response', daemon=True)
+
+    def start(self):
+        """Create the table / set; on failure the IDS keeps running without blocking"""
+        try:
+            self.backend.setup()
+        except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+            print(f"[RESPONSE] {self.backend.name} setup failed, active response disabled: {e}")
+            return False
+        self.running = True
+        self.worker.start()
+        return True
+
+    def stop(self, timeout=5):
+        """Apply whatever is still queued and stop the worker (blocks stay until their timeout)"""
+        if not self.running:
+            return
+        self.running = False
+        self.queue.put(_STOP)
+        self.worker.join(timeout)
+
+    def offer(self, addr, attack_info):
+        """
+        Queue addr for blocking if the detection warrants it (never blocks the caller)
+
+        Returns:
+            bool: True if addr is blocked or queued
+        """
+        if not self.running:
+            return False
+        if (SEVERITY_ORDER.get(attack_info['severity'], 0) < self.min_severity
+                or attack_info['confidence'] < self.min_confidence
+                or attack_info['type'] in _AGGREGATE_TYPES
+                or addr in self.exempt
+                or (not self.block_private and addr in PRIVATE_TABLE)):
+            return False
+
+        # Pending before it is queued: the worker may apply it (and clear
+        # pending) before put_nowait returns. Capture and collector threads
+        # all call this, hence the lock.
+        with self.lock:
+            if addr in self.blocked or addr in self.pending:
+                return True
+            self.pending.add(addr)
+        try:
+            self.queue.put_nowait(addr)
+        except queue.Full:
+            with self.lock:
+                self.pending.discard(addr)
+            self.stats['dropped'] += 1
+            return False
+        self.stats['queued'] += 1
+        return True
+
+    def is_blocked(self, ip):
+        """Block applied and not yet expired for a dotted address (writer thread)"""
+        expires = self.blocked.get(ip_to_addr(ip))
+        return expires is not None and expires > time.monotonic()
+
+    def drain_applied(self):
+        """Addresses blocked since the last call (AttackLogWriter marks their rows)"""
+        with self.lock:
+            applied, self.applied = self.applied, []
+        return applied
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['backend'] = self.backend.name
+        stats['active'] = self.running
+        stats['blocked'] = len(self.blocked)
+        stats['queue_depth'] = self.queue.qsize()
+        return stats
+
+    def _run(self):
+        """Worker loop: one kernel transaction per batch interval"""
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.batch_interval
+            while True:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._expire(time.monotonic())
+            if batch:
+                self._apply(batch)
+
+    def _apply(self, addrs):
+        addrs = list(dict.fromkeys(addrs))
+        ips = [addr_to_ip(addr) for addr in addrs]
+        started = time.perf_counter()
+        try:
+            self.backend.block(ips, self.block_seconds)
+        except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+            with self.lock:
+                self.pending.difference_update(addrs)
+            self.stats['errors'] += 1
+            self.stats['last_error'] = str(e)
+            print(f"[RESPONSE] Failed to block {len(ips)} addresses: {e}")
+            return
+
+        expires = time.monotonic() + self.block_seconds
+        with self.lock:
+            for addr in addrs:
+                self.blocked.pop(addr, None)
+                self.blocked[addr] = expires
+            self.pending.difference_update(addrs)
+            self.applied.extend(ips)
+
+        self.stats['batches'] += 1
+        self.stats['blocks'] += len(addrs)
+        self.stats['last_batch_ms'] = (time.perf_counter() - started) * 1000
+        print(f"[RESPONSE] Blocked {len(ips)} addresses for {self.block_seconds}s: "
+              f"{', '.join(ips[:5])}{' ...' if len(ips) > 5 else ''}")
+
+    def _expire(self, now):
+        """Forget blocks the kernel has lifted (oldest first)"""
+        blocked = self.blocked
+        with self.lock:
+            while blocked:
+                addr = next(iter(blocked))
+                if blocked[addr] > now:
+                    break
+                del blocked[addr]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pandora IDS active response (manual control / namespace testing)")
+    parser.add_argument('--backend', choices=RESPONSE_BACKENDS, default=settings.IDS_ACTIVE_RESPONSE_BACKEND)
+    parser.add_argument('--table', default=settings.IDS_ACTIVE_RESPONSE_TABLE, help="nftables table / ipset name")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('setup', help="Create the table / set and the drop rule")
+    block = commands.add_parser('block', help="Block addresses in one batch")
+    block.add_argument('ips', nargs='+')
+    block.add_argument('--ttl', type=int, default=settings.IDS_ACTIVE_RESPONSE_BLOCK_SECONDS)
+    commands.add_parser('list', help="Show blocked addresses")
+    commands.add_parser('teardown', help="Remove the table / set and the drop rule")
+    args = parser.parse_args()
+
+    backend = create_backend(args.backend, args.table)
+    try:
+        if args.command == 'setup':
+            backend.setup()
+        elif args.command == 'block':
+            backend.block([addr_to_ip(ip_to_addr(ip)) for ip in args.ips], args.ttl)
+        elif args.command == 'list':
+            print(backend.list(), end='')
+        else:
+            backend.teardown()
+    except (OSError, RuntimeError, subprocess.SubprocessError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Attack Aggregation Cache
+In-process map of open AttackLog rows keyed by (source_ip, attack_type)
+
+Replaces the per-detection "recent attack" SELECT: while a row is inside
+its aggregation window, repeat detections only bump an in-memory packet
+delta that the writer flushes as a bulk UPDATE by primary key.
+"""
+
+import threading
+
+
+class AttackAggregationCache:
+    """TTL-evicted map: (source_ip, attack_type) -> open row id + pending deltas"""
+
+    def __init__(self, ttl_seconds):
+        self.ttl = ttl_seconds
+        # key -> [row_id, expires_at (epoch seconds), pending_count, last_seen]
+        self.entries = {}
+        self.dirty = set()
+        self.retired = []  # Deltas of replaced rows, flushed on next drain
+        self.next_sweep = 0.0
+        self.lock = threading.Lock()
+
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+
+    def add_delta(self, key, detected_at):
+        """
+        Record one more detection against an open row
+
+        Returns:
+            bool: True if the row is cached and still open, False on a miss
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or detected_at.timestamp() >= entry[1]:
+                self.stats['misses'] += 1
+                return False
+            entry[2] += 1
+            self.dirty.add(key)
+            if entry[3] is None or detected_at > entry[3]:
+                entry[3] = detected_at
+            self.stats['hits'] += 1
+            return True
+
+    def get(self, key, now):
+        """Return the open row id for key, or None if missing/expired"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or now.timestamp() >= entry[1]:
+                return None
+            return entry[0]
+
+    def open(self, key, row_id, opened_at):
+        """Register a row whose aggregation window started at opened_at"""
+        with self.lock:
+            old = self.entries.get(key)
+            if old is not None and old[2]:
+                self.retired.append((old[0], old[2], old[3]))
+            self.entries[key] = [row_id, opened_at.timestamp() + self.ttl, 0, None]
+            self.dirty.discard(key)
+
+    def drain(self, now):
+        """
+        Collect pending packet deltas and evict expired rows
+
+        Returns:
+            List of (row_id, delta, last_seen) to apply to the database
+        """
+        cutoff = now.timestamp()
+        with self.lock:
+            updates = self.retired
+            self.retired = []
+            for key in self.dirty:
+                entry = self.entries[key]
+                updates.append((entry[0], entry[2], entry[3]))
+                entry[2] = 0
+            self.dirty.clear()
+
+            # Expired rows have no pending deltas left, so a periodic sweep is enough
+            if cutoff >= self.next_sweep:
+                for key in [k for k, e in self.entries.items() if cutoff >= e[1]]:
+                    del self.entries[key]
+                    self.stats['evictions'] += 1
+                self.next_sweep = cutoff + self.ttl / 10
+        return updates
+
+    def __len__(self):
+        return len(self.entries)
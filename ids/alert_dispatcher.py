@@ -0,0 +1,206 @@
+"""
+Alert Dispatcher
+Bounded, batched email alerting for newly opened attack rows
+
+The writer thread hands over new AttackLog rows; a small worker pool
+collects them for up to IDS_ALERT_DIGEST_SECONDS and sends one mail per
+window (a single alert when only one attacker showed up, a digest
+otherwise) over a persistent SMTP connection per worker. email_sent is
+then set for the whole batch with one UPDATE.
+
+When the queue is full the configured policy applies:
+- drop_oldest: discard the oldest pending alert (default)
+- drop_new:    discard the incoming alert
+- block:       wait up to IDS_ALERT_BLOCK_SECONDS, then drop
+"""
+
+import threading
+import queue
+import time
+
+from sqlalchemy import update
+
+from database.database import SessionLocal
+from models.attack import AttackLog
+from services.email_service import SMTPMailer, format_attack_alert, format_attack_digest
+from config import settings
+
+ALERT_QUEUE_POLICIES = ('drop_oldest', 'drop_new', 'block')
+
+_STOP = object()
+
+# Row fields copied for the mail (the worker never touches ORM objects)
+_ALERT_FIELDS = (
+    'id', 'source_ip', 'source_port', 'target_ip', 'target_port', 'attack_type', 'severity',
+    'packet_count', 'protocol', 'flags', 'payload_sample', 'country', 'city', 'latitude',
+    'longitude', 'detected_tool', 'confidence', 'first_seen', 'last_seen', 'detected_at'
+)
+
+
+class AlertDispatcher:
+    """Worker pool that turns new attack rows into digest emails"""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        mailer_factory=SMTPMailer,
+        workers=settings.IDS_ALERT_WORKERS,
+        max_queue_size=settings.IDS_ALERT_QUEUE_SIZE,
+        digest_seconds=settings.IDS_ALERT_DIGEST_SECONDS,
+        digest_max=settings.IDS_ALERT_DIGEST_MAX,
+        policy=settings.IDS_ALERT_QUEUE_POLICY,
+        block_seconds=settings.IDS_ALERT_BLOCK_SECONDS
+    ):
+        if policy not in ALERT_QUEUE_POLICIES:
+            raise ValueError(f"Unknown alert queue policy: {policy} (choose from {', '.join(ALERT_QUEUE_POLICIES)})")
+
+        self.session_factory = session_factory
+        self.mailer_factory = mailer_factory
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.digest_seconds = digest_seconds
+        self.digest_max = digest_max
+        self.policy = policy
+        self.block_seconds = block_seconds
+        self.enabled = bool(settings.SMTP_USER and settings.SMTP_PASSWORD)
+        self.lock = threading.Lock()
+
+        self.stats = {
+            'queued': 0,
+            'dropped': 0,
+            'mails_sent': 0,
+            'alerts_sent': 0,
+            'send_errors': 0
+        }
+
+        self.workers = [
+            threading.Thread(target=self._run, name=f'ids-alerts-{i}', daemon=True)
+            for i in range(max(1, workers))
+        ]
+
+    def start(self):
+        if not self.enabled:
+            print("[WARNING] SMTP not configured, email alerts disabled")
+            return
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self, timeout=10):
+        """Send whatever is still pending and stop the workers"""
+        if not self.enabled:
+            return
+        for _ in self.workers:
+            self.queue.put(_STOP)
+        for worker in self.workers:
+            worker.join(timeout)
+
+    def submit(self, row):
+        """
+        Queue an alert for a new AttackLog row (called from the writer thread)
+
+        Returns:
+            bool: False if the alert was dropped
+        """
+        if not self.enabled:
+            return False
+
+        alert = {name: getattr(row, name) for name in _ALERT_FIELDS}
+        alert['source_ip'] = str(alert['source_ip'])
+        alert['target_ip'] = str(alert['target_ip'])
+
+        try:
+            if self.policy == 'block':
+                self.queue.put(alert, timeout=self.block_seconds)
+            else:
+                self.queue.put_nowait(alert)
+        except queue.Full:
+            if self.policy != 'drop_oldest':
+                self._count('dropped')
+                return False
+            try:
+                self.queue.get_nowait()
+                self._count('dropped')
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(alert)
+            except queue.Full:
+                self._count('dropped')
+                return False
+
+        self._count('queued')
+        return True
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['queue_depth'] = self.queue.qsize()
+        stats['policy'] = self.policy
+        return stats
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def _run(self):
+        """Collect alerts for one digest window, send, repeat"""
+        mailer = self.mailer_factory()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _STOP:
+                    return
+
+                batch = [item]
+                stopping = False
+                deadline = time.monotonic() + self.digest_seconds
+                while len(batch) < self.digest_max:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self.queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+                self._send(mailer, batch)
+                if stopping:
+                    return
+        finally:
+            mailer.close()
+
+    def _send(self, mailer, batch):
+        if len(batch) == 1:
+            subject, body = format_attack_alert(batch[0])
+        else:
+            subject, body = format_attack_digest(batch, self.digest_seconds)
+
+        try:
+            mailer.send(subject, body)
+        except Exception as e:
+            self._count('send_errors')
+            print(f"[EMAIL] Failed to send alert for {len(batch)} attackers: {e}")
+            return
+
+        self._count('mails_sent')
+        self._count('alerts_sent', len(batch))
+        print(f"[EMAIL] Alert sent for {len(batch)} attacker(s)")
+        self._mark_sent([alert['id'] for alert in batch])
+
+    def _mark_sent(self, row_ids):
+        """Set email_sent for the whole batch with one UPDATE"""
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(AttackLog)
+                .where(AttackLog.id.in_(row_ids))
+                .values(email_sent=True)
+            )
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[EMAIL] Failed to mark {len(row_ids)} alerts as sent: {e}")
+        finally:
+            db.close()
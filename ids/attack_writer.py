@@ -0,0 +1,350 @@
+"""
+Attack Log Writer
+Batched, asynchronous persistence of IDS detections
+
+The sniff thread only enqueues detections. A background worker coalesces
+them by (source_ip, attack_type, aggregation bucket) and flushes AttackLog
+inserts and packet_count/last_seen updates in one transaction.
+
+Repeat detections against a row that is already open never reach the
+queue: they are counted in the AttackAggregationCache and flushed as a
+bulk UPDATE by primary key.
+
+Detections arrive raw (header fields + payload bytes); only the first
+detection of each group is enriched (GeoIP, payload text) before writing.
+
+With active response enabled, new rows from an attacker the kernel is
+already blocking are written with blocked=True, and the open rows of
+addresses blocked since the previous flush are marked in the same
+transaction.
+"""
+
+from datetime import datetime, timedelta
+import threading
+import queue
+import time
+
+from sqlalchemy import update, bindparam, func
+
+from database.database import SessionLocal
+from models.attack import AttackLog
+from services.elasticsearch_bulk import bulk_indexer
+from config import settings
+from aggregation_cache import AttackAggregationCache
+from enrichment import DetectionEnricher
+from alert_dispatcher import AlertDispatcher
+from metrics import DB_FLUSH_SECONDS, DB_FLUSH_ERRORS
+
+_STOP = object()
+
+
+class AttackLogWriter:
+    """Background writer that coalesces detections and flushes them in bulk"""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_queue_size=settings.IDS_WRITER_QUEUE_SIZE,
+        flush_interval_ms=settings.IDS_WRITER_FLUSH_INTERVAL_MS,
+        flush_batch_size=settings.IDS_WRITER_FLUSH_BATCH_SIZE,
+        aggregation_minutes=settings.IDS_ATTACK_AGGREGATION_MINUTES,
+        enricher=None,
+        alerts=None,
+        indexer=bulk_indexer,
+        responder=None
+    ):
+        self.session_factory = session_factory
+        self.indexer = indexer
+        self.responder = responder
+        self.enricher = enricher or DetectionEnricher()
+        self.alerts = alerts or AlertDispatcher(session_factory)
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_batch_size = flush_batch_size
+        self.aggregation_window = timedelta(minutes=aggregation_minutes)
+        self.bucket_seconds = aggregation_minutes * 60
+        self.cache = AttackAggregationCache(ttl_seconds=aggregation_minutes * 60)
+
+        self.stats = {
+            'enqueued': 0,
+            'dropped': 0,
+            'flushes': 0,
+            'flush_errors': 0,
+            'rows_inserted': 0,
+            'rows_updated': 0,
+            'rows_blocked': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0
+        }
+
+        self.worker = threading.Thread(target=self._run, name='ids-attack-writer', daemon=True)
+
+    def start(self):
+        """Start the background flush worker"""
+        self.alerts.start()
+        self.worker.start()
+
+    def stop(self, timeout=10):
+        """Flush everything still queued and stop the worker"""
+        if not self.worker.is_alive():
+            return
+        self.queue.put(_STOP)
+        self.worker.join(timeout)
+        self.alerts.stop(timeout)
+        self.indexer.stop(timeout)
+
+    def submit(self, detection):
+        """
+        Queue a detection for persistence (non-blocking)
+
+        Returns:
+            bool: False if the queue is full and the detection was dropped
+        """
+        # Same attacker again: just count it against the open row
+        key = (detection['source_ip'], detection['attack_type'])
+        if self.cache.add_delta(key, detection['detected_at']):
+            return True
+
+        try:
+            self.queue.put_nowait(detection)
+            self.stats['enqueued'] += 1
+            return True
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+
+    def get_stats(self):
+        """Return writer counters (queue depth, flush latency, row counts)"""
+        stats = dict(self.stats)
+        stats['queue_depth'] = self.queue.qsize()
+        stats['cache_size'] = len(self.cache)
+        stats['cache_hits'] = self.cache.stats['hits']
+        stats['cache_misses'] = self.cache.stats['misses']
+        stats['cache_evictions'] = self.cache.stats['evictions']
+        stats.update(self.enricher.get_stats())
+        stats['alerts'] = self.alerts.get_stats()
+        stats['elasticsearch'] = self.indexer.get_stats()
+        stats['avg_flush_ms'] = (
+            stats['total_flush_ms'] / stats['flushes'] if stats['flushes'] else 0.0
+        )
+        return stats
+
+    def _run(self):
+        """Worker loop: coalesce queued detections, flush every N ms or M rows"""
+        groups = {}
+        pending = 0
+        deadline = time.monotonic() + self.flush_interval
+
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._flush(groups)
+                return
+
+            if item is not None:
+                self._coalesce(groups, item)
+                pending += 1
+
+            if pending >= self.flush_batch_size or time.monotonic() >= deadline:
+                self._flush(groups)
+                groups = {}
+                pending = 0
+                deadline = time.monotonic() + self.flush_interval
+
+    def _coalesce(self, groups, detection):
+        """Merge a detection into its (source_ip, attack_type, bucket) group"""
+        detected_at = detection['detected_at']
+        bucket = int(detected_at.timestamp()) // self.bucket_seconds
+        key = (detection['source_ip'], detection['attack_type'], bucket)
+
+        group = groups.get(key)
+        if group is None:
+            groups[key] = {'first': detection, 'count': 1, 'last_seen': detected_at}
+        else:
+            group['count'] += 1
+            if detected_at > group['last_seen']:
+                group['last_seen'] = detected_at
+
+    def _flush(self, groups):
+        """Write one batch of coalesced groups and cached deltas in a single transaction"""
+        now = datetime.now()
+        deltas = {}
+        # A retired and a re-opened entry can drain under the same row id
+        for row_id, delta, seen in self.cache.drain(now):
+            self._add_delta(deltas, row_id, delta, seen)
+        blocked = self.responder.drain_applied() if self.responder is not None else []
+        if not groups and not deltas and not blocked:
+            return
+
+        started = time.perf_counter()
+        new_rows = []
+        inserted = 0
+
+        # One enrichment per group (GeoIP cached per IP), never per packet
+        for group in groups.values():
+            self.enricher.enrich(group['first'])
+
+        # expire_on_commit=False keeps row attributes readable for the
+        # email alert thread after the session is closed
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            # Fall back to the database only for attackers the cache doesn't know
+            misses = {}
+            for key, group in groups.items():
+                row_id = self.cache.get(key[:2], now)
+                if row_id is not None:
+                    self._add_delta(deltas, row_id, group['count'], group['last_seen'])
+                else:
+                    misses[key] = group
+            open_rows = self._load_open_rows(db, misses) if misses else {}
+
+            for key in sorted(misses, key=lambda k: k[2]):
+                group = misses[key]
+                first = group['first']
+                row_key = key[:2]
+                row = open_rows.get(row_key)
+
+                if row is not None:
+                    # Update existing
+                    if row.id is not None:
+                        self._add_delta(deltas, row.id, group['count'], group['last_seen'])
+                    else:
+                        row.packet_count += group['count']
+                        row.last_seen = max(row.last_seen, group['last_seen'])
+                else:
+                    # Create new
+                    row = self._build_row(first, group)
+                    db.add(row)
+                    open_rows[row_key] = row
+                    new_rows.append(row)
+                    inserted += 1
+
+            if deltas:
+                table = AttackLog.__table__
+                db.execute(
+                    update(table)
+                    .where(table.c.id == bindparam('row_id'))
+                    .values(
+                        packet_count=table.c.packet_count + bindparam('delta'),
+                        # Retired deltas can be older than what is stored
+                        last_seen=func.greatest(table.c.last_seen, bindparam('seen'))
+                    ),
+                    [{'row_id': row_id, 'delta': delta, 'seen': seen}
+                     for row_id, (delta, seen) in deltas.items()]
+                )
+
+            blocked_rows = 0
+            if blocked:
+                table = AttackLog.__table__
+                blocked_rows = db.execute(
+                    update(table)
+                    .where(table.c.source_ip.in_(blocked),
+                           table.c.detected_at > now - self.aggregation_window,
+                           table.c.blocked.isnot(True))
+                    .values(blocked=True)
+                ).rowcount
+
+            db.commit()
+
+            for row_key, row in open_rows.items():
+                self.cache.open(row_key, row.id, row.detected_at)
+        except Exception as e:
+            db.rollback()
+            self.stats['flush_errors'] += 1
+            DB_FLUSH_ERRORS.inc()
+            print(f"[WRITER] Flush failed, {len(groups)} attack groups, "
+                  f"{len(deltas)} pending updates and {len(blocked)} block marks lost: {e}")
+            return
+        finally:
+            db.close()
+
+        elapsed = time.perf_counter() - started
+        DB_FLUSH_SECONDS.observe(elapsed)
+        elapsed_ms = elapsed * 1000
+        self.stats['flushes'] += 1
+        self.stats['rows_inserted'] += inserted
+        self.stats['rows_updated'] += len(deltas)
+        self.stats['rows_blocked'] += blocked_rows + sum(1 for row in new_rows if row.blocked)
+        self.stats['last_flush_ms'] = elapsed_ms
+        self.stats['total_flush_ms'] += elapsed_ms
+        self.stats['max_flush_ms'] = max(self.stats['max_flush_ms'], elapsed_ms)
+
+        for group in groups.values():
+            first = group['first']
+            print(f"[ATTACK DETECTED] {first['attack_type']} from {first['source_ip']}:{first['source_port']} "
+                  f"-> {first['target_ip']}:{first['target_port']} (x{group['count']})")
+
+        self._send_alerts(new_rows)
+        if groups:
+            self._send_to_elasticsearch(groups)
+
+    def _add_delta(self, deltas, row_id, count, last_seen):
+        """Accumulate a packet_count/last_seen update for an existing row"""
+        delta = deltas.get(row_id)
+        if delta is None:
+            deltas[row_id] = [count, last_seen]
+        else:
+            delta[0] += count
+            if last_seen > delta[1]:
+                delta[1] = last_seen
+
+    def _load_open_rows(self, db, groups):
+        """Fetch recent AttackLog rows for every attacker in the batch with one query"""
+        source_ips = {key[0] for key in groups}
+        attack_types = {key[1] for key in groups}
+        cutoff = datetime.now() - self.aggregation_window
+
+        rows = db.query(AttackLog).filter(
+            AttackLog.source_ip.in_(source_ips),
+            AttackLog.attack_type.in_(attack_types),
+            AttackLog.detected_at > cutoff
+        ).order_by(AttackLog.detected_at).all()
+
+        # Latest row wins when several are still inside the window
+        return {(str(row.source_ip), row.attack_type): row for row in rows}
+
+    def _build_row(self, detection, group):
+        """Build a new AttackLog row from the first detection of a group"""
+        return AttackLog(
+            source_ip=detection['source_ip'],
+            source_port=detection['source_port'],
+            target_ip=detection['target_ip'],
+            target_port=detection['target_port'],
+            attack_type=detection['attack_type'],
+            severity=detection['severity'],
+            packet_count=group['count'],
+            protocol=detection['protocol'],
+            flags=detection['flags'],
+            payload_sample=detection['payload_sample'],
+            country=detection['country'],
+            city=detection['city'],
+            latitude=detection['latitude'],
+            longitude=detection['longitude'],
+            detected_tool=detection['detected_tool'],
+            confidence=detection['confidence'],
+            raw_packet_info=detection['raw_packet_info'],
+            first_seen=detection['detected_at'],
+            last_seen=group['last_seen'],
+            detected_at=detection['detected_at'],
+            blocked=self.responder is not None and self.responder.is_blocked(detection['source_ip'])
+        )
+
+    def _send_alerts(self, new_rows):
+        """Hand newly opened attack rows to the alert dispatcher (digest emails)"""
+        dropped = sum(1 for row in new_rows if not self.alerts.submit(row))
+        if dropped and self.alerts.enabled:
+            print(f"[WRITER] Alert queue full, {dropped} alerts dropped")
+
+    def _send_to_elasticsearch(self, groups):
+        """Buffer one document per coalesced group in the shared bulk indexer"""
+        for key, group in groups.items():
+            doc = dict(group['first'])
+            doc['packet_count'] = group['count']
+            doc['detected_at'] = doc['detected_at'].isoformat()
+            # Later groups of the same burst merge into the still-buffered document
+            self.indexer.add_attack(doc, coalesce_key=key)
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Pandora IDS Benchmark
+Measure the IDS offline by replaying pcap/pcapng files
+
+Commands:
+    decode   Capture backend decode cost (raw-header parser vs. Scapy)
+    replay   Detector throughput, detection latency percentiles and peak RSS
+    synth    Generate a synthetic attack capture and replay it
+    scale    Sharded pipeline throughput for 1..N detector worker processes
+    filter   Share of packets the kernel prefilter passes, with and without flow tracking
+
+Usage:
+    python benchmark.py decode capture.pcap [--repeat 5]
+    python benchmark.py replay capture.pcap [--mode detector|engine] [--realtime] [--local-ip 10.0.0.10]
+    python benchmark.py synth --scenario mixed --packets 200000
+    python benchmark.py scale capture.pcap --workers 1,2,4,8
+    python benchmark.py filter capture.pcap     # e.g. a "webserver" synth capture
+
+Replay modes:
+    detector  parsed headers -> AttackDetector + TrafficSketch (no backend-admin imports)
+    engine    parsed headers -> IDSEngine.packet_handler, with the database /
+              Elasticsearch writer replaced by an in-memory recorder
+"""
+
+import subprocess
+import argparse
+import resource
+import tempfile
+import shutil
+import time
+import sys
+import os
+
+from capture import (read_pcap, parse_frame, packet_from_scapy, PcapCapture, TCP_SYN, TCP_ACK, addr_to_ip,
+                     DLT_EN10MB, DLT_RAW, DLT_LINUX_SLL, DLT_NULL)
+from prefix_table import PRIVATE_TABLE
+
+
+def _scapy_decoder(linktype):
+    """Return the Scapy layer class used to dissect frames of this link type"""
+    from scapy.all import Ether, IP, CookedLinux, Loopback
+    return {
+        DLT_EN10MB: Ether,
+        DLT_RAW: IP,
+        DLT_LINUX_SLL: CookedLinux,
+        DLT_NULL: Loopback
+    }[linktype]
+
+
+def bench_capture_decode(frames, repeat):
+    """Packets/s for the raw-header parser vs. Scapy dissection + conversion"""
+    results = {}
+    total = len(frames) * repeat
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for timestamp, linktype, frame in frames:
+            parse_frame(frame, linktype, timestamp)
+    results['afpacket'] = total / (time.perf_counter() - started)
+
+    try:
+        decoders = {linktype: _scapy_decoder(linktype) for _, linktype, _ in frames}
+    except ImportError:
+        print("[BENCH] Scapy not installed, skipping scapy backend")
+        return results
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for _, linktype, frame in frames:
+            packet_from_scapy(decoders[linktype](frame))
+    results['scapy'] = total / (time.perf_counter() - started)
+
+    return results
+
+
+# ========================================================================
+# Replay
+# ========================================================================
+
+def infer_local_ips(path):
+    """
+    Victim addresses of a capture: destinations of bare SYNs, private ones
+    preferred (a replayed capture was not recorded on this machine)
+    """
+    targets = set()
+    for timestamp, linktype, frame in read_pcap(path):
+        info = parse_frame(frame, linktype, timestamp)
+        if info is not None and info.is_tcp and info.flags == TCP_SYN:
+            targets.add(info.dst_addr)
+    private = {addr for addr in targets if addr in PRIVATE_TABLE}
+    return {addr_to_ip(addr) for addr in private or targets}
+
+
+class RecordingWriter:
+    """Stand-in for AttackLogWriter: keeps detections in memory, no DB / Elasticsearch"""
+
+    def __init__(self, latency_clock):
+        self.latency_clock = latency_clock
+        self.detections = []
+        self.latencies = []
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def submit(self, detection):
+        self.latencies.append(self.latency_clock())
+        self.detections.append(detection['attack_type'])
+        return True
+
+    def get_stats(self):
+        return {'enqueued': len(self.detections)}
+
+
+class ReplayBench:
+    """Time each packet from handler entry to detection"""
+
+    def __init__(self):
+        self.packet_started = 0.0
+
+    def since_packet(self):
+        return time.perf_counter() - self.packet_started
+
+    def wrap(self, handler):
+        def timed(packet):
+            self.packet_started = time.perf_counter()
+            handler(packet)
+        return timed
+
+
+def replay_detector(path, local_ips, realtime=False, speed=1.0):
+    """Parsed headers straight into the detectors (the capture-process hot path)"""
+    from detector import AttackDetector, DIRECTION_INBOUND
+    from sketches import TrafficSketch
+
+    capture = PcapCapture(path, realtime=realtime, speed=speed)
+    detector = AttackDetector(local_ips, clock=capture.clock)
+    sketch = TrafficSketch(clock=capture.clock)
+    bench = ReplayBench()
+    detections = []
+    latencies = []
+
+    def handler(packet):
+        direction = detector.is_candidate(packet)
+        if not direction:
+            return
+        probe = direction == DIRECTION_INBOUND and detector.is_probe(packet)
+        for attack_info in (probe and sketch.observe(packet), detector.detect(packet, direction)):
+            if attack_info:
+                latencies.append(bench.since_packet())
+                detections.append(attack_info['type'])
+
+    started = time.perf_counter()
+    capture.run(bench.wrap(handler))
+    return capture.packets, time.perf_counter() - started, detections, latencies, detector.get_memory_stats()
+
+
+def replay_engine(path, local_ips, realtime=False, speed=1.0):
+    """Full IDSEngine.packet_handler path (GeoIP enrichment included), writer recorded in memory"""
+    from ids_engine import IDSEngine
+
+    bench = ReplayBench()
+    writer = RecordingWriter(bench.since_packet)
+    engine = IDSEngine(interface='replay', workers=0, local_ips=local_ips, writer=writer)
+    engine.capture = capture = PcapCapture(path, realtime=realtime, speed=speed)
+    engine.detector.clock = capture.clock
+    if engine.sketch is not None:
+        engine.sketch.clock = capture.clock
+
+    started = time.perf_counter()
+    capture.run(bench.wrap(engine.packet_handler))
+    return capture.packets, time.perf_counter() - started, writer.detections, writer.latencies, \
+        engine.detector.get_memory_stats()
+
+
+def replay_pipeline(path, local_ips, workers):
+    """
+    Capture-side direction filter + dispatch into a ShardedPipeline of N
+    worker processes, timed until every ring is drained
+
+    A full ring makes the replay wait for its worker instead of dropping,
+    so the rate is what the workers sustain, not what the capture offers.
+    """
+    from detector import AttackDetector
+    from pipeline import ShardedPipeline
+
+    capture = PcapCapture(path)
+    detector = AttackDetector(local_ips)
+    detections = []
+    stalls = [0]
+    pipeline = ShardedPipeline(workers, lambda packet, attack_info: detections.append(attack_info['type']))
+    pipeline.start()
+    time.sleep(1.0)  # Workers import the detectors and attach their rings
+
+    def handler(packet):
+        direction = detector.is_candidate(packet)
+        if not direction:
+            return
+        dispatched = pipeline.dispatched
+        pipeline.dispatch(packet, direction)
+        while pipeline.dispatched == dispatched:
+            stalls[0] += 1
+            time.sleep(0.0001)
+            pipeline.dispatch(packet, direction)
+
+    started = time.perf_counter()
+    try:
+        capture.run(handler)
+        while any(ring.depth() for ring in pipeline.rings):
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+        time.sleep(0.5)  # Last detections through the result queue
+    finally:
+        pipeline.stop()
+    return capture.packets, pipeline.dispatched, elapsed, stalls[0], detections
+
+
+def run_filter(path, local_ips):
+    """
+    Kernel accept ratio per prefilter setting, counted with
+    AttackDetector.is_candidate (the userspace mirror of build_bpf_filter);
+    cross-checked with tcpdump when it is installed
+    """
+    from detector import AttackDetector, DIRECTION_INBOUND
+    from bpf_filter import build_bpf_filter
+
+    if not local_ips:
+        local_ips = infer_local_ips(path)
+    capture = PcapCapture(path)
+    plain = AttackDetector(local_ips, max_flows=0)
+    tracking = AttackDetector(local_ips)
+    counts = {'off': 0, 'on': 0, 'bare_acks': 0}
+
+    def handler(packet):
+        counts['off'] += bool(plain.is_candidate(packet))
+        direction = tracking.is_candidate(packet)
+        if direction:
+            counts['on'] += 1
+            if (direction == DIRECTION_INBOUND and not tracking.is_probe(packet)
+                    and packet.flags & 0x3F == TCP_ACK and not packet.payload):
+                counts['bare_acks'] += 1
+
+    capture.run(handler)
+    total = capture.packets or 1
+    rows = [
+        ("flow tracking off", counts['off'], False),
+        ("flow tracking on", counts['on'], True),
+        ("on, minus bare ACKs", counts['on'] - counts['bare_acks'], None)
+    ]
+
+    tcpdump = shutil.which('tcpdump')
+    print("="*70)
+    print(f"[BENCH] {path} (kernel prefilter, {capture.packets:,} packets)")
+    print("="*70)
+    for label, accepted, track_flows in rows:
+        line = f"  {label:<22} {accepted:>10,} accepted  {accepted / total:>7.1%}"
+        if tcpdump and track_flows is not None:
+            expression = build_bpf_filter(local_ips, tracking.CRITICAL_PORTS, tracking.IGNORED_SOURCE_PORTS,
+                                          track_flows=track_flows)
+            result = subprocess.run([tcpdump, '-nqr', path, expression], capture_output=True, text=True)
+            line += f"  (tcpdump: {len(result.stdout.splitlines()):,})"
+        print(line)
+    print(f"  bare ACKs              {counts['bare_acks']:>10,} = "
+          f"{counts['bare_acks'] / counts['on'] if counts['on'] else 0:.1%} of what flow tracking accepts")
+    print("="*70)
+
+
+def run_scale(path, local_ips, worker_counts):
+    if not local_ips:
+        local_ips = infer_local_ips(path)
+
+    print("="*70)
+    print(f"[BENCH] {path} (sharded pipeline, max speed, {os.cpu_count()} CPUs)")
+    print("="*70)
+    print(f"  {'workers':>7} {'packets/s':>12} {'dispatched':>12} {'speedup':>8} {'full-ring waits':>16} {'detections':>11}")
+    baseline = None
+    for workers in worker_counts:
+        packets, dispatched, elapsed, stalls, detections = replay_pipeline(path, local_ips, workers)
+        rate = packets / elapsed if elapsed else 0
+        baseline = baseline or rate
+        print(f"  {workers:>7} {rate:>12,.0f} {dispatched:>12,} {rate / baseline if baseline else 0:>7.2f}x "
+              f"{stalls:>16,} {len(detections):>11,}")
+    print("="*70)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_replay(path, mode, local_ips, realtime, speed):
+    if not local_ips:
+        local_ips = infer_local_ips(path)
+    replay = replay_engine if mode == 'engine' else replay_detector
+    packets, elapsed, detections, latencies, memory = replay(path, local_ips, realtime, speed)
+    latencies.sort()
+
+    print("="*70)
+    print(f"[BENCH] {path} ({mode}, {'recorded timing x' + str(speed) if realtime else 'max speed'})")
+    shown = sorted(local_ips)
+    print(f"[BENCH] Local IPs: {', '.join(shown[:8]) or '-'}" + (f" (+{len(shown) - 8} more)" if len(shown) > 8 else ""))
+    print("="*70)
+    print(f"  packets        {packets:>12,}")
+    print(f"  elapsed        {elapsed:>12.3f} s")
+    print(f"  throughput     {packets / elapsed if elapsed else 0:>12,.0f} packets/s")
+    print(f"  detections     {len(detections):>12,}")
+    for pct in (50, 90, 99):
+        print(f"  latency p{pct:<4}  {percentile(latencies, pct) * 1e6:>12.1f} us")
+    print(f"  latency max    {(latencies[-1] if latencies else 0) * 1e6:>12.1f} us")
+    if memory['flows']:
+        print(f"  flows          {memory['flows']['opened']:>12,} opened, {memory['flows']['completed']:,} completed")
+    print(f"  trackers       {memory['estimated_bytes'] / 1048576:>12.1f} MB (estimated)")
+    print(f"  peak RSS       {peak_rss_bytes() / 1048576:>12.1f} MB")
+    print("-"*70)
+    counts = {}
+    for attack_type in detections:
+        counts[attack_type] = counts.get(attack_type, 0) + 1
+    for attack_type, count in sorted(counts.items(), key=lambda item: -item[1]):
+        print(f"  {attack_type:<28} {count:>10,}")
+    print("="*70)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pandora IDS benchmark")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    decode = commands.add_parser('decode', help="Capture backend decode cost")
+    decode.add_argument('pcap', help="pcap/pcapng file to replay")
+    decode.add_argument('--repeat', type=int, default=5, help="Replay the file this many times")
+
+    replay_args = argparse.ArgumentParser(add_help=False)
+    replay_args.add_argument('--mode', choices=('detector', 'engine'), default='detector')
+    replay_args.add_argument('--realtime', action='store_true', help="Replay at recorded timing")
+    replay_args.add_argument('--speed', type=float, default=1.0, help="Recorded timing speed-up factor")
+    replay_args.add_argument('--local-ip', action='append', default=None,
+                             help="Victim address (repeatable; inferred from SYN targets if omitted)")
+
+    replay = commands.add_parser('replay', parents=[replay_args], help="Replay a capture through the detectors")
+    replay.add_argument('pcap', help="pcap/pcapng file to replay")
+
+    from pcap_synth import SCENARIOS
+    synth = commands.add_parser('synth', parents=[replay_args], help="Generate and replay a synthetic capture")
+    synth.add_argument('--scenario', choices=SCENARIOS, default='mixed')
+    synth.add_argument('--packets', type=int, default=100000)
+    synth.add_argument('--keep', metavar='PATH', default=None, help="Write the capture here instead of a temp file")
+
+    scale = commands.add_parser('scale', help="Sharded pipeline throughput per worker count")
+    scale.add_argument('pcap', help="pcap/pcapng file to replay")
+    scale.add_argument('--workers', default='1,2,4', help="Comma-separated worker counts")
+    scale.add_argument('--local-ip', action='append', default=None,
+                       help="Victim address (repeatable; inferred from SYN targets if omitted)")
+
+    prefilter = commands.add_parser('filter', help="Kernel prefilter accept ratio, flow tracking on/off")
+    prefilter.add_argument('pcap', help="pcap/pcapng file to replay")
+    prefilter.add_argument('--local-ip', action='append', default=None,
+                           help="Victim address (repeatable; inferred from SYN targets if omitted)")
+
+    args = parser.parse_args()
+
+    if args.command == 'decode':
+        frames = list(read_pcap(args.pcap))
+        if not frames:
+            print(f"[ERROR] No packets in {args.pcap}")
+            sys.exit(1)
+
+        print("="*70)
+        print(f"[BENCH] {len(frames)} packets x {args.repeat} from {args.pcap}")
+        print("="*70)
+
+        results = bench_capture_decode(frames, args.repeat)
+        for backend, rate in results.items():
+            print(f"  {backend:<10} {rate:>12,.0f} packets/s")
+        if 'scapy' in results:
+            print(f"  speedup    {results['afpacket'] / results['scapy']:>12.1f}x")
+        print("="*70)
+
+    elif args.command == 'replay':
+        run_replay(args.pcap, args.mode, args.local_ip, args.realtime, args.speed)
+
+    elif args.command == 'filter':
+        run_filter(args.pcap, args.local_ip)
+
+    elif args.command == 'scale':
+        run_scale(args.pcap, args.local_ip, [int(n) for n in args.workers.split(',')])
+
+    else:
+        from pcap_synth import generate, write_pcap
+
+        path = args.keep
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix='.pcap', prefix=f'ids-{args.scenario}-')
+            os.close(fd)
+        try:
+            count = write_pcap(path, generate(args.scenario, args.packets))
+            print(f"[SYNTH] {count} packets ({args.scenario}) -> {path}")
+            run_replay(path, args.mode, args.local_ip, args.realtime, args.speed)
+        finally:
+            if args.keep is None:
+                os.unlink(path)
+
+
+if __name__ == '__main__':
+    main()
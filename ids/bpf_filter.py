@@ -0,0 +1,137 @@
+"""
+BPF Prefilter
+Compile the IDS traffic rules into a tcpdump-style filter expression
+
+The kernel then drops outbound, transit, non-TCP and established
+(non-SYN, non-critical-port) traffic before it is copied to userspace.
+detect_attack_type() still applies the same rules, so the filter is
+purely an optimization.
+
+With flow tracking the filter also passes the segments the flow table
+needs: inbound FIN/RST, flag combinations without SYN/ACK, bare ACKs
+without payload (handshake completion) and our own SYN-ACK/RST answers.
+Data-carrying established traffic is still dropped in the kernel, but a
+stateless filter cannot tell the one ACK that completes a handshake from
+the ACKs clients send for our data segments: on a host serving content
+those are most inbound packets. On the webserver synth capture (nmap
+scan over downloads from a non-critical port) the accept ratio goes from
+11% to 43%, two thirds of it bare ACKs; hence IDS_FLOW_TRACKING is off
+by default (measure with `benchmark.py filter`).
+"""
+
+import ipaddress
+import glob
+import os
+
+
+def _or_list(items):
+    """'a or b or c' for a BPF primitive argument list"""
+    return ' or '.join(str(item) for item in items)
+
+
+# Bare ACK with no TCP payload (IP total length - IP header - TCP header == 0)
+_BARE_ACK = ("tcp[tcpflags] & 0x3f == tcp-ack and "
+             "ip[2:2] - ((ip[0] & 0xf) << 2) - ((tcp[12] & 0xf0) >> 2) == 0")
+
+
+def build_bpf_filter(local_ips, critical_ports, ignored_src_ports, track_flows=False):
+    """
+    Build the capture filter for NEW INBOUND TCP traffic
+
+    Args:
+        local_ips: addresses of this machine or local CIDRs (only IPv4 is captured)
+        critical_ports: destination ports monitored even without SYN
+        ignored_src_ports: source ports of return traffic to skip
+        track_flows: also pass handshake / teardown / stealth segments
+            and our SYN-ACK/RST answers (see flow_table.py)
+
+    Returns:
+        str: filter expression, e.g. "tcp and dst host (...) and ..."
+    """
+    hosts, nets = _split_ipv4(local_ips)
+    if not hosts and not nets:
+        # Nothing to anchor on; keep the legacy catch-all filter
+        return "ip"
+
+    parts = [
+        "tcp",
+        _match('dst', hosts, nets),
+        f"not {_match('src', hosts, nets)}"
+    ]
+    if ignored_src_ports:
+        parts.append(f"not src port ({_or_list(sorted(ignored_src_ports))})")
+    probes = ["tcp[tcpflags] & tcp-syn != 0"]
+    if critical_ports:
+        probes.append(f"dst port ({_or_list(sorted(critical_ports))})")
+    if track_flows:
+        probes += [
+            "tcp[tcpflags] & (tcp-fin|tcp-rst) != 0",
+            "tcp[tcpflags] & (tcp-syn|tcp-ack) == 0",
+            f"({_BARE_ACK})"
+        ]
+    parts.append(f"({' or '.join(probes)})" if len(probes) > 1 else probes[0])
+
+    if not track_flows:
+        return ' and '.join(parts)
+
+    outbound = [
+        _match('src', hosts, nets),
+        f"not {_match('dst', hosts, nets)}"
+    ]
+    if ignored_src_ports:
+        outbound.append(f"not dst port ({_or_list(sorted(ignored_src_ports))})")
+    outbound.append("(tcp[tcpflags] & tcp-rst != 0 or tcp[tcpflags] & (tcp-syn|tcp-ack) == (tcp-syn|tcp-ack))")
+
+    return f"tcp and (({' and '.join(parts[1:])}) or ({' and '.join(outbound)}))"
+
+
+def _split_ipv4(local_ips):
+    """Local entries (addresses or CIDRs) -> sorted IPv4 hosts and networks"""
+    hosts, nets = set(), set()
+    for entry in local_ips:
+        try:
+            network = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            continue
+        if network.version != 4:
+            continue
+        if network.prefixlen == 32:
+            hosts.add(network.network_address)
+        else:
+            nets.add(network)
+    return [str(host) for host in sorted(hosts)], [str(net) for net in sorted(nets)]
+
+
+def _match(direction, hosts, nets):
+    """'dst host (a or b)' / 'dst net x/24', parenthesized when combined"""
+    matches = []
+    if hosts:
+        matches.append(f"{direction} host ({_or_list(hosts)})")
+    matches += [f"{direction} net {net}" for net in nets]
+    return matches[0] if len(matches) == 1 else f"({' or '.join(matches)})"
+
+
+def read_rx_packets(interface=None):
+    """
+    Packets received by the NIC(s) according to /sys/class/net
+
+    Returns:
+        int or None when the counters are unavailable (non-Linux)
+    """
+    if interface:
+        paths = [f"/sys/class/net/{interface}/statistics/rx_packets"]
+    else:
+        paths = glob.glob("/sys/class/net/*/statistics/rx_packets")
+
+    total = 0
+    found = False
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path) as f:
+                total += int(f.read().strip())
+            found = True
+        except (OSError, ValueError):
+            continue
+    return total if found else None
@@ -0,0 +1,549 @@
+"""
+Packet Capture Backends
+Feed the IDS with compact parsed headers instead of Scapy packet trees
+
+Backends:
+- afpacket: Linux AF_PACKET socket with a memory-mapped TPACKET_V3 ring
+- scapy:    scapy.all.sniff() (portable fallback, e.g. Windows)
+- pcap:     offline replay of a pcap/pcapng file (benchmarks, --replay)
+
+Every backend calls handler(PacketInfo) for each IPv4 packet.
+"""
+
+from socket import inet_aton, inet_ntoa
+import struct
+import socket
+import select
+import mmap
+import time
+
+# TCP flag bits (same letter order as Scapy's FlagValue string)
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+TCP_URG = 0x20
+TCP_ECE = 0x40
+TCP_CWR = 0x80
+TCP_NS = 0x100
+_TCP_FLAG_LETTERS = 'FSRPAUECN'
+
+PROTO_ICMP = 1
+PROTO_TCP = 6
+PROTO_UDP = 17
+
+# Only this much payload is kept (matches AttackLog.payload_sample)
+PAYLOAD_SAMPLE_SIZE = 200
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+_ETH_VLAN_TYPES = (0x8100, 0x88a8)
+
+# pcap link types
+DLT_NULL = 0
+DLT_EN10MB = 1
+DLT_RAW = 101
+DLT_LINUX_SLL = 113
+
+
+class PacketInfo:
+    """
+    Header fields the detectors need, parsed once per packet
+
+    Addresses are kept as 32-bit integers (src_addr / dst_addr) so that
+    tracker lookups hash an int; the dotted strings are only built when
+    something reads src_ip / dst_ip (logging, GeoIP, the database row).
+    """
+
+    __slots__ = ('src_addr', 'dst_addr', 'proto', 'src_port', 'dst_port', 'flags', 'payload', 'timestamp')
+
+    def __init__(self, src_addr, dst_addr, proto, src_port=None, dst_port=None, flags=0, payload=b'', timestamp=None):
+        self.src_addr = src_addr
+        self.dst_addr = dst_addr
+        self.proto = proto
+        self.src_port = src_port  # None when there is no parsed TCP/UDP header
+        self.dst_port = dst_port
+        self.flags = flags  # TCP flag bits
+        self.payload = payload  # First PAYLOAD_SAMPLE_SIZE bytes of L4 payload
+        self.timestamp = timestamp
+
+    @property
+    def src_ip(self):
+        return addr_to_ip(self.src_addr)
+
+    @property
+    def dst_ip(self):
+        return addr_to_ip(self.dst_addr)
+
+    @property
+    def is_tcp(self):
+        return self.proto == PROTO_TCP and self.src_port is not None
+
+    def __repr__(self):
+        return f"<PacketInfo {self.src_ip}:{self.src_port} -> {self.dst_ip}:{self.dst_port} proto={self.proto}>"
+
+
+def ip_to_addr(ip):
+    """'192.0.2.1' -> 3221225985"""
+    return int.from_bytes(inet_aton(ip), 'big')
+
+
+def addr_to_ip(addr):
+    """3221225985 -> '192.0.2.1'"""
+    return inet_ntoa(addr.to_bytes(4, 'big'))
+
+
+def format_tcp_flags(flags):
+    """Render TCP flag bits the way Scapy does ('S', 'SA', 'PA', ...)"""
+    return ''.join(letter for bit, letter in enumerate(_TCP_FLAG_LETTERS) if flags & (1 << bit))
+
+
+def parse_ipv4(buf, offset, end, timestamp=None):
+    """Parse an IPv4 header (and TCP/UDP ports) starting at buf[offset]"""
+    if end - offset < 20:
+        return None
+
+    version_ihl = buf[offset]
+    if version_ihl >> 4 != 4:
+        return None
+
+    ihl = (version_ihl & 0x0F) * 4
+    total_length, frag = struct.unpack_from('!H2xH', buf, offset + 2)
+    proto = buf[offset + 9]
+    src_addr, dst_addr = struct.unpack_from('!II', buf, offset + 12)
+
+    # Ignore link-layer padding
+    if total_length >= ihl:
+        end = min(end, offset + total_length)
+
+    # Non-first fragments carry no L4 header
+    l4 = offset + ihl
+    if frag & 0x1FFF:
+        return PacketInfo(src_addr, dst_addr, proto, timestamp=timestamp)
+
+    if proto == PROTO_TCP and end - l4 >= 20:
+        src_port, dst_port, data_flags = struct.unpack_from('!HH8xH', buf, l4)
+        data = l4 + (data_flags >> 12) * 4
+        payload = bytes(buf[data:min(end, data + PAYLOAD_SAMPLE_SIZE)]) if data < end else b''
+        return PacketInfo(src_addr, dst_addr, proto, src_port, dst_port, data_flags & 0x1FF, payload, timestamp)
+
+    if proto == PROTO_UDP and end - l4 >= 8:
+        src_port, dst_port = struct.unpack_from('!HH', buf, l4)
+        data = l4 + 8
+        payload = bytes(buf[data:min(end, data + PAYLOAD_SAMPLE_SIZE)]) if data < end else b''
+        return PacketInfo(src_addr, dst_addr, proto, src_port, dst_port, 0, payload, timestamp)
+
+    return PacketInfo(src_addr, dst_addr, proto, timestamp=timestamp)
+
+
+def parse_frame(buf, linktype=DLT_EN10MB, timestamp=None):
+    """Parse a link-layer frame down to a PacketInfo (IPv4 only)"""
+    end = len(buf)
+
+    if linktype == DLT_EN10MB:
+        if end < 14:
+            return None
+        offset = 12
+        ethertype = struct.unpack_from('!H', buf, offset)[0]
+        while ethertype in _ETH_VLAN_TYPES and end >= offset + 6:
+            offset += 4
+            ethertype = struct.unpack_from('!H', buf, offset)[0]
+        if ethertype != ETH_P_IP:
+            return None
+        return parse_ipv4(buf, offset + 2, end, timestamp)
+
+    if linktype == DLT_RAW:
+        return parse_ipv4(buf, 0, end, timestamp)
+
+    if linktype == DLT_LINUX_SLL:
+        if end < 16 or struct.unpack_from('!H', buf, 14)[0] != ETH_P_IP:
+            return None
+        return parse_ipv4(buf, 16, end, timestamp)
+
+    if linktype == DLT_NULL:
+        return parse_ipv4(buf, 4, end, timestamp)
+
+    return None
+
+
+def packet_from_scapy(packet):
+    """Convert a Scapy packet into a PacketInfo"""
+    from scapy.all import IP, TCP, UDP
+
+    if not packet.haslayer(IP):
+        return None
+
+    ip = packet[IP]
+    src_addr = ip_to_addr(ip.src)
+    dst_addr = ip_to_addr(ip.dst)
+    timestamp = float(packet.time) if getattr(packet, 'time', None) else None
+    if packet.haslayer(TCP):
+        tcp = packet[TCP]
+        payload = bytes(tcp.payload)[:PAYLOAD_SAMPLE_SIZE]
+        return PacketInfo(src_addr, dst_addr, ip.proto, tcp.sport, tcp.dport, int(tcp.flags), payload, timestamp)
+    if packet.haslayer(UDP):
+        udp = packet[UDP]
+        payload = bytes(udp.payload)[:PAYLOAD_SAMPLE_SIZE]
+        return PacketInfo(src_addr, dst_addr, ip.proto, udp.sport, udp.dport, 0, payload, timestamp)
+    return PacketInfo(src_addr, dst_addr, ip.proto, timestamp=timestamp)
+
+
+def read_pcap(path):
+    """
+    Iterate (timestamp, linktype, frame bytes) records from a pcap or
+    pcapng capture file
+    """
+    with open(path, 'rb') as f:
+        header = f.read(24)
+        if len(header) < 24:
+            raise ValueError(f"Not a pcap file: {path}")
+
+        magic = header[:4]
+        if magic == b'\x0a\x0d\x0d\x0a':
+            f.seek(0)
+            yield from _read_pcapng(f, path)
+            return
+
+        if magic in (b'\xd4\xc3\xb2\xa1', b'\x4d\x3c\xb2\xa1'):
+            endian = '<'
+        elif magic in (b'\xa1\xb2\xc3\xd4', b'\xa1\xb2\x3c\x4d'):
+            endian = '>'
+        else:
+            raise ValueError(f"Unsupported capture format: {path}")
+        nanosecond = magic in (b'\x4d\x3c\xb2\xa1', b'\xa1\xb2\x3c\x4d')
+        divisor = 1e9 if nanosecond else 1e6
+        linktype = struct.unpack(endian + 'I', header[20:24])[0] & 0xFFFF
+
+        record = struct.Struct(endian + 'IIII')
+        while True:
+            rec = f.read(16)
+            if len(rec) < 16:
+                return
+            ts_sec, ts_frac, incl_len, _ = record.unpack(rec)
+            data = f.read(incl_len)
+            if len(data) < incl_len:
+                return
+            yield ts_sec + ts_frac / divisor, linktype, data
+
+
+# pcapng block types
+_PCAPNG_SHB = 0x0A0D0D0A
+_PCAPNG_IDB = 0x00000001
+_PCAPNG_SPB = 0x00000003
+_PCAPNG_EPB = 0x00000006
+_PCAPNG_IF_TSRESOL = 9
+
+
+def _read_pcapng(f, path):
+    """pcapng reader: section/interface headers, enhanced and simple packet blocks"""
+    endian = '<'
+    interfaces = []  # (linktype, snaplen, ticks per second)
+
+    while True:
+        head = f.read(8)
+        if len(head) < 8:
+            return
+
+        if head[:4] == b'\x0a\x0d\x0d\x0a':
+            # Section header: byte order comes from the magic that follows
+            magic = f.read(4)
+            if magic == b'\x4d\x3c\x2b\x1a':
+                endian = '<'
+            elif magic == b'\x1a\x2b\x3c\x4d':
+                endian = '>'
+            else:
+                raise ValueError(f"Corrupt pcapng section header: {path}")
+            block_len = struct.unpack(endian + 'I', head[4:8])[0]
+            f.seek(block_len - 12, 1)
+            interfaces = []
+            continue
+
+        block_type, block_len = struct.unpack(endian + 'II', head)
+        if block_len < 12:
+            raise ValueError(f"Corrupt pcapng block: {path}")
+        body = f.read(block_len - 8)
+        if len(body) < block_len - 8:
+            return
+        body = body[:-4]  # trailing block length
+
+        if block_type == _PCAPNG_IDB:
+            linktype, _, snaplen = struct.unpack_from(endian + 'HHI', body)
+            interfaces.append((linktype, snaplen, _pcapng_tsresol(body, 8, endian)))
+
+        elif block_type == _PCAPNG_EPB:
+            if_id, ts_high, ts_low, cap_len, _ = struct.unpack_from(endian + 'IIIII', body)
+            if if_id >= len(interfaces):
+                continue
+            linktype, _, ticks = interfaces[if_id]
+            yield ((ts_high << 32) | ts_low) / ticks, linktype, body[20:20 + cap_len]
+
+        elif block_type == _PCAPNG_SPB:
+            if not interfaces:
+                continue
+            linktype, snaplen, _ = interfaces[0]
+            orig_len = struct.unpack_from(endian + 'I', body)[0]
+            cap_len = min(orig_len, snaplen) if snaplen else orig_len
+            yield None, linktype, body[4:4 + cap_len]
+
+
+def _pcapng_tsresol(body, offset, endian):
+    """Timestamp ticks per second from an interface block's if_tsresol option"""
+    while offset + 4 <= len(body):
+        code, length = struct.unpack_from(endian + 'HH', body, offset)
+        if code == 0:
+            break
+        if code == _PCAPNG_IF_TSRESOL and length >= 1:
+            value = body[offset + 4]
+            return 2 ** (value & 0x7F) if value & 0x80 else 10 ** value
+        offset += 4 + ((length + 3) & ~3)
+    return 10 ** 6
+
+
+# ========================================================================
+# Backends
+# ========================================================================
+
+class ScapyCapture:
+    """Portable capture through scapy.all.sniff()"""
+
+    name = 'scapy'
+
+    def __init__(self, interface=None, bpf_filter='ip'):
+        self.interface = interface
+        self.bpf_filter = bpf_filter
+        self.sock = None
+        self.running = False
+        self.packets = 0
+
+    def set_filter(self, bpf_filter):
+        """Replace the filter on the open listen socket"""
+        self.bpf_filter = bpf_filter
+        if self.sock is None:
+            return
+        ins = self.sock.ins
+        if hasattr(ins, 'setfilter'):
+            ins.setfilter(bpf_filter)  # libpcap handle (Windows/BSD)
+        else:
+            from scapy.arch.linux import attach_filter
+            attach_filter(ins, bpf_filter, self.interface)
+
+    def run(self, handler):
+        from scapy.all import sniff, conf
+
+        def on_packet(packet):
+            self.packets += 1
+            info = packet_from_scapy(packet)
+            if info is not None:
+                handler(info)
+
+        self.running = True
+        self.sock = conf.L2listen(iface=self.interface, filter=self.bpf_filter)
+        try:
+            sniff(
+                opened_socket=self.sock,
+                prn=on_packet,
+                store=False,
+                stop_filter=lambda _: not self.running
+            )
+        finally:
+            self.sock.close()
+            self.sock = None
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        return {'backend': self.name, 'packets': self.packets}
+
+
+class AFPacketCapture:
+    """
+    Linux AF_PACKET capture over a memory-mapped TPACKET_V3 ring
+
+    The kernel fills whole blocks of frames; we walk each block in place,
+    parse only the IPv4/TCP/UDP header fields and hand the block back.
+    """
+
+    name = 'afpacket'
+
+    SOL_PACKET = 263
+    PACKET_RX_RING = 5
+    PACKET_STATISTICS = 6
+    PACKET_VERSION = 10
+    TPACKET_V3 = 2
+    TP_STATUS_KERNEL = 0
+    TP_STATUS_USER = 1
+
+    # struct tpacket3_hdr: next_offset, sec, nsec, snaplen, len, status, mac, net
+    _PKT_HDR = struct.Struct('=IIIIIIHH')
+
+    def __init__(self, interface=None, bpf_filter=None, block_size=1 << 20, block_count=64,
+                 frame_size=2048, block_timeout_ms=60):
+        if not hasattr(socket, 'AF_PACKET'):
+            raise OSError("AF_PACKET capture is only available on Linux")
+
+        self.interface = interface
+        self.bpf_filter = bpf_filter
+        self.block_size = block_size
+        self.block_count = block_count
+        self.running = False
+        self.packets = 0
+        self.kernel_packets = 0
+        self.kernel_drops = 0
+
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            self.sock.setsockopt(self.SOL_PACKET, self.PACKET_VERSION, self.TPACKET_V3)
+            req = struct.pack(
+                '=IIIIIII',
+                block_size,
+                block_count,
+                frame_size,
+                (block_size * block_count) // frame_size,
+                block_timeout_ms,
+                0,  # sizeof_priv
+                0   # feature_req_word
+            )
+            self.sock.setsockopt(self.SOL_PACKET, self.PACKET_RX_RING, req)
+            self.ring = mmap.mmap(self.sock.fileno(), block_size * block_count,
+                                  mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+            if bpf_filter:
+                self.set_filter(bpf_filter)
+            if interface:
+                self.sock.bind((interface, ETH_P_ALL))
+        except Exception:
+            self.sock.close()
+            raise
+
+    def set_filter(self, bpf_filter):
+        """Compile and attach a tcpdump-style filter to the socket"""
+        from scapy.arch.linux import attach_filter
+        attach_filter(self.sock, bpf_filter, self.interface)
+        self.bpf_filter = bpf_filter
+
+    def run(self, handler):
+        ring = self.ring
+        unpack_hdr = self._PKT_HDR.unpack_from
+        block_status = struct.Struct('=I')
+        block_info = struct.Struct('=II')
+        poller = select.poll()
+        poller.register(self.sock, select.POLLIN | select.POLLERR)
+
+        block = 0
+        self.running = True
+        try:
+            while self.running:
+                base = block * self.block_size
+                if not block_status.unpack_from(ring, base + 8)[0] & self.TP_STATUS_USER:
+                    poller.poll(200)
+                    continue
+
+                num_pkts, first = block_info.unpack_from(ring, base + 12)
+                offset = base + first
+                for _ in range(num_pkts):
+                    next_offset, sec, nsec, snaplen, _, _, mac, net = unpack_hdr(ring, offset)
+                    info = parse_ipv4(ring, offset + net, offset + mac + snaplen, sec + nsec / 1e9)
+                    if info is not None:
+                        handler(info)
+                    offset += next_offset
+                self.packets += num_pkts
+
+                # Hand the block back to the kernel
+                block_status.pack_into(ring, base + 8, self.TP_STATUS_KERNEL)
+                block = (block + 1) % self.block_count
+        finally:
+            self.running = False
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        """Packets seen by userspace plus kernel accept/drop counters"""
+        try:
+            # struct tpacket_stats_v3 (counters reset on every read)
+            raw = self.sock.getsockopt(self.SOL_PACKET, self.PACKET_STATISTICS, 12)
+            packets, drops, _ = struct.unpack('=III', raw)
+            self.kernel_packets += packets
+            self.kernel_drops += drops
+        except OSError:
+            pass
+        return {
+            'backend': self.name,
+            'packets': self.packets,
+            'kernel_packets': self.kernel_packets,
+            'kernel_drops': self.kernel_drops
+        }
+
+    def close(self):
+        self.ring.close()
+        self.sock.close()
+
+
+class PcapCapture:
+    """
+    Offline replay of a pcap/pcapng file through the same handler path
+
+    realtime=False replays as fast as possible; realtime=True sleeps to
+    reproduce the recorded inter-packet gaps (divided by speed). clock()
+    returns the capture time of the current packet so that detector
+    windows follow the recording, not the wall clock.
+    """
+
+    name = 'pcap'
+
+    def __init__(self, path, realtime=False, speed=1.0):
+        self.path = path
+        self.realtime = realtime
+        self.speed = speed
+        self.running = False
+        self.packets = 0
+        self.current_time = 0.0
+
+    def clock(self):
+        return self.current_time
+
+    def run(self, handler):
+        self.running = True
+        first_ts = None
+        started = time.monotonic()
+        for timestamp, linktype, frame in read_pcap(self.path):
+            if not self.running:
+                break
+            if timestamp is not None:
+                self.current_time = timestamp
+                if self.realtime:
+                    if first_ts is None:
+                        first_ts = timestamp
+                    delay = (timestamp - first_ts) / self.speed - (time.monotonic() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+            self.packets += 1
+            info = parse_frame(frame, linktype, timestamp)
+            if info is not None:
+                handler(info)
+        self.running = False
+
+    def stop(self):
+        self.running = False
+
+    def get_stats(self):
+        return {'backend': self.name, 'packets': self.packets}
+
+
+CAPTURE_BACKENDS = ('afpacket', 'scapy')
+
+
+def create_capture(backend, interface=None, bpf_filter='ip'):
+    """
+    Create a live capture backend, falling back to Scapy if the fast
+    path is unavailable (non-Linux, missing privileges, old kernel)
+    """
+    if backend == 'afpacket':
+        try:
+            return AFPacketCapture(interface=interface, bpf_filter=bpf_filter)
+        except Exception as e:
+            print(f"[CAPTURE] AF_PACKET ring unavailable ({e}), falling back to Scapy")
+    elif backend != 'scapy':
+        raise ValueError(f"Unknown capture backend: {backend} (choose from {', '.join(CAPTURE_BACKENDS)})")
+    return ScapyCapture(interface=interface, bpf_filter=bpf_filter)
@@ -0,0 +1,422 @@
+"""
+Attack Detector
+Per-source tracker state and detection rules for the IDS
+
+Owns syn_tracker / port_scan_tracker / connection_tracker. One instance
+runs inline in IDSEngine, or one per worker process in sharded mode
+(every packet from a given source IP reaches the same instance).
+
+Trackers are keyed by the integer source address and bounded: once
+max_sources is reached the least recently active source is evicted, so
+a spoofed-source flood cannot grow the process without limit. Records
+also expire as soon as they hold no live state (their windows are empty,
+or a connection count went idle); detect() drops due records a small
+slice at a time, so there is no periodic sweep and the trackers are only
+ever modified by the thread that processes packets.
+
+Addresses stay packed integers end to end: local, private, allowlist and
+denylist checks are PrefixTable lookups (CIDRs and IPv6 supported), and
+dotted strings are only produced when a detection is logged.
+
+With flow tracking (max_flows > 0) a FlowTable follows each inbound
+handshake, including our SYN-ACK / RST answers, to catch half-open scans,
+FIN/NULL/Xmas stealth scans and RST storms that single packets can't show.
+"""
+
+import time
+
+from capture import TCP_SYN, TCP_ACK, TCP_RST, TCP_FIN, TCP_PSH, TCP_URG
+from sliding_window import SlidingCounter, SlidingDistinctCounter
+from source_table import BoundedSourceTable, EXPIRY_SLICE, read_rss_bytes
+from flow_table import FlowTable
+from rules import load_rules
+from prefix_table import PrefixTable, PRIVATE_TABLE
+
+# is_candidate() results; outbound packets are our answers to a remote
+DIRECTION_INBOUND = 1
+DIRECTION_OUTBOUND = 2
+
+_SYN_ACK = TCP_SYN | TCP_ACK
+
+# Flag combinations no TCP stack sends without ACK: (type, confidence)
+_STEALTH_SCANS = {
+    0: ('null_scan', 90),
+    TCP_FIN: ('fin_scan', 85),
+    TCP_FIN | TCP_PSH | TCP_URG: ('xmas_scan', 90)
+}
+
+
+class SynTracker:
+    """Per-source SYN windows: packet count (flood) and distinct ports (scan)"""
+    
+    __slots__ = ('count', 'ports', 'last_seen')
+    
+    def __init__(self, flood_window, scan_window):
+        self.count = SlidingCounter(flood_window)
+        self.ports = SlidingDistinctCounter(scan_window)
+        self.last_seen = 0
+
+
+class AttackDetector:
+    """Stateful attack detection over parsed packets"""
+    
+    def __init__(self, local_ips=(), clock=time.monotonic, max_sources=100000, max_flows=200000,
+                 flow_syn_timeout=30, flow_idle_timeout=300, rules=None, allowlist=(), denylist=()):
+        self.local_ips = local_ips
+        # Remote CIDRs never reported / always reported on a new connection
+        self.allowlist = PrefixTable.from_cidrs(allowlist)
+        self.denylist = PrefixTable.from_cidrs(denylist)
+        self.clock = clock  # Seconds; windows use int(clock())
+        self.max_sources = max_sources
+        
+        # Thresholds, critical ports and ignored source ports (see rules.json)
+        self.apply_rules(rules or load_rules())
+        
+        # Attack detection tracking (sliding windows, expired per packet)
+        self.syn_tracker = BoundedSourceTable(
+            max_sources, self._new_syn_tracker,
+            lambda tracker: tracker.last_seen + max(tracker.count.window, tracker.ports.window))
+        self.port_scan_tracker = BoundedSourceTable(
+            max_sources, self._new_port_scan_window, lambda window: window.head_sec + window.window)
+        # Keyed by (src_addr << 16) | dst_port, value last_seen << 32 | count
+        self.connection_tracker = BoundedSourceTable(
+            max_sources, deadline=lambda value: (value >> 32) + self.SUSPICIOUS_CONNECTION_IDLE)
+        self.expired_at = None
+        
+        # Mapped snapshots serving tracker misses until snapshot_until (see snapshot.py)
+        self.snapshots = []
+        self.snapshot_until = None
+        
+        # Handshake state (None = flow tracking disabled)
+        self.flows = None
+        if max_flows:
+            self.flows = FlowTable(max_flows, max_sources, flow_syn_timeout, flow_idle_timeout, self.FLOW_WINDOW)
+    
+    def apply_rules(self, rules):
+        """
+        Switch to a compiled rule set (safe while packets are being processed)
+        
+        Per-packet code reads self.rules once; thresholds are plain
+        attributes. Sliding windows already tracking a source keep the
+        window length they were created with.
+        """
+        for attribute, value in rules.thresholds.items():
+            setattr(self, attribute, value)
+        self.CRITICAL_PORTS = rules.critical_ports
+        self.IGNORED_SOURCE_PORTS = rules.ignored_source_ports
+        self.rules = rules
+        if getattr(self, 'flows', None) is not None:
+            self.flows.window = self.FLOW_WINDOW
+    
+    def _new_syn_tracker(self):
+        return SynTracker(self.SYN_FLOOD_TIME_WINDOW, self.PORT_SCAN_TIME_WINDOW)
+    
+    def _new_port_scan_window(self):
+        return SlidingDistinctCounter(self.PORT_SCAN_TIME_WINDOW)
+    
+    @property
+    def local_ips(self):
+        return self._local_ips
+    
+    @local_ips.setter
+    def local_ips(self, ips):
+        """Keep the string set for callers and a prefix table (hosts or CIDRs) for the per-packet check"""
+        self._local_ips = set(ips)
+        self.local_table = PrefixTable.from_cidrs(self._local_ips)
+    
+    def _is_local_ip(self, addr):
+        """Check if an integer IPv4 address is local to this machine (or a local network)"""
+        return addr in self.local_table
+    
+    def _is_private_network(self, addr):
+        """Check if an integer IPv4 address is in a private / special-purpose range"""
+        return addr in PRIVATE_TABLE
+    
+    def detect_attack_type(self, packet):
+        """Detect type of attack from parsed packet - ONLY NEW INBOUND connections"""
+        direction = self.is_candidate(packet)
+        if not direction:
+            return None
+        return self.detect(packet, direction)
+    
+    def is_candidate(self, packet):
+        """
+        Stateless direction filter (safe to run before sharding)
+        
+        Returns:
+            DIRECTION_INBOUND for new inbound probes (and, with flow tracking,
+            inbound handshake / teardown / stealth segments),
+            DIRECTION_OUTBOUND for our SYN-ACK / RST answers when flows are
+            tracked, False for everything else
+        """
+        src_local = self._is_local_ip(packet.src_addr)
+        
+        # Skip transit (external -> external) and local-only traffic
+        if src_local == self._is_local_ip(packet.dst_addr):
+            return False
+        
+        if not packet.is_tcp:
+            return False
+        
+        flags = packet.flags
+        
+        # OUTBOUND: only our handshake answers matter (flow state, RST storms)
+        if src_local:
+            if self.flows is None or self.rules.ignored[packet.dst_port] or packet.dst_addr in self.allowlist:
+                return False
+            if flags & TCP_RST or flags & _SYN_ACK == _SYN_ACK:
+                return DIRECTION_OUTBOUND
+            return False
+        
+        if self.rules.ignored[packet.src_port] or packet.src_addr in self.allowlist:
+            return False
+        
+        if self.is_probe(packet):
+            return DIRECTION_INBOUND
+        
+        # Handshake completion (bare ACK), teardown and flag combinations
+        # without SYN/ACK (FIN, NULL, Xmas probes)
+        if self.flows is not None and (
+            flags & (TCP_FIN | TCP_RST) or not flags & _SYN_ACK or (flags & 0x3F == TCP_ACK and not packet.payload)
+        ):
+            return DIRECTION_INBOUND
+        
+        return False
+    
+    def is_probe(self, packet):
+        """Inbound SYN or packet to a critical port (what the per-source trackers count)"""
+        return bool(packet.flags & TCP_SYN) or self.rules.ports[packet.dst_port] is not None
+    
+    def detect(self, packet, direction=DIRECTION_INBOUND):
+        """Stateful detection for a packet that passed is_candidate()"""
+        now = int(self.clock())
+        if now != self.expired_at:
+            self._expire(now)
+        
+        if direction == DIRECTION_OUTBOUND:
+            return self._detect_rst_storm(packet) if self.flows is not None else None
+        
+        flow_info = self._track_flow(packet) if self.flows is not None else None
+        if not self.is_probe(packet):
+            return flow_info
+        return self._detect_probe(packet) or flow_info or self._detect_denylisted(packet)
+    
+    def _detect_probe(self, packet):
+        """Per-source SYN / port scan / critical port rules"""
+        src_addr = packet.src_addr
+        tcp_flags = packet.flags
+        
+        # Critical port probe detection (HTTP, HTTPS, SSH, etc)
+        port_rule = self.rules.ports[packet.dst_port]
+        if port_rule is not None:
+            result = self._detect_critical_port_probe(packet, src_addr, port_rule)
+            if result:
+                return result
+        
+        # SYN scan detection (nmap -sS)
+        if tcp_flags == TCP_SYN:
+            return self._detect_syn_scan(packet, src_addr)
+        
+        # Port scan detection (general)
+        return self._detect_port_scan(packet, src_addr)
+    
+    def _detect_syn_scan(self, packet, src_addr):
+        """Detect SYN scan (nmap stealth scan)"""
+        now = int(self.clock())
+        tracker = self.syn_tracker[src_addr]
+        ports = tracker.ports.add(packet.dst_port, now)
+        count = tracker.count.add(now)
+        tracker.last_seen = now
+        
+        # If many SYNs to different ports = port scan
+        if ports >= self.PORT_SCAN_THRESHOLD:
+            return {
+                'type': 'port_scan',
+                'tool': 'nmap',
+                'severity': 'high',
+                'confidence': 90,
+                'details': f"SYN scan detected: {ports} ports scanned in {self.PORT_SCAN_TIME_WINDOW}s"
+            }
+        
+        # If many SYNs to same port = SYN flood
+        if count >= self.SYN_FLOOD_THRESHOLD:
+            return {
+                'type': 'syn_flood',
+                'tool': 'unknown',
+                'severity': 'critical',
+                'confidence': 95,
+                'details': f"SYN flood: {count} packets in {self.SYN_FLOOD_TIME_WINDOW}s"
+            }
+        
+        return None
+    
+    def _detect_port_scan(self, packet, src_addr):
+        """Detect port scanning patterns"""
+        now = int(self.clock())
+        window = self.port_scan_tracker[src_addr]
+        
+        # Distinct ports hit in time window
+        distinct_ports = window.add(packet.dst_port, now)
+        
+        if distinct_ports >= self.PORT_SCAN_THRESHOLD:
+            # Detect scan type by port pattern
+            sequential = self._is_sequential_scan(window.values(now))
+            
+            return {
+                'type': 'port_scan',
+                'tool': 'nmap' if sequential else 'masscan',
+                'severity': 'high',
+                'confidence': 85 if sequential else 70,
+                'details': f"Port scan: {distinct_ports} ports in {self.PORT_SCAN_TIME_WINDOW}s"
+            }
+        
+        return None
+    
+    def _detect_critical_port_probe(self, packet, src_addr, port_rule):
+        """Detect suspicious connections to critical ports"""
+        # Track connections to this port from this IP
+        connections = self.connection_tracker.increment_at((src_addr << 16) | port_rule.port, int(self.clock()))
+        
+        # Detect reconnaissance/probing (tool and severity precompiled per port)
+        if connections >= self.SUSPICIOUS_CONNECTION_THRESHOLD:
+            return dict(port_rule.probe)
+        
+        # Log first attempt to critical ports (reconnaissance)
+        if connections == 1 and packet.flags == TCP_SYN:
+            return dict(port_rule.reconnaissance)
+        
+        return None
+    
+    def _detect_denylisted(self, packet):
+        """New connection from a denylisted network"""
+        if packet.flags & _SYN_ACK != TCP_SYN or packet.src_addr not in self.denylist:
+            return None
+        return {
+            'type': 'denylisted_source',
+            'tool': 'unknown',
+            'severity': 'high',
+            'confidence': 100,
+            'details': f"Connection attempt from denylisted network (port {packet.dst_port})"
+        }
+    
+    def _track_flow(self, packet):
+        """Update handshake state; detect stealth and half-open scans"""
+        now = int(self.clock())
+        stats = self.flows.inbound(packet, now)
+        flags = packet.flags
+        
+        # FIN / NULL / Xmas: no SYN, ACK or RST, never part of a real connection
+        if not flags & (_SYN_ACK | TCP_RST):
+            ports = stats.add_stealth_port(packet.dst_port)
+            if ports >= self.STEALTH_SCAN_THRESHOLD:
+                scan_type, confidence = _STEALTH_SCANS.get(flags & 0x3F, ('stealth_scan', 75))
+                return {
+                    'type': scan_type,
+                    'tool': 'nmap',
+                    'severity': 'high',
+                    'confidence': confidence,
+                    'details': f"Stealth scan ({scan_type.split('_')[0].upper()} probes): "
+                               f"{ports} ports in {self.FLOW_WINDOW}s"
+                }
+            return None
+        
+        # Half-open: handshakes answered but dropped before the final ACK
+        abandoned = stats.abandoned
+        if (abandoned >= self.HALF_OPEN_THRESHOLD
+                and abandoned >= self.HALF_OPEN_RATIO * (abandoned + stats.completed)):
+            return {
+                'type': 'half_open_scan',
+                'tool': 'nmap',
+                'severity': 'high',
+                'confidence': 85,
+                'details': f"Half-open scan: {abandoned} handshakes abandoned, "
+                           f"{stats.completed} completed in {self.FLOW_WINDOW}s"
+            }
+        
+        return None
+    
+    def _detect_rst_storm(self, packet):
+        """Our RSTs back to one remote (closed-port answers to a scan or flood)"""
+        stats = self.flows.outbound(packet, int(self.clock()))
+        
+        if packet.flags & TCP_RST and stats.rsts_sent >= self.RST_STORM_THRESHOLD:
+            return {
+                'type': 'rst_storm',
+                'tool': 'scanner',
+                'severity': 'medium',
+                'confidence': 75,
+                'details': f"RST storm: {stats.rsts_sent} resets sent in {self.FLOW_WINDOW}s "
+                           f"({stats.refused} refused connection attempts)",
+                # Detected on our own packet: the remote end (dst) is the attacker
+                'outbound': True
+            }
+        
+        return None
+    
+    def _is_sequential_scan(self, ports):
+        """Check if ports are sequential (typical nmap behavior)"""
+        sorted_ports = sorted(ports)
+        sequential_count = 0
+        for i in range(len(sorted_ports) - 1):
+            if sorted_ports[i+1] - sorted_ports[i] <= 10:
+                sequential_count += 1
+        return sequential_count / len(sorted_ports) > 0.5
+    
+    def _expire(self, now):
+        """
+        Drop up to EXPIRY_SLICE due tracker records; the second only counts
+        as done once none are left, so later packets continue the work
+        """
+        limit = EXPIRY_SLICE
+        for table in (self.syn_tracker, self.port_scan_tracker, self.connection_tracker):
+            limit -= table.expire(now, limit)
+            if not limit:
+                return
+        self.expired_at = now
+        if self.snapshot_until is not None and now > self.snapshot_until:
+            self.detach_snapshots()
+    
+    def attach_snapshots(self, snapshots):
+        """Restore lazily from mapped snapshots (newest first); call before packets flow"""
+        from snapshot import attach_snapshots
+        self.detach_snapshots()
+        self.snapshots = list(snapshots)
+        self.snapshot_until = attach_snapshots(self, self.snapshots)
+    
+    def detach_snapshots(self):
+        """Stop consulting snapshots and unmap them (nothing in them is live any more)"""
+        tables = [self.syn_tracker, self.port_scan_tracker, self.connection_tracker]
+        if self.flows is not None:
+            tables.append(self.flows.sources)
+        for table in tables:
+            table.loader = None
+        for snapshot in self.snapshots:
+            snapshot.close()
+        self.snapshots = []
+        self.snapshot_until = None
+    
+    def cleanup(self):
+        """Expire everything due now (detect() does this incrementally; call from the packet thread)"""
+        now = int(self.clock())
+        while self.expired_at != now:
+            self._expire(now)
+        if self.flows is not None:
+            self.flows.cleanup(now)
+    
+    def get_memory_stats(self):
+        """Tracker sizes, evictions and approximate footprint"""
+        tables = {
+            'syn_tracker': self.syn_tracker.get_stats(),
+            'port_scan_tracker': self.port_scan_tracker.get_stats(),
+            'connection_tracker': self.connection_tracker.get_stats()
+        }
+        flows = self.flows.get_stats() if self.flows is not None else None
+        return {
+            'max_sources': self.max_sources,
+            'tables': tables,
+            'flows': flows,
+            'snapshots': len(self.snapshots),
+            'estimated_bytes': sum(table['estimated_bytes'] for table in tables.values())
+                               + (flows['estimated_bytes'] if flows else 0),
+            'rss_bytes': read_rss_bytes()
+        }
@@ -0,0 +1,124 @@
+"""
+Detection Enrichment
+GeoIP lookup and payload decoding for IDS detections, off the capture thread
+
+The capture thread queues detections with raw header fields and the raw
+payload sample. The AttackLogWriter thread enriches only the first
+detection of each coalesced group (the row that will actually be
+written), and GeoIP answers are cached per source IP, so enrichment cost
+follows distinct attackers instead of packets.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+from services.geoip_service import geoip_service
+from config import settings
+from capture import format_tcp_flags, PROTO_TCP, PROTO_UDP, PROTO_ICMP
+
+_PROTOCOL_NAMES = {PROTO_TCP: 'TCP', PROTO_UDP: 'UDP', PROTO_ICMP: 'ICMP'}
+
+
+def sanitize_string(s):
+    """Remove NULL bytes from string for PostgreSQL compatibility"""
+    if s is None:
+        return None
+    return str(s).replace('\x00', '')
+
+
+def decode_payload(sample):
+    """Payload bytes -> text safe for AttackLog.payload_sample"""
+    if not sample:
+        return ""
+    try:
+        # Decode and remove NULL bytes (PostgreSQL TEXT fields cannot contain \x00)
+        return sample.decode('utf-8', errors='ignore').replace('\x00', '')
+    except Exception:
+        return repr(sample)
+
+
+class GeoIPCache:
+    """Per-IP LRU cache with TTL in front of a GeoIP lookup function"""
+
+    def __init__(self, lookup, max_entries=50000, ttl_seconds=3600, clock=time.monotonic):
+        self.lookup = lookup
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.clock = clock
+        self.entries = OrderedDict()  # ip -> (expires_at, geo_info)
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'errors': 0}
+
+    def get(self, ip):
+        now = self.clock()
+        with self.lock:
+            entry = self.entries.get(ip)
+            if entry is not None and entry[0] > now:
+                self.entries.move_to_end(ip)
+                self.stats['hits'] += 1
+                return entry[1]
+            self.stats['misses'] += 1
+
+        try:
+            geo_info = self.lookup(ip) or {}
+        except Exception as e:
+            # Don't cache failures; the next detection retries
+            self.stats['errors'] += 1
+            print(f"[ENRICH] GeoIP lookup failed for {ip}: {e}")
+            return {}
+
+        with self.lock:
+            self.entries[ip] = (now + self.ttl, geo_info)
+            self.entries.move_to_end(ip)
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return geo_info
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class DetectionEnricher:
+    """Turn a queued raw detection into the AttackLog / Elasticsearch document"""
+
+    def __init__(self, lookup=None, max_entries=settings.IDS_GEOIP_CACHE_SIZE,
+                 ttl_seconds=settings.IDS_GEOIP_CACHE_TTL_SECONDS):
+        self.geo = GeoIPCache(lookup or geoip_service.lookup, max_entries, ttl_seconds)
+        self.enriched = 0
+
+    def enrich(self, detection):
+        """Fill GeoIP, decoded payload, flags and raw_packet_info in place (idempotent)"""
+        if 'payload_sample' in detection:
+            return detection
+
+        geo_info = self.geo.get(detection['source_ip'])
+        protocol = detection['protocol']
+        flags = format_tcp_flags(detection['tcp_flags']) if protocol == PROTO_TCP else ""
+
+        detection.update({
+            'protocol': _PROTOCOL_NAMES.get(protocol, 'OTHER'),
+            'flags': sanitize_string(flags),
+            'payload_sample': decode_payload(detection.pop('payload')),
+            'country': sanitize_string(geo_info.get('country')),
+            'city': sanitize_string(geo_info.get('city')),
+            'latitude': str(geo_info.get('latitude', 0)),
+            'longitude': str(geo_info.get('longitude', 0)),
+            'detected_tool': sanitize_string(detection['detected_tool']),
+            'raw_packet_info': {
+                'src_ip': detection['source_ip'],
+                'dst_ip': detection['target_ip'],
+                'src_port': detection['source_port'],
+                'dst_port': detection['target_port'],
+                'details': sanitize_string(detection.pop('details'))
+            }
+        })
+        del detection['tcp_flags']
+        self.enriched += 1
+        return detection
+
+    def get_stats(self):
+        stats = {'enriched': self.enriched, 'geoip_cache_size': len(self.geo)}
+        stats.update({f'geoip_{name}': value for name, value in self.geo.stats.items()})
+        return stats
@@ -0,0 +1,202 @@
+"""
+TCP Flow Table
+Handshake state per inbound connection for half-open and stealth scan detection
+
+Flows are keyed by one packed integer (remote addr, local addr, remote
+port, local port) and the value is a single int: last-seen second << 2 |
+state. Half-open flows (SYN seen, handshake not completed) and established
+flows live in two insertion-ordered tables with their own idle timeout.
+Every update moves the flow to the back, so expiry only ever pops from
+the front. It runs from the packet path once per clock second, at most
+EXPIRY_SLICE flows per packet until nothing due is left, and each flow
+expires once: amortized O(1) per packet, no periodic full scans.
+
+max_flows caps both tables together (oldest half-open flow evicted
+first). Per-remote outcomes (handshakes completed / abandoned, stealth
+probe ports, RSTs we answered with) are counted over a tumbling window in
+a BoundedSourceTable and read by AttackDetector.
+"""
+
+from collections import OrderedDict
+import sys
+
+from capture import TCP_SYN, TCP_ACK, TCP_RST, TCP_FIN
+from source_table import BoundedSourceTable, EXPIRY_SLICE
+
+FLOW_SYN = 1          # SYN received
+FLOW_SYN_ACK = 2      # ...and answered by us
+FLOW_ESTABLISHED = 3  # handshake completed by the remote's ACK
+
+_SYN_ACK = TCP_SYN | TCP_ACK
+
+
+def flow_key(remote_addr, remote_port, local_addr, local_port):
+    """Pack an inbound 4-tuple into one int"""
+    return (remote_addr << 64) | (local_addr << 32) | (remote_port << 16) | local_port
+
+
+class FlowSourceStats:
+    """Per-remote flow outcomes over the current window"""
+
+    __slots__ = ('window_start', 'opened', 'completed', 'abandoned', 'refused', 'rsts_sent', 'stealth_ports')
+
+    def __init__(self):
+        self.window_start = 0
+        self.reset(0)
+
+    def reset(self, now):
+        self.window_start = now
+        self.opened = 0
+        self.completed = 0
+        self.abandoned = 0  # SYN never followed by the final ACK (timeout or remote RST)
+        self.refused = 0    # we answered the SYN with RST (closed port)
+        self.rsts_sent = 0
+        self.stealth_ports = None
+
+    def add_stealth_port(self, port):
+        """Record a FIN/NULL/Xmas probe; return distinct ports probed"""
+        if self.stealth_ports is None:
+            self.stealth_ports = {port}
+        else:
+            self.stealth_ports.add(port)
+        return len(self.stealth_ports)
+
+
+class FlowTable:
+    """Bounded TCP handshake tracker with per-state idle timeouts"""
+
+    def __init__(self, max_flows=200000, max_sources=100000, syn_timeout=30, idle_timeout=300, window=60):
+        self.max_flows = max_flows
+        self.syn_timeout = syn_timeout
+        self.idle_timeout = idle_timeout
+        self.window = window
+        self.half_open = OrderedDict()    # key -> last_seen << 2 | state
+        self.established = OrderedDict()
+        # A remote's stats are dead once its window is over and a full window passed without traffic
+        self.sources = BoundedSourceTable(max_sources, FlowSourceStats,
+                                          lambda stats: stats.window_start + 2 * self.window)
+        self.stats = {'opened': 0, 'completed': 0, 'expired': 0, 'evicted': 0}
+        self.expired_at = None
+
+    def __len__(self):
+        return len(self.half_open) + len(self.established)
+
+    def source(self, remote_addr, now):
+        """Window stats for a remote address (rolled over when the window ended)"""
+        stats = self.sources[remote_addr]
+        if now - stats.window_start >= self.window:
+            stats.reset(now)
+        return stats
+
+    def inbound(self, packet, now):
+        """Update state for a remote -> local segment; return the remote's stats"""
+        if now != self.expired_at:
+            self.expire(now)
+        key = flow_key(packet.src_addr, packet.src_port, packet.dst_addr, packet.dst_port)
+        stats = self.source(packet.src_addr, now)
+        flags = packet.flags
+
+        if flags & TCP_RST:
+            # Remote tears the handshake down (nmap -sS answers our SYN-ACK with RST)
+            if self.half_open.pop(key, None) is not None:
+                stats.abandoned += 1
+            else:
+                self.established.pop(key, None)
+        elif flags & _SYN_ACK == _SYN_ACK:
+            pass  # answer to a connection we opened, not tracked
+        elif flags & TCP_SYN:
+            if key in self.half_open:
+                self.half_open[key] = (now << 2) | (self.half_open[key] & 3)  # retransmit
+                self.half_open.move_to_end(key)
+            elif key not in self.established:
+                self._insert(self.half_open, key, (now << 2) | FLOW_SYN)
+                stats.opened += 1
+                self.stats['opened'] += 1
+        elif flags & TCP_ACK:
+            if self.half_open.pop(key, None) is not None:
+                self._insert(self.established, key, (now << 2) | FLOW_ESTABLISHED)
+                stats.completed += 1
+                self.stats['completed'] += 1
+            elif key in self.established:
+                if flags & TCP_FIN:
+                    del self.established[key]
+                else:
+                    self.established[key] = (now << 2) | FLOW_ESTABLISHED
+                    self.established.move_to_end(key)
+        return stats
+
+    def outbound(self, packet, now):
+        """Update state for our answer (SYN-ACK / RST) to a remote; return the remote's stats"""
+        if now != self.expired_at:
+            self.expire(now)
+        key = flow_key(packet.dst_addr, packet.dst_port, packet.src_addr, packet.src_port)
+        stats = self.source(packet.dst_addr, now)
+        flags = packet.flags
+
+        if flags & TCP_RST:
+            stats.rsts_sent += 1
+            if self.half_open.pop(key, None) is not None:
+                stats.refused += 1
+            else:
+                self.established.pop(key, None)
+        elif flags & _SYN_ACK == _SYN_ACK and key in self.half_open:
+            self.half_open[key] = (now << 2) | FLOW_SYN_ACK
+            self.half_open.move_to_end(key)
+        return stats
+
+    def _insert(self, table, key, value):
+        table[key] = value
+        if len(self.half_open) + len(self.established) > self.max_flows:
+            victim = self.half_open if self.half_open else self.established
+            victim.popitem(last=False)
+            self.stats['evicted'] += 1
+
+    def expire(self, now, limit=EXPIRY_SLICE):
+        """
+        Drop up to limit flows idle past their timeout, oldest first, then
+        remotes whose window is over
+
+        Half-open flows that time out count as abandoned handshakes. The
+        second is only marked done once nothing due is left, so a burst of
+        timeouts is spread over the following packets.
+        """
+        expired = 0
+        for table, timeout in ((self.half_open, self.syn_timeout), (self.established, self.idle_timeout)):
+            cutoff = (now - timeout) << 2
+            while table and expired < limit:
+                key, value = next(iter(table.items()))
+                if value >= cutoff:
+                    break
+                del table[key]
+                expired += 1
+                if table is self.half_open:
+                    stats = self.sources.entries.get(key >> 64)
+                    if stats is not None and stats.window_start <= value >> 2:
+                        stats.abandoned += 1
+        self.stats['expired'] += expired
+        if expired < limit and self.sources.expire(now, limit - expired) < limit - expired:
+            self.expired_at = now
+        return expired
+
+    def cleanup(self, now):
+        """Expire everything due now (the packet path does this in slices)"""
+        while self.expired_at != now:
+            self.expire(now)
+
+    def estimate_bytes(self):
+        """Containers plus packed key/value ints"""
+        flows = len(self)
+        per_flow = sys.getsizeof(1 << 95) + sys.getsizeof(1 << 40)
+        return (sys.getsizeof(self.half_open) + sys.getsizeof(self.established)
+                + flows * per_flow + self.sources.estimate_bytes())
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update({
+            'half_open': len(self.half_open),
+            'established': len(self.established),
+            'max_flows': self.max_flows,
+            'sources': len(self.sources),
+            'estimated_bytes': self.estimate_bytes()
+        })
+        return stats
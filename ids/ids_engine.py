@@ -1,15 +1,15 @@
 #!/usr/bin/env python3
 """
 Pandora IDS Engine
-Network packet sniffer and attack detector using Scapy
+Network packet sniffer and attack detector (AF_PACKET ring or Scapy)
 Requires: sudo/admin privileges
 """
 
-from scapy.all import sniff, IP, TCP, UDP, ICMP
-from collections import defaultdict, deque
-from datetime import datetime, timedelta
+from datetime import datetime
 import threading
+import signal
 import time
+import argparse
 import sys
 import os
 
@@ -17,57 +17,90 @@ import os
 backend_admin_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend-admin'))
 sys.path.insert(0, backend_admin_dir)
 
-from database.database import SessionLocal
-from models.attack import AttackLog
-from services.geoip_service import geoip_service
-from services.elasticsearch_service import elasticsearch_service
 from config import settings
+from attack_writer import AttackLogWriter
+from capture import create_capture, PcapCapture, CAPTURE_BACKENDS
+from enrichment import decode_payload
+from detector import AttackDetector, DIRECTION_INBOUND
+from rules import RuleFile, DEFAULT_RULES_FILE
+from sketches import TrafficSketch
+from pipeline import ShardedPipeline
+from bpf_filter import build_bpf_filter, read_rx_packets
+from stats_server import StatsServer
+from metrics import registry, PACKETS_FILTERED, PACKETS_BLOCKED, HANDLER_ERRORS, HANDLER_SECONDS, DETECTIONS
+from active_response import ActiveResponder
+from snapshot import SnapshotManager, snapshot_paths, DEFAULT_SNAPSHOT_FILE
+
 
 class IDSEngine:
     """Intrusion Detection System Engine"""
     
-    def __init__(self, interface=None, ports_to_monitor='all'):
+    def __init__(self, interface=None, ports_to_monitor='all', capture_backend=settings.IDS_CAPTURE_BACKEND,
+                 workers=settings.IDS_DETECTOR_WORKERS, local_ips=None, writer=None):
         # Auto-detect interface if not specified
         if interface is None:
             interface = self._detect_interface()
         self.interface = interface
         self.ports_to_monitor = ports_to_monitor
-        
-        # Get local network info
-        self.local_ips = self._get_local_ips()
+        self.capture_backend = capture_backend
+        self.capture = None
+        self.workers = workers
+        self.pipeline = None
+        self.bpf_filter = None
+        self.filter_lock = threading.Lock()
+        self.rx_baseline = None
+        self.kernel_accepted_baseline = 0
+        
+        # Get local network info (fixed when given, e.g. the victim addresses of a replayed capture)
+        self.fixed_local_ips = local_ips is not None
+        self.local_ips = (set(local_ips) if self.fixed_local_ips else self._get_local_ips()) \
+            | set(settings.ids_local_networks_list)
         print(f"[INIT] Local IPs detected: {', '.join(self.local_ips)}")
         
-        # Attack detection tracking
-        self.syn_tracker = defaultdict(lambda: {'count': 0, 'last_seen': None, 'ports': set()})
-        self.port_scan_tracker = defaultdict(lambda: deque(maxlen=100))
-        self.connection_tracker = defaultdict(int)
-        
-        # Critical ports to monitor (common attack targets)
-        self.CRITICAL_PORTS = {
-            22: 'SSH',
-            23: 'Telnet',
-            80: 'HTTP',
-            443: 'HTTPS',
-            3306: 'MySQL',
-            5432: 'PostgreSQL',
-            3389: 'RDP',
-            21: 'FTP',
-            25: 'SMTP',
-            8001: 'Backend-User',
-            8002: 'Backend-Admin',
-            5000: 'Central-Monitor'
+        # Detection state and rules (inline, or one per worker process)
+        self.detector_options = {
+            'max_sources': settings.IDS_MAX_TRACKED_SOURCES,
+            'max_flows': settings.IDS_MAX_TRACKED_FLOWS if settings.IDS_FLOW_TRACKING else 0,
+            'flow_syn_timeout': settings.IDS_FLOW_SYN_TIMEOUT_SECONDS,
+            'flow_idle_timeout': settings.IDS_FLOW_IDLE_TIMEOUT_SECONDS,
+            'allowlist': settings.ids_allowlist,
+            'denylist': settings.ids_denylist
         }
+        self.rule_file = RuleFile(settings.IDS_RULES_FILE or DEFAULT_RULES_FILE)
+        self.detector = AttackDetector(self.local_ips, rules=self.rule_file.load(), **self.detector_options)
+        print(f"[RULES] Loaded {self.rule_file.path} (version {self.detector.rules.version})")
+        
+        # Constant-memory sketches for volumetric / distributed attacks (capture process)
+        self.sketch = None
+        if settings.IDS_SKETCHES_ENABLED:
+            self.sketch = TrafficSketch(window_seconds=settings.IDS_SKETCH_WINDOW_SECONDS,
+                                        top_k=settings.IDS_SKETCH_TOP_K)
+        
+        # Optional kernel blocking of high-confidence attackers (started with live capture only)
+        self.responder = ActiveResponder() if settings.IDS_ACTIVE_RESPONSE else None
+        
+        # Batched attack log writer (keeps DB round-trips off the sniff thread)
+        self.writer = writer if writer is not None else AttackLogWriter(responder=self.responder)
+        self.writer.start()
         
-        # Thresholds (more sensitive)
-        self.PORT_SCAN_THRESHOLD = 3  # ports in time_window
-        self.PORT_SCAN_TIME_WINDOW = 60  # seconds
-        self.SYN_FLOOD_THRESHOLD = 20  # SYNs in time_window
-        self.SYN_FLOOD_TIME_WINDOW = 10  # seconds
-        self.SUSPICIOUS_CONNECTION_THRESHOLD = 5  # connections to same port
+        # Tracker snapshots across restarts (live capture only; set up in start())
+        self.snapshots = None
         
-        # Cleanup thread
-        self.cleanup_thread = threading.Thread(target=self._cleanup_old_data, daemon=True)
-        self.cleanup_thread.start()
+        # Periodic memory / writer report (read-only: trackers expire on the packet path)
+        self.report_thread = threading.Thread(target=self._report_stats, daemon=True)
+        self.report_thread.start()
+        
+        # Local IP watcher (keeps the kernel prefilter in sync)
+        self.local_ip_thread = threading.Thread(target=self._watch_local_ips, daemon=True)
+        if not self.fixed_local_ips:
+            self.local_ip_thread.start()
+        
+        # Rule file watcher (hot reload without restarting capture)
+        self.rules_thread = threading.Thread(target=self._watch_rules, daemon=True)
+        self.rules_thread.start()
+        
+        self.stats_server = StatsServer(self, settings.IDS_STATS_HOST, settings.IDS_STATS_PORT)
+        registry.register_collector(self.collect_metrics)
     
     def _detect_interface(self):
         """Auto-detect network interface"""
@@ -135,367 +168,278 @@ class IDSEngine:
         
         return local_ips
     
-    def _is_local_ip(self, ip):
-        """Check if IP is local to this machine"""
-        return ip in self.local_ips
+    def build_filter(self):
+        """Compile the inbound-traffic rules into a BPF filter expression"""
+        return build_bpf_filter(self.local_ips, self.detector.CRITICAL_PORTS, self.detector.IGNORED_SOURCE_PORTS,
+                                track_flows=self.detector.flows is not None)
     
-    def _is_private_network(self, ip):
-        """Check if IP is in private network range"""
-        # Private IP ranges: 10.x.x.x, 172.16-31.x.x, 192.168.x.x
-        parts = ip.split('.')
-        if len(parts) != 4:
-            return False
-        
-        try:
-            first = int(parts[0])
-            second = int(parts[1])
+    def refresh_filter(self):
+        """Regenerate the kernel prefilter and re-attach it to the running capture"""
+        with self.filter_lock:
+            new_filter = self.build_filter()
+            if new_filter == self.bpf_filter:
+                return
+            self.bpf_filter = new_filter
             
-            if first == 10:
-                return True
-            if first == 172 and 16 <= second <= 31:
-                return True
-            if first == 192 and second == 168:
-                return True
-        except:
-            pass
-        
-        return False
+            if self.capture is not None and hasattr(self.capture, 'set_filter'):
+                try:
+                    self.capture.set_filter(new_filter)
+                    self._reset_filter_stats()
+                    print(f"[FILTER] Kernel prefilter updated: {new_filter}")
+                except Exception as e:
+                    print(f"[FILTER] Failed to attach prefilter: {e}")
     
-    def detect_attack_type(self, packet):
-        """Detect type of attack from packet - ONLY NEW INBOUND connections"""
-        if not packet.haslayer(IP):
-            return None
-        
-        src_ip = packet[IP].src
-        dst_ip = packet[IP].dst
-        
-        # CRITICAL: Only monitor INBOUND traffic (external -> local)
-        # Skip if source is local (this is OUTBOUND traffic)
-        if self._is_local_ip(src_ip):
-            return None
-        
-        # Skip if destination is NOT local (this is transit traffic)
-        if not self._is_local_ip(dst_ip):
-            return None
-        
-                
-        if not packet.haslayer(TCP):
-            return None
-        
+    def set_critical_ports(self, critical_ports):
+        """Replace the critical port map ({port: name or rule dict}) and regenerate the prefilter"""
+        if self.pipeline is not None:
+            # Worker detectors only follow the rule file; changing the capture
+            # process alone would make inline and sharded detection disagree
+            raise RuntimeError(f"{self.workers} detector workers running: "
+                               f"change critical ports in {self.rule_file.path} instead")
+        self.detector.apply_rules(self.detector.rules.with_critical_ports(critical_ports))
+        self.refresh_filter()
     
-        tcp_flags = packet[TCP].flags
-        src_port = packet[TCP].sport
-        dst_port = packet[TCP].dport
-        
-        if src_port in [53, 80, 443, 8080, 8443, 25, 587]:
-            return None
-        
-        has_syn = 'S' in str(tcp_flags)
-        is_to_critical_port = dst_port in self.CRITICAL_PORTS
-        
-        if not has_syn and not is_to_critical_port:
-            return None
-        
-        # Critical port probe detection (HTTP, HTTPS, SSH, etc)
-        if dst_port in self.CRITICAL_PORTS:
-            result = self._detect_critical_port_probe(packet, src_ip, dst_port)
-            if result:
-                return result
-        
-        # SYN scan detection (nmap -sS)
-        if packet[TCP].flags == 'S':
-            return self._detect_syn_scan(packet, src_ip)
-        
-        # Port scan detection (general)
-        return self._detect_port_scan(packet, src_ip)
+    def _watch_rules(self):
+        """Recompile the rule file when it changes; swap rules and prefilter atomically"""
+        while True:
+            time.sleep(settings.IDS_RULES_RELOAD_SECONDS)
+            rules = self.rule_file.poll()
+            if rules is None:
+                continue
+            self.detector.apply_rules(rules)
+            self.refresh_filter()
+            print(f"[RULES] Reloaded {self.rule_file.path} (version {rules.version}, "
+                  f"{len(rules.critical_ports)} critical ports)")
     
-    def _detect_syn_scan(self, packet, src_ip):
-        """Detect SYN scan (nmap stealth scan)"""
-        tracker = self.syn_tracker[src_ip]
-        tracker['ports'].add(packet[TCP].dport)
-        tracker['count'] += 1
-        tracker['last_seen'] = datetime.now()
-        
-        # If many SYNs to different ports = port scan
-        if len(tracker['ports']) >= self.PORT_SCAN_THRESHOLD:
-            return {
-                'type': 'port_scan',
-                'tool': 'nmap',
-                'severity': 'high',
-                'confidence': 90,
-                'details': f"SYN scan detected: {len(tracker['ports'])} ports scanned"
-            }
-        
-        # If many SYNs to same port = SYN flood
-        if tracker['count'] >= self.SYN_FLOOD_THRESHOLD:
-            return {
-                'type': 'syn_flood',
-                'tool': 'unknown',
-                'severity': 'critical',
-                'confidence': 95,
-                'details': f"SYN flood: {tracker['count']} packets"
-            }
-        
-        return None
+    def _watch_local_ips(self):
+        """Periodically re-read local IPs; regenerate the prefilter when they change"""
+        while True:
+            time.sleep(settings.IDS_LOCAL_IP_REFRESH_SECONDS)
+            local_ips = self._get_local_ips() | set(settings.ids_local_networks_list)
+            if local_ips != self.local_ips:
+                print(f"[INIT] Local IPs changed: {', '.join(sorted(local_ips))}")
+                self.local_ips = local_ips
+                self.detector.local_ips = local_ips
+                self.refresh_filter()
     
-    def _detect_port_scan(self, packet, src_ip):
-        """Detect port scanning patterns"""
-        dst_port = packet[TCP].dport
-        self.port_scan_tracker[src_ip].append({
-            'port': dst_port,
-            'time': datetime.now()
-        })
-        
-        # Check if multiple ports hit in time window
-        recent_ports = set()
-        cutoff_time = datetime.now() - timedelta(seconds=self.PORT_SCAN_TIME_WINDOW)
-        
-        for entry in self.port_scan_tracker[src_ip]:
-            if entry['time'] > cutoff_time:
-                recent_ports.add(entry['port'])
-        
-        if len(recent_ports) >= self.PORT_SCAN_THRESHOLD:
-            # Detect scan type by port pattern
-            sequential = self._is_sequential_scan(recent_ports)
-            
-            return {
-                'type': 'port_scan',
-                'tool': 'nmap' if sequential else 'masscan',
-                'severity': 'high',
-                'confidence': 85 if sequential else 70,
-                'details': f"Port scan: {len(recent_ports)} ports in {self.PORT_SCAN_TIME_WINDOW}s"
-            }
-        
-        return None
+    def _reset_filter_stats(self):
+        """Start a new accept/drop measurement window for the current filter"""
+        self.rx_baseline = read_rx_packets(self.interface)
+        capture_stats = self.capture.get_stats() if self.capture else {}
+        self.kernel_accepted_baseline = capture_stats.get('kernel_packets', capture_stats.get('packets', 0))
     
-    def _detect_critical_port_probe(self, packet, src_ip, dst_port):
-        """Detect suspicious connections to critical ports"""
-        port_name = self.CRITICAL_PORTS.get(dst_port, 'Unknown')
-        
-        # Track connections to this port from this IP
-        key = f"{src_ip}:{dst_port}"
-        self.connection_tracker[key] += 1
-        
-        # Detect reconnaissance/probing
-        if self.connection_tracker[key] >= self.SUSPICIOUS_CONNECTION_THRESHOLD:
-            # Determine tool and severity based on port
-            tool = 'unknown'
-            severity = 'medium'
-            
-            if dst_port == 23:
-                tool = 'telnet'
-                severity = 'high'
-            elif dst_port in [80, 443]:
-                tool = 'http_probe'
-                severity = 'medium'
-            elif dst_port == 22:
-                tool = 'ssh_probe'
-                severity = 'high'
-            elif dst_port in [3306, 5432]:
-                tool = 'db_probe'
-                severity = 'high'
-            elif dst_port == 3389:
-                tool = 'rdp_probe'
-                severity = 'critical'
-            
-            return {
-                'type': f'{port_name.lower()}_probe',
-                'tool': tool,
-                'severity': severity,
-                'confidence': 85,
-                'details': f"Multiple connection attempts to {port_name} (port {dst_port})"
-            }
-        
-        # Log first attempt to critical ports (reconnaissance)
-        if self.connection_tracker[key] == 1 and packet[TCP].flags == 'S':
-            return {
-                'type': f'{port_name.lower()}_reconnaissance',
-                'tool': 'scanner',
-                'severity': 'low',
-                'confidence': 70,
-                'details': f"Reconnaissance attempt on {port_name} (port {dst_port})"
-            }
+    def get_filter_stats(self):
+        """Kernel prefilter accept vs. drop counts since the filter was attached"""
+        capture_stats = self.capture.get_stats() if self.capture else {}
+        accepted = capture_stats.get('kernel_packets', capture_stats.get('packets', 0)) - self.kernel_accepted_baseline
+        stats = {
+            'filter': self.bpf_filter,
+            'accepted': accepted,
+            'dropped': None,
+            'accept_ratio': None,
+            'drop_ratio': None,
+            'ring_drops': capture_stats.get('kernel_drops', 0)
+        }
         
-        return None
+        rx_now = read_rx_packets(self.interface)
+        if rx_now is not None and self.rx_baseline is not None:
+            received = max(rx_now - self.rx_baseline, accepted)
+            stats['received'] = received
+            stats['dropped'] = received - accepted
+            if received:
+                stats['accept_ratio'] = round(accepted / received, 4)
+                stats['drop_ratio'] = round((received - accepted) / received, 4)
+        return stats
+    
+    def get_stats(self):
+        """Engine counters served by the stats endpoint"""
+        return {
+            'capture': self.capture.get_stats() if self.capture else None,
+            'filter': self.get_filter_stats(),
+            'pipeline': self.pipeline.get_stats() if self.pipeline else None,
+            'detector': self.detector.get_memory_stats(),
+            'rules': dict(self.detector.rules.describe(), **self.rule_file.stats),
+            'sketch_bytes': self.sketch.memory_bytes() if self.sketch else None,
+            'response': self.responder.get_stats() if self.responder else None,
+            'snapshot': self.snapshots.get_stats() if self.snapshots else None,
+            'writer': self.writer.get_stats()
+        }
     
-    def _is_sequential_scan(self, ports):
-        """Check if ports are sequential (typical nmap behavior)"""
-        sorted_ports = sorted(ports)
-        sequential_count = 0
-        for i in range(len(sorted_ports) - 1):
-            if sorted_ports[i+1] - sorted_ports[i] <= 10:
-                sequential_count += 1
-        return sequential_count / len(sorted_ports) > 0.5
+    def collect_metrics(self):
+        """Scrape-time gauges/counters for GET /metrics (values other components already keep)"""
+        capture = self.capture.get_stats() if self.capture else {}
+        yield ('pandora_ids_packets_total', 'counter', "Packets received from the capture backend",
+               [({}, capture.get('packets', 0))])
+        yield ('pandora_ids_kernel_packets_total', 'counter', "Packets accepted by the kernel prefilter",
+               [({}, capture.get('kernel_packets'))])
+        yield ('pandora_ids_kernel_drops_total', 'counter', "Packets dropped by the kernel (ring full)",
+               [({}, capture.get('kernel_drops'))])
+        
+        filter_stats = self.get_filter_stats()
+        yield ('pandora_ids_prefilter_dropped', 'gauge', "NIC packets rejected by the BPF prefilter since it was attached",
+               [({}, filter_stats['dropped'])])
+        
+        memory = self.detector.get_memory_stats()
+        yield ('pandora_ids_tracker_entries', 'gauge', "Sources tracked per detector table (inline detector)",
+               [({'table': name}, table['entries']) for name, table in memory['tables'].items()])
+        yield ('pandora_ids_tracker_evictions_total', 'counter', "Sources evicted at the tracker cap",
+               [({'table': name}, table['evictions']) for name, table in memory['tables'].items()])
+        yield ('pandora_ids_tracker_expired_total', 'counter', "Tracker records expired after going idle",
+               [({'table': name}, table['expired']) for name, table in memory['tables'].items()])
+        flows = memory['flows']
+        if flows:
+            yield ('pandora_ids_flows', 'gauge', "TCP flows in the flow table",
+                   [({'state': 'half_open'}, flows['half_open']), ({'state': 'established'}, flows['established'])])
+            yield ('pandora_ids_flows_evicted_total', 'counter', "Flows evicted at the flow table cap",
+                   [({}, flows['evicted'])])
+        yield ('pandora_ids_tracker_bytes', 'gauge', "Estimated detector state size",
+               [({}, memory['estimated_bytes'])])
+        yield ('pandora_ids_resident_memory_bytes', 'gauge', "Capture process RSS",
+               [({}, memory['rss_bytes'])])
+        if self.sketch is not None:
+            yield ('pandora_ids_sketch_bytes', 'gauge', "Traffic sketch size", [({}, self.sketch.memory_bytes())])
+        
+        if self.pipeline is not None:
+            shards = self.pipeline.get_stats()['shards']
+            yield ('pandora_ids_pipeline_queue_depth', 'gauge', "Packets waiting in each worker ring",
+                   [({'shard': shard['shard']}, shard['queue_depth']) for shard in shards])
+            yield ('pandora_ids_pipeline_dropped_total', 'counter', "Packets dropped on a full worker ring",
+                   [({'shard': shard['shard']}, shard['dropped']) for shard in shards])
+            yield ('pandora_ids_pipeline_worker_up', 'gauge', "Detector worker process alive",
+                   [({'shard': shard['shard']}, shard['alive']) for shard in shards])
+        
+        writer = self.writer.get_stats()
+        yield ('pandora_ids_writer_queue_depth', 'gauge', "Detections waiting for the DB writer",
+               [({}, writer.get('queue_depth'))])
+        yield ('pandora_ids_writer_dropped_total', 'counter', "Detections dropped on a full writer queue",
+               [({}, writer.get('dropped'))])
+        yield ('pandora_ids_writer_rows_total', 'counter', "AttackLog rows written",
+               [({'op': 'insert'}, writer.get('rows_inserted')), ({'op': 'update'}, writer.get('rows_updated'))])
+        alerts = writer.get('alerts') or {}
+        yield ('pandora_ids_alert_queue_depth', 'gauge', "Alerts waiting for the email digest",
+               [({}, alerts.get('queue_depth'))])
+        elasticsearch = writer.get('elasticsearch') or {}
+        yield ('pandora_ids_elasticsearch_buffered', 'gauge', "Documents waiting for the bulk indexer",
+               [({}, elasticsearch.get('buffered'))])
+        if self.responder is not None:
+            response = self.responder.get_stats()
+            yield ('pandora_ids_blocked_sources', 'gauge', "Addresses in the active response block set",
+                   [({}, response['blocked'])])
+            yield ('pandora_ids_block_batches_total', 'counter', "Kernel block transactions applied",
+                   [({}, response['batches'])])
+            yield ('pandora_ids_block_errors_total', 'counter', "Kernel block transactions that failed",
+                   [({}, response['errors'])])
     
-    def _cleanup_old_data(self):
-        """Periodically clean old tracking data"""
+    def get_top_talkers(self, limit=None):
+        """Sketch heavy hitters for GET /sketches (None when sketches are disabled)"""
+        if self.sketch is None:
+            return None
+        return self.sketch.get_top_talkers(limit)
+    
+    def _report_stats(self):
+        """Print tracker and writer stats every 5 minutes"""
         while True:
-            time.sleep(300)  # Every 5 minutes
-            cutoff = datetime.now() - timedelta(minutes=10)
-            
-            # Clean SYN tracker
-            for ip in list(self.syn_tracker.keys()):
-                if self.syn_tracker[ip]['last_seen'] and self.syn_tracker[ip]['last_seen'] < cutoff:
-                    del self.syn_tracker[ip]
+            time.sleep(300)
             
-            # Clean connection tracker (reset counts every 10 minutes)
-            self.connection_tracker.clear()
+            memory = self.detector.get_memory_stats()
+            tables = memory['tables']
+            rss = memory['rss_bytes']
+            flows = memory['flows']
+            print(f"[MEMORY] sources syn={tables['syn_tracker']['entries']} scan={tables['port_scan_tracker']['entries']} "
+                  f"conn={tables['connection_tracker']['entries']} (cap {memory['max_sources']}) "
+                  + (f"flows half_open={flows['half_open']} established={flows['established']} "
+                     f"(cap {flows['max_flows']}) " if flows else "")
+                  + f"trackers~{memory['estimated_bytes'] / 1048576:.1f}MB"
+                  + (f" rss={rss / 1048576:.1f}MB" if rss else ""))
             
-            print(f"[CLEANUP] Tracker data cleaned at {datetime.now()}")
+            stats = self.writer.get_stats()
+            print(f"[WRITER] queue={stats['queue_depth']} enqueued={stats['enqueued']} dropped={stats['dropped']} "
+                  f"flushes={stats['flushes']} avg_flush={stats['avg_flush_ms']:.1f}ms max_flush={stats['max_flush_ms']:.1f}ms")
     
     def extract_payload(self, packet):
         """Extract and sanitize packet payload"""
-        if packet.haslayer(TCP):
-            payload = bytes(packet[TCP].payload)
-        elif packet.haslayer(UDP):
-            payload = bytes(packet[UDP].payload)
-        else:
-            return ""
-        
-        # Take first 200 bytes, sanitize
-        sample = payload[:200]
-        try:
-            # Decode and remove NULL bytes (PostgreSQL TEXT fields cannot contain \x00)
-            decoded = sample.decode('utf-8', errors='ignore')
-            # Remove NULL bytes
-            sanitized = decoded.replace('\x00', '')
-            return sanitized
-        except:
-            return repr(sample)
+        return decode_payload(packet.payload[:200])
     
     def packet_handler(self, packet):
-        """Main packet processing handler"""
+        """Main packet processing handler (packet is a capture.PacketInfo)"""
+        started = time.perf_counter()
         try:
-            if not packet.haslayer(IP):
+            direction = self.detector.is_candidate(packet)
+            if not direction:
+                PACKETS_FILTERED.inc()
+                return
+            
+            # Dropped by the kernel block set, but AF_PACKET sees frames before netfilter
+            if self.responder is not None and packet.src_addr in self.responder.blocked:
+                PACKETS_BLOCKED.inc()
+                return
+            
+            # Sketches see every inbound probe (all shards) to catch distributed attacks
+            if self.sketch is not None and direction == DIRECTION_INBOUND and self.detector.is_probe(packet):
+                sketch_info = self.sketch.observe(packet)
+                if sketch_info:
+                    self.log_attack(packet, sketch_info)
+            
+            # Sharded mode: stateful detection in the worker that owns the remote address
+            if self.pipeline is not None:
+                self.pipeline.dispatch(packet, direction)
+                if self.snapshots is not None:
+                    self.snapshots.maybe_save()
                 return
             
             # Detect attack
-            attack_info = self.detect_attack_type(packet)
+            attack_info = self.detector.detect(packet, direction)
             
             if attack_info:
                 self.log_attack(packet, attack_info)
+            
+            if self.snapshots is not None:
+                self.snapshots.maybe_save()
         
         except Exception as e:
+            HANDLER_ERRORS.inc()
             print(f"[ERROR] Packet handler error: {e}")
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started)
     
     def log_attack(self, packet, attack_info):
-        """Log detected attack to database"""
+        """
+        Queue detected attack for the background database writer
+        
+        Only raw header fields are captured here; GeoIP, payload decoding
+        and flag formatting happen in the writer thread (see enrichment.py).
+        """
         try:
-            src_ip = packet[IP].src
-            dst_ip = packet[IP].dst
-            
-            # Get GeoIP info
-            geo_info = geoip_service.lookup(src_ip)
+            # Detected on one of our own answers (RST storm): the remote end is the attacker
+            if attack_info.get('outbound'):
+                source_ip, source_port, target_ip, target_port = packet.dst_ip, packet.dst_port, packet.src_ip, packet.src_port
+                attacker = packet.dst_addr
+            else:
+                source_ip, source_port, target_ip, target_port = packet.src_ip, packet.src_port, packet.dst_ip, packet.dst_port
+                attacker = packet.src_addr
             
-            # Extract packet details
-            src_port = packet[TCP].sport if packet.haslayer(TCP) else packet[UDP].sport if packet.haslayer(UDP) else 0
-            dst_port = packet[TCP].dport if packet.haslayer(TCP) else packet[UDP].dport if packet.haslayer(UDP) else 0
-            protocol = packet[IP].proto
-            flags = str(packet[TCP].flags) if packet.haslayer(TCP) else ""
+            if self.responder is not None:
+                self.responder.offer(attacker, attack_info)
             
-            # Sanitize function to remove NULL bytes from strings
-            def sanitize_string(s):
-                """Remove NULL bytes from string for PostgreSQL compatibility"""
-                if s is None:
-                    return None
-                return str(s).replace('\x00', '')
+            detection = {
+                'source_ip': source_ip,
+                'source_port': source_port or 0,
+                'target_ip': target_ip,
+                'target_port': target_port or 0,
+                'attack_type': attack_info['type'],
+                'severity': attack_info['severity'],
+                'protocol': packet.proto,
+                'tcp_flags': packet.flags,
+                'payload': packet.payload,
+                'detected_tool': attack_info['tool'],
+                'confidence': attack_info['confidence'],
+                'details': attack_info['details'],
+                'detected_at': datetime.now()
+            }
             
-            # Create log entry
-            db = SessionLocal()
-            try:
-                # Check if recent attack from same IP exists
-                recent_attack = db.query(AttackLog).filter(
-                    AttackLog.source_ip == src_ip,
-                    AttackLog.attack_type == attack_info['type'],
-                    AttackLog.detected_at > datetime.now() - timedelta(minutes=5)
-                ).first()
-                
-                if recent_attack:
-                    # Update existing
-                    recent_attack.packet_count += 1
-                    recent_attack.last_seen = datetime.now()
-                else:
-                    # Create new
-                    attack_log = AttackLog(
-                        source_ip=src_ip,
-                        source_port=src_port,
-                        target_ip=dst_ip,
-                        target_port=dst_port,
-                        attack_type=attack_info['type'],
-                        severity=attack_info['severity'],
-                        packet_count=1,
-                        protocol={6: 'TCP', 17: 'UDP', 1: 'ICMP'}.get(protocol, 'OTHER'),
-                        flags=sanitize_string(flags),
-                        payload_sample=sanitize_string(self.extract_payload(packet)),
-                        country=sanitize_string(geo_info.get('country')),
-                        city=sanitize_string(geo_info.get('city')),
-                        latitude=str(geo_info.get('latitude', 0)),
-                        longitude=str(geo_info.get('longitude', 0)),
-                        detected_tool=sanitize_string(attack_info['tool']),
-                        confidence=attack_info['confidence'],
-                        raw_packet_info={
-                            'src_ip': src_ip,
-                            'dst_ip': dst_ip,
-                            'src_port': src_port,
-                            'dst_port': dst_port,
-                            'details': sanitize_string(attack_info['details'])
-                        }
-                    )
-                    db.add(attack_log)
-                    
-                    # Trigger email notification
-                    from services.email_service import send_attack_alert
-                    threading.Thread(
-                        target=send_attack_alert,
-                        args=(attack_log,),
-                        daemon=True
-                    ).start()
-                
-                db.commit()
-                print(f"[ATTACK DETECTED] {attack_info['type']} from {src_ip}:{src_port} -> {dst_ip}:{dst_port}")
-                
-                # Also log to Elasticsearch (async, non-blocking)
-                try:
-                    es_data = {
-                        'source_ip': src_ip,
-                        'source_port': src_port,
-                        'target_ip': dst_ip,
-                        'target_port': dst_port,
-                        'attack_type': attack_info['type'],
-                        'severity': attack_info['severity'],
-                        'packet_count': 1,
-                        'protocol': {6: 'TCP', 17: 'UDP', 1: 'ICMP'}.get(protocol, 'OTHER'),
-                        'flags': sanitize_string(flags),
-                        'payload_sample': sanitize_string(self.extract_payload(packet)),
-                        'country': sanitize_string(geo_info.get('country')),
-                        'city': sanitize_string(geo_info.get('city')),
-                        'latitude': str(geo_info.get('latitude', 0)),
-                        'longitude': str(geo_info.get('longitude', 0)),
-                        'detected_tool': sanitize_string(attack_info['tool']),
-                        'confidence': attack_info['confidence'],
-                        'raw_packet_info': {
-                            'src_ip': src_ip,
-                            'dst_ip': dst_ip,
-                            'src_port': src_port,
-                            'dst_port': dst_port,
-                            'details': sanitize_string(attack_info['details'])
-                        },
-                        'detected_at': datetime.now().isoformat()
-                    }
-                    
-                    # Send to Elasticsearch in background thread
-                    def send_to_es():
-                        try:
-                            elasticsearch_service.log_attack(es_data)
-                        except:
-                            pass  # Fail silently
-                    
-                    threading.Thread(target=send_to_es, daemon=True).start()
-                except Exception as e:
-                    print(f"[ELASTICSEARCH] Failed to send attack log: {e}")
-                
-            finally:
-                db.close()
+            DETECTIONS.labels(attack_info['type'], attack_info['severity']).inc()
+            if not self.writer.submit(detection):
+                print(f"[WARNING] Attack writer queue full, dropped {attack_info['type']} from {detection['source_ip']}")
         
         except Exception as e:
             print(f"[ERROR] Failed to log attack: {e}")
@@ -507,14 +451,32 @@ class IDSEngine:
         print("="*70)
         print(f"[OK] Interface: {self.interface or 'all'}")
         print(f"[OK] Local IPs: {', '.join(sorted(self.local_ips))}")
+        if self.detector.allowlist or self.detector.denylist:
+            print(f"[OK] Allowlist: {', '.join(self.detector.allowlist.cidrs()) or '-'} | "
+                  f"Denylist: {', '.join(self.detector.denylist.cidrs()) or '-'}")
         print(f"[OK] Monitoring: INBOUND traffic only (External -> Local)")
+        if self.responder is not None:
+            print(f"[OK] Active response: {self.responder.backend.name} "
+                  f"(severity >= {settings.IDS_ACTIVE_RESPONSE_MIN_SEVERITY}, "
+                  f"confidence >= {self.responder.min_confidence}, {self.responder.block_seconds}s)")
         print("[OK] Attack detection: ACTIVE")
         print("="*70)
         print("[DETECTION] Enabled:")
-        print(f"  • Port Scan (>= {self.PORT_SCAN_THRESHOLD} ports in {self.PORT_SCAN_TIME_WINDOW}s)")
-        print(f"  • SYN Flood (>= {self.SYN_FLOOD_THRESHOLD} packets in {self.SYN_FLOOD_TIME_WINDOW}s)")
-        print(f"  • Critical Ports: {', '.join([f'{p}({n})' for p, n in sorted(self.CRITICAL_PORTS.items())])}")
-        print(f"  • Suspicious Connections (>= {self.SUSPICIOUS_CONNECTION_THRESHOLD} attempts)")
+        print(f"  • Port Scan (>= {self.detector.PORT_SCAN_THRESHOLD} ports in {self.detector.PORT_SCAN_TIME_WINDOW}s)")
+        print(f"  • SYN Flood (>= {self.detector.SYN_FLOOD_THRESHOLD} packets in {self.detector.SYN_FLOOD_TIME_WINDOW}s)")
+        print(f"  • Critical Ports: {', '.join([f'{p}({n})' for p, n in sorted(self.detector.CRITICAL_PORTS.items())])}")
+        print(f"  • Suspicious Connections (>= {self.detector.SUSPICIOUS_CONNECTION_THRESHOLD} attempts)")
+        if self.sketch is not None:
+            print(f"  • Distributed SYN Flood (>= {self.sketch.DISTRIBUTED_SYN_THRESHOLD} SYNs from "
+                  f"~{self.sketch.DISTRIBUTED_SOURCE_THRESHOLD} sources in {self.sketch.window}s)")
+            print(f"  • Horizontal Scan (>= {self.sketch.HORIZONTAL_SCAN_THRESHOLD} local hosts in {self.sketch.window}s)")
+            print(f"  • Packet Flood (>= {self.sketch.SOURCE_RATE_THRESHOLD} packets/source in {self.sketch.window}s)")
+        if self.detector.flows is not None:
+            print(f"  • FIN/NULL/Xmas Scan (>= {self.detector.STEALTH_SCAN_THRESHOLD} ports in {self.detector.FLOW_WINDOW}s)")
+            print(f"  • Half-open Scan (>= {self.detector.HALF_OPEN_THRESHOLD} abandoned handshakes, "
+                  f">= {self.detector.HALF_OPEN_RATIO:.0%} of attempts)")
+            print(f"  • RST Storm (>= {self.detector.RST_STORM_THRESHOLD} resets sent to one source "
+                  f"in {self.detector.FLOW_WINDOW}s)")
         print("="*70)
         print("[FILTER] Traffic ignored:")
         print("  X OUTBOUND (Local -> External) - Normal user traffic")
@@ -522,20 +484,37 @@ class IDSEngine:
         print("  X WEBSERVER RESPONSES (port 80/443) - Return traffic")
         print("  X ESTABLISHED CONNECTIONS (no SYN) - Ongoing connections")
         print("  OK NEW INBOUND (External -> Local + SYN) - MONITORED!")
+        if self.detector.flows is not None:
+            print("  OK HANDSHAKE STATE (bare ACK/FIN/RST in, SYN-ACK/RST out) - FLOW TABLE")
         print("="*70)
         print("[WARNING] Running with packet capture - requires admin/root")
         print("="*70)
         
-        # Build filter
-        filter_str = "ip"  # Basic IP filter
+        # Build kernel prefilter from the same rules detect_attack_type applies
+        with self.filter_lock:
+            self.bpf_filter = self.build_filter()
+        print(f"[FILTER] Kernel prefilter: {self.bpf_filter}")
         
         try:
-            sniff(
-                iface=self.interface,
-                filter=filter_str,
-                prn=self.packet_handler,
-                store=False
-            )
+            self.capture = create_capture(self.capture_backend, self.interface, self.bpf_filter)
+            print(f"[CAPTURE] Backend: {self.capture.name}")
+            self._reset_filter_stats()
+            if self.responder is not None:
+                self.responder.start()
+            snapshot_path = settings.IDS_SNAPSHOT_FILE or DEFAULT_SNAPSHOT_FILE
+            if settings.IDS_SNAPSHOT_SECONDS:
+                self._restore_snapshots(snapshot_path)
+            if self.workers > 1:
+                self.pipeline = ShardedPipeline(self.workers, self.log_attack,
+                                                ring_capacity=settings.IDS_PIPELINE_RING_SLOTS,
+                                                detector_options=self.detector_options,
+                                                rules_path=self.rule_file.path,
+                                                rules_reload_seconds=settings.IDS_RULES_RELOAD_SECONDS,
+                                                snapshot_path=snapshot_path,
+                                                snapshot_seconds=settings.IDS_SNAPSHOT_SECONDS)
+                self.pipeline.start()
+            self.stats_server.start()
+            self.capture.run(self.packet_handler)
         except PermissionError:
             print("[ERROR] Permission denied. Please run with sudo/admin privileges")
             sys.exit(1)
@@ -544,8 +523,78 @@ class IDSEngine:
         except Exception as e:
             print(f"[ERROR] Sniffer error: {e}")
             sys.exit(1)
+        finally:
+            self.stats_server.stop()
+            if self.pipeline is not None:
+                self.pipeline.stop()
+            if self.responder is not None:
+                self.responder.stop()
+            self.writer.stop()
+            # After the writer: its last flush settles the open aggregation rows
+            if self.snapshots is not None:
+                self.snapshots.save(wait=True)
+                print(f"[SNAPSHOT] Saved {self.snapshots.path}")
+    
+    def _restore_snapshots(self, path):
+        """
+        Attach the last saved tracker state (sharded: the workers restore
+        their own, this process keeps only the aggregation cache)
+        """
+        detector = self.detector if self.workers <= 1 else None
+        self.snapshots = SnapshotManager(path, settings.IDS_SNAPSHOT_SECONDS, detector,
+                                         getattr(self.writer, 'cache', None))
+        self.snapshots.restore(snapshot_paths(path))
+        stats = self.snapshots.stats
+        if stats['restored_files']:
+            print(f"[SNAPSHOT] Restored {stats['restored_files']} file(s) from {path} in {stats['restore_ms']:.1f}ms "
+                  f"({stats['restored_rows']} open attack rows, trackers load on first packet)")
+    
+    def replay(self, path, realtime=False, speed=1.0):
+        """
+        Feed a pcap/pcapng file through packet_handler (no root or live traffic needed)
+        
+        Detector and sketch windows follow the recorded timestamps, so a
+        capture replayed at full speed raises the same detections as live.
+        """
+        self.capture = PcapCapture(path, realtime=realtime, speed=speed)
+        self.detector.clock = self.capture.clock
+        if self.sketch is not None:
+            self.sketch.clock = self.capture.clock
+        
+        print(f"[REPLAY] {path} ({'recorded timing x' + str(speed) if realtime else 'max speed'})")
+        started = time.perf_counter()
+        try:
+            self.capture.run(self.packet_handler)
+        except KeyboardInterrupt:
+            print("\n[SHUTDOWN] Replay stopped")
+        finally:
+            self.writer.stop()
+        elapsed = time.perf_counter() - started
+        print(f"[REPLAY] {self.capture.packets} packets in {elapsed:.2f}s "
+              f"({self.capture.packets / elapsed if elapsed else 0:,.0f} packets/s)")
 
 if __name__ == '__main__':
-    engine = IDSEngine()
-    engine.start()
+    parser = argparse.ArgumentParser(description="Pandora IDS Engine")
+    parser.add_argument('--interface', '-i', default=None, help="Network interface (auto-detect if omitted)")
+    parser.add_argument('--capture', choices=CAPTURE_BACKENDS, default=settings.IDS_CAPTURE_BACKEND,
+                        help="Packet capture backend (afpacket falls back to scapy when unavailable)")
+    parser.add_argument('--workers', '-w', type=int, default=settings.IDS_DETECTOR_WORKERS,
+                        help="Detector worker processes sharded by source IP (0/1 = inline)")
+    parser.add_argument('--replay', metavar='PCAP', default=None,
+                        help="Replay a pcap/pcapng file instead of capturing live")
+    parser.add_argument('--realtime', action='store_true', help="Replay at recorded timing (default: max speed)")
+    parser.add_argument('--speed', type=float, default=1.0, help="Recorded timing speed-up factor")
+    parser.add_argument('--local-ip', action='append', default=None,
+                        help="Treat this address as local when replaying (repeatable)")
+    args = parser.parse_args()
+    
+    # systemd stops the service with SIGTERM: shut down like Ctrl+C (flush, final snapshot)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    
+    if args.replay:
+        engine = IDSEngine(interface=args.interface or 'replay', workers=0, local_ips=args.local_ip)
+        engine.replay(args.replay, realtime=args.realtime, speed=args.speed)
+    else:
+        engine = IDSEngine(interface=args.interface, capture_backend=args.capture, workers=args.workers)
+        engine.start()
 
@@ -0,0 +1,230 @@
+"""
+IDS Metrics
+Per-thread counters and histograms rendered in Prometheus text format
+
+Hot-path updates never take a lock: each thread writes to its own shard
+(a dict registered once, on the thread's first update) and GET /metrics
+sums the shards at scrape time. A shard is only ever written by its
+owning thread, so no increment is lost. Values that already live
+elsewhere (capture and kernel counters, queue depths, tracker sizes) are
+read by collector callbacks during the scrape instead of being mirrored.
+"""
+
+from bisect import bisect_left
+import threading
+
+# Seconds; per-packet handler work is microseconds, DB flushes milliseconds
+HANDLER_BUCKETS = (5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3, 0.025)
+FLUSH_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+class MetricsRegistry:
+    """Declared metrics, per-thread shards and scrape-time collectors"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._metrics = []
+        self._collectors = []
+
+    def shard(self):
+        """The calling thread's value dict (metric key -> int, float or histogram list)"""
+        try:
+            return self._local.values
+        except AttributeError:
+            values = {}
+            with self._lock:
+                self._shards.append(values)
+            self._local.values = values
+            return values
+
+    def counter(self, name, help, labelnames=()):
+        metric = Counter(self, name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, buckets, labelnames=()):
+        metric = Histogram(self, name, help, buckets, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collect):
+        """
+        Add a scrape-time callback returning (name, type, help, samples)
+        tuples, samples being [(labels dict, value), ...]
+        """
+        self._collectors.append(collect)
+
+    def unregister_collector(self, collect):
+        if collect in self._collectors:
+            self._collectors.remove(collect)
+
+    def _merged(self):
+        """Sum every thread's shard"""
+        with self._lock:
+            shards = list(self._shards)
+        totals = {}
+        for shard in shards:
+            # dict/list copies are atomic under the GIL; the owner may keep writing
+            for key, value in list(shard.items()):
+                if isinstance(value, list):
+                    merged = totals.get(key)
+                    if merged is None:
+                        totals[key] = list(value)
+                    else:
+                        for i, item in enumerate(value):
+                            merged[i] += item
+                else:
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)"""
+        totals = self._merged()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples(totals))
+
+        for collect in list(self._collectors):
+            try:
+                families = list(collect())
+            except Exception as e:
+                lines.append(f"# collector error: {_escape(e)}")
+                continue
+            for name, kind, help, samples in families:
+                # None = not available on this backend / configuration
+                samples = [(labels, value) for labels, value in samples if value is not None]
+                if not samples:
+                    continue
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    """Monotonic counter; labels(...) returns a cached child for one label set"""
+
+    kind = 'counter'
+
+    def __init__(self, registry, name, help, labelnames=(), labelvalues=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.key = (name, tuple(labelvalues))
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children.setdefault(values, Counter(self.registry, self.name, self.help, (), values))
+        return child
+
+    def inc(self, amount=1):
+        values = self.registry.shard()
+        key = self.key
+        values[key] = values.get(key, 0) + amount
+
+    def samples(self, totals):
+        keys = [key for key in totals if key[0] == self.name]
+        if not keys and not self.labelnames:
+            keys = [self.key]
+        for key in sorted(keys):
+            yield f"{self.name}{_format_labels(list(zip(self.labelnames, key[1])))} {_format_value(totals.get(key, 0))}"
+
+
+class Histogram:
+    """Fixed-bucket histogram; state per thread is [bucket counts..., +Inf count, sum]"""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help, buckets, labelnames=(), labelvalues=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.bounds = tuple(sorted(buckets))
+        self.labelnames = tuple(labelnames)
+        self.key = (name, tuple(labelvalues))
+        self._children = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children.setdefault(
+                values, Histogram(self.registry, self.name, self.help, self.bounds, (), values)
+            )
+        return child
+
+    def observe(self, value):
+        values = self.registry.shard()
+        state = values.get(self.key)
+        if state is None:
+            state = values[self.key] = [0] * (len(self.bounds) + 1) + [0.0]
+        state[bisect_left(self.bounds, value)] += 1
+        state[-1] += value
+
+    def samples(self, totals):
+        keys = [key for key in totals if key[0] == self.name]
+        if not keys and not self.labelnames:
+            keys = [self.key]
+        for key in sorted(keys):
+            state = totals.get(key) or [0] * (len(self.bounds) + 1) + [0.0]
+            labels = list(zip(self.labelnames, key[1]))
+            cumulative = 0
+            for bound, count in zip(self.bounds, state):
+                cumulative += count
+                yield f"{self.name}_bucket{_format_labels(labels + [('le', bound)])} {cumulative}"
+            cumulative += state[len(self.bounds)]
+            yield f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(state[-1])}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+
+# Global registry and the IDS hot-path metrics
+registry = MetricsRegistry()
+
+PACKETS_FILTERED = registry.counter(
+    'pandora_ids_packets_filtered_total', "Packets dropped by the userspace direction/probe filter")
+PACKETS_BLOCKED = registry.counter(
+    'pandora_ids_packets_blocked_total', "Packets skipped because their source is blocked by active response")
+HANDLER_ERRORS = registry.counter(
+    'pandora_ids_handler_errors_total', "Exceptions raised in the packet handler")
+HANDLER_SECONDS = registry.histogram(
+    'pandora_ids_handler_seconds', "Time spent in IDSEngine.packet_handler per packet", HANDLER_BUCKETS)
+DETECTIONS = registry.counter(
+    'pandora_ids_detections_total', "Detections handed to the attack writer", ('attack_type', 'severity'))
+DB_FLUSH_SECONDS = registry.histogram(
+    'pandora_ids_db_flush_seconds', "AttackLogWriter flush transaction time", FLUSH_BUCKETS)
+DB_FLUSH_ERRORS = registry.counter(
+    'pandora_ids_db_flush_errors_total', "AttackLogWriter flushes rolled back")
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Synthetic Attack Captures
+Generate pcap files that exercise the IDS detector hot path
+
+Scenarios:
+- nmap:     nmap -sS style SYN scan of the top ports of one host
+- masscan:  randomized SYN sweep of a /24 over a random port list
+- synflood: spoofed-source SYN flood against one port
+- stealth:  half-open SYN scan with the victim's SYN-ACK/RST answers,
+            then FIN, NULL and Xmas scans from other sources
+- mixed:    nmap, masscan and synflood over benign background traffic
+- webserver: nmap scan while clients download from a service on the
+            target (both directions: handshakes, data segments, the
+            clients' bare ACKs and FIN teardown)
+
+Usage:
+    python pcap_synth.py out.pcap --scenario mixed --packets 200000
+"""
+
+import argparse
+import random
+import struct
+import heapq
+
+from capture import TCP_FIN, TCP_SYN, TCP_RST, TCP_PSH, TCP_ACK, TCP_URG, ip_to_addr
+
+_ETH_HEADER = bytes.fromhex('020000000001' '020000000002' '0800')
+_PCAP_HEADER = struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1)  # DLT_EN10MB
+
+# Ports nmap probes first (abridged top-ports list)
+NMAP_TOP_PORTS = [
+    80, 23, 443, 21, 22, 25, 3389, 110, 445, 139, 143, 53, 135, 3306, 8080, 1723, 111, 995, 993, 5900,
+    1025, 587, 8888, 199, 1720, 465, 548, 113, 81, 6001, 10000, 514, 5060, 179, 1026, 2000, 8443, 8000, 32768, 554
+]
+
+
+def _checksum(data):
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def tcp_frame(src_addr, dst_addr, src_port, dst_port, flags, payload=b'', seq=0):
+    """Ethernet + IPv4 + TCP frame (IP checksum filled in, TCP checksum left zero)"""
+    tcp = struct.pack('!HHIIBBHHH', src_port, dst_port, seq, 0, 5 << 4, flags, 65535, 0, 0) + payload
+    ip = struct.pack('!BBHHHBBHII', 0x45, 0, 20 + len(tcp), 0, 0x4000, 64, 6, 0, src_addr, dst_addr)
+    ip = ip[:10] + struct.pack('!H', _checksum(ip)) + ip[12:]
+    return _ETH_HEADER + ip + tcp
+
+
+def write_pcap(path, packets):
+    """Write (timestamp, frame) records to a classic little-endian pcap file"""
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(_PCAP_HEADER)
+        for timestamp, frame in packets:
+            sec = int(timestamp)
+            f.write(struct.pack('<IIII', sec, int((timestamp - sec) * 1e6), len(frame), len(frame)))
+            f.write(frame)
+            count += 1
+    return count
+
+
+def nmap_syn_scan(attacker, target, start=0.0, ports=1000, rate=1000, rng=random):
+    """One source, one host, top ports first then sequential (nmap -sS -T4)"""
+    port_list = NMAP_TOP_PORTS + [p for p in range(1, 65536) if p not in NMAP_TOP_PORTS]
+    src = ip_to_addr(attacker)
+    dst = ip_to_addr(target)
+    src_port = rng.randint(40000, 60000)
+    for i, port in enumerate(port_list[:ports]):
+        yield start + i / rate, tcp_frame(src, dst, src_port, port, TCP_SYN)
+
+
+def masscan_sweep(attacker, network, start=0.0, ports=100, packets=10000, rate=10000, rng=random):
+    """One source, a /24 of hosts, random ports in random order"""
+    src = ip_to_addr(attacker)
+    base = ip_to_addr(network) & 0xFFFFFF00
+    port_list = rng.sample(range(1, 65536), ports)
+    for i in range(packets):
+        dst = base | rng.randint(1, 254)
+        yield start + i / rate, tcp_frame(src, dst, 61000, rng.choice(port_list), TCP_SYN, seq=rng.getrandbits(32))
+
+
+def syn_flood(target, port=80, start=0.0, packets=50000, rate=50000, rng=random):
+    """Spoofed random sources, one destination port"""
+    dst = ip_to_addr(target)
+    for i in range(packets):
+        src = rng.getrandbits(32) | 0x01000000
+        yield start + i / rate, tcp_frame(src, dst, rng.randint(1024, 65535), port, TCP_SYN,
+                                          seq=rng.getrandbits(32))
+
+
+def half_open_scan(attacker, target, start=0.0, ports=1000, open_ports=(22, 80, 443), rate=1000, rng=random):
+    """nmap -sS with the victim's answers: SYN-ACK + attacker RST on open ports, RST on closed"""
+    src = ip_to_addr(attacker)
+    dst = ip_to_addr(target)
+    src_port = rng.randint(40000, 60000)
+    port_list = NMAP_TOP_PORTS + [p for p in range(1, 65536) if p not in NMAP_TOP_PORTS]
+    timestamp = start
+    for port in port_list[:ports]:
+        yield timestamp, tcp_frame(src, dst, src_port, port, TCP_SYN)
+        if port in open_ports:
+            yield timestamp + 0.0001, tcp_frame(dst, src, port, src_port, TCP_SYN | TCP_ACK)
+            yield timestamp + 0.0002, tcp_frame(src, dst, src_port, port, TCP_RST)
+        else:
+            yield timestamp + 0.0001, tcp_frame(dst, src, port, src_port, TCP_RST | TCP_ACK)
+        timestamp += 1 / rate
+
+
+def flag_scan(attacker, target, flags, start=0.0, ports=1000, rate=1000, rng=random):
+    """nmap -sF / -sN / -sX: one probe per port with the given flags, RST from closed ports"""
+    src = ip_to_addr(attacker)
+    dst = ip_to_addr(target)
+    src_port = rng.randint(40000, 60000)
+    for i, port in enumerate(rng.sample(range(1, 65536), ports)):
+        yield start + i / rate, tcp_frame(src, dst, src_port, port, flags)
+        yield start + i / rate + 0.0001, tcp_frame(dst, src, port, src_port, TCP_RST | TCP_ACK)
+
+
+def background(target, clients=200, start=0.0, packets=50000, rate=5000, rng=random):
+    """Benign established HTTPS traffic from a pool of clients"""
+    dst = ip_to_addr(target)
+    pool = [(rng.getrandbits(32) | 0x01000000, rng.randint(1024, 65535)) for _ in range(clients)]
+    for i in range(packets):
+        src, src_port = rng.choice(pool)
+        yield start + i / rate, tcp_frame(src, dst, src_port, 443, TCP_ACK | TCP_PSH, b'\x17\x03\x03' + bytes(61))
+
+
+def downloads(target, port=8080, start=0.0, packets=50000, segments=40, rate=5000, rng=random):
+    """
+    Clients fetching content from a service on the target (not a critical
+    port, whose traffic the prefilter passes anyway): handshake, one
+    request, `segments` data segments from us, a bare ACK every second
+    segment and FIN teardown (~1.5 * segments + 8 packets per download)
+    """
+    dst = ip_to_addr(target)
+    per_download = segments + segments // 2 + 8
+    timestamp = start
+    for _ in range(max(1, packets // per_download)):
+        src, src_port = rng.getrandbits(32) | 0x01000000, rng.randint(1024, 65535)
+        frames = [
+            tcp_frame(src, dst, src_port, port, TCP_SYN),
+            tcp_frame(dst, src, port, src_port, TCP_SYN | TCP_ACK),
+            tcp_frame(src, dst, src_port, port, TCP_ACK),
+            tcp_frame(src, dst, src_port, port, TCP_ACK | TCP_PSH, b'\x17\x03\x03' + bytes(253))
+        ]
+        for segment in range(1, segments + 1):
+            frames.append(tcp_frame(dst, src, port, src_port, TCP_ACK, bytes(512)))
+            if segment % 2 == 0:
+                frames.append(tcp_frame(src, dst, src_port, port, TCP_ACK))
+        frames += [
+            tcp_frame(dst, src, port, src_port, TCP_FIN | TCP_ACK),
+            tcp_frame(src, dst, src_port, port, TCP_ACK),
+            tcp_frame(src, dst, src_port, port, TCP_FIN | TCP_ACK),
+            tcp_frame(dst, src, port, src_port, TCP_ACK)
+        ]
+        for frame in frames:
+            yield timestamp, frame
+            timestamp += 1 / rate
+
+
+SCENARIOS = ('nmap', 'masscan', 'synflood', 'stealth', 'mixed', 'webserver')
+
+
+def generate(scenario, packets=100000, target='10.0.0.10', seed=1):
+    """(timestamp, frame) stream for a scenario, roughly `packets` long, time-ordered"""
+    rng = random.Random(seed)
+    network = target.rsplit('.', 1)[0] + '.0'
+    start = 1700000000.0
+
+    if scenario == 'nmap':
+        return nmap_syn_scan('203.0.113.5', target, start, ports=min(packets, 65535), rng=rng)
+    if scenario == 'masscan':
+        return masscan_sweep('198.51.100.7', network, start, packets=packets, rng=rng)
+    if scenario == 'synflood':
+        return syn_flood(target, 80, start, packets=packets, rng=rng)
+    if scenario == 'stealth':
+        # ~2-3 packets per probe: split the budget over four scans
+        share = max(1, packets // 10)
+        return heapq.merge(
+            half_open_scan('203.0.113.5', target, start, ports=min(share, 65535), rng=rng),
+            flag_scan('203.0.113.6', target, TCP_FIN, start + 1, ports=min(share, 65535), rng=rng),
+            flag_scan('203.0.113.7', target, 0, start + 2, ports=min(share, 65535), rng=rng),
+            flag_scan('203.0.113.8', target, TCP_FIN | TCP_PSH | TCP_URG, start + 3, ports=min(share, 65535), rng=rng),
+            key=lambda record: record[0]
+        )
+    if scenario == 'mixed':
+        share = packets // 4
+        return heapq.merge(
+            background(target, start=start, packets=share, rng=rng),
+            nmap_syn_scan('203.0.113.5', target, start + 1, ports=min(share, 65535), rng=rng),
+            masscan_sweep('198.51.100.7', network, start + 2, packets=share, rng=rng),
+            syn_flood(target, 80, start + 3, packets=share, rng=rng),
+            key=lambda record: record[0]
+        )
+    if scenario == 'webserver':
+        share = packets // 10
+        return heapq.merge(
+            downloads(target, start=start, packets=packets - share, rng=rng),
+            nmap_syn_scan('203.0.113.5', target, start + 1, ports=min(share, 65535), rng=rng),
+            key=lambda record: record[0]
+        )
+    raise ValueError(f"Unknown scenario: {scenario} (choose from {', '.join(SCENARIOS)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic attack captures for the IDS benchmark")
+    parser.add_argument('output', help="pcap file to write")
+    parser.add_argument('--scenario', choices=SCENARIOS, default='mixed')
+    parser.add_argument('--packets', type=int, default=100000, help="Approximate packet count")
+    parser.add_argument('--target', default='10.0.0.10', help="Victim address (masscan sweeps its /24)")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    count = write_pcap(args.output, generate(args.scenario, args.packets, args.target, args.seed))
+    print(f"[SYNTH] Wrote {count} packets ({args.scenario}) to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
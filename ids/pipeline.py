@@ -0,0 +1,235 @@
+"""
+Sharded Detection Pipeline
+Fan packets out to N detector worker processes by source IP
+
+The capture process runs the stateless direction filter, hashes the remote
+address (src for inbound, dst for our own answers) to a shard and copies
+the packet into that shard's shared-memory ring. Each
+worker process owns an AttackDetector (its slice of the tracker state) and
+returns detections to the capture process, where the single
+AttackLogWriter persists them. With snapshots enabled each worker saves
+its trackers to <snapshot file>.<shard> and restores from all of them.
+"""
+
+from multiprocessing import shared_memory
+import multiprocessing
+import threading
+import signal
+import struct
+import queue
+import time
+
+from capture import PacketInfo, PAYLOAD_SAMPLE_SIZE
+from detector import DIRECTION_INBOUND, DIRECTION_OUTBOUND
+from rules import DEFAULT_RULES_FILE
+
+_HAS_L4 = 0x01
+_OUTBOUND = 0x02
+
+
+class PacketRing:
+    """
+    Single-producer / single-consumer ring of fixed-size packet records
+    in shared memory
+
+    Header: head (written by producer), tail (written by consumer)
+    """
+
+    _INDEX = struct.Struct('=Q')
+    # src, dst, proto, meta (has_l4 / outbound bits), sport, dport, flags, timestamp, payload_len, payload
+    _RECORD = struct.Struct(f'=IIBBHHHdH{PAYLOAD_SAMPLE_SIZE}s')
+    _HEADER_SIZE = 64  # head and tail on separate cache lines
+
+    def __init__(self, capacity, name=None):
+        self.capacity = capacity
+        size = self._HEADER_SIZE + capacity * self._RECORD.size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.buf = self.shm.buf
+        self.head = self._INDEX.unpack_from(self.buf, 0)[0]
+        self.tail = self._INDEX.unpack_from(self.buf, 32)[0]
+        self.dropped = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def depth(self):
+        return self._INDEX.unpack_from(self.buf, 0)[0] - self._INDEX.unpack_from(self.buf, 32)[0]
+
+    def push(self, packet, direction=DIRECTION_INBOUND):
+        """Producer side: copy one packet into the ring (drop when full)"""
+        tail = self._INDEX.unpack_from(self.buf, 32)[0]
+        if self.head - tail >= self.capacity:
+            self.dropped += 1
+            return False
+
+        meta = (_HAS_L4 if packet.src_port is not None else 0) | (_OUTBOUND if direction == DIRECTION_OUTBOUND else 0)
+        payload = packet.payload
+        self._RECORD.pack_into(
+            self.buf,
+            self._HEADER_SIZE + (self.head % self.capacity) * self._RECORD.size,
+            packet.src_addr,
+            packet.dst_addr,
+            packet.proto,
+            meta,
+            packet.src_port or 0,
+            packet.dst_port or 0,
+            packet.flags,
+            packet.timestamp or 0.0,
+            len(payload),
+            payload
+        )
+        self.head += 1
+        self._INDEX.pack_into(self.buf, 0, self.head)
+        return True
+
+    def pop_batch(self, limit=1024):
+        """Consumer side: read up to limit (packet, direction) pairs"""
+        head = self._INDEX.unpack_from(self.buf, 0)[0]
+        end = min(head, self.tail + limit)
+        packets = []
+        unpack = self._RECORD.unpack_from
+        while self.tail < end:
+            src, dst, proto, meta, sport, dport, flags, timestamp, plen, payload = unpack(
+                self.buf, self._HEADER_SIZE + (self.tail % self.capacity) * self._RECORD.size
+            )
+            if meta & _HAS_L4:
+                packet = PacketInfo(src, dst, proto, sport, dport, flags, payload[:plen], timestamp or None)
+            else:
+                packet = PacketInfo(src, dst, proto, timestamp=timestamp or None)
+            packets.append((packet, DIRECTION_OUTBOUND if meta & _OUTBOUND else DIRECTION_INBOUND))
+            self.tail += 1
+        if packets:
+            self._INDEX.pack_into(self.buf, 32, self.tail)
+        return packets
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _detector_worker(shard, ring_name, capacity, results, stop_event, detector_options, rules_path,
+                     rules_reload_seconds, snapshot_path=None, snapshot_seconds=0):
+    """Worker process: run the stateful detectors over one shard"""
+    from detector import AttackDetector
+    from rules import RuleFile
+    from snapshot import SnapshotManager, snapshot_paths
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    ring = PacketRing(capacity, name=ring_name)
+    rule_file = RuleFile(rules_path)
+    detector = AttackDetector(rules=rule_file.load(), **detector_options)
+    next_rules_check = time.monotonic() + rules_reload_seconds
+
+    # Every shard file is attached: a source's shard changes with the worker count
+    snapshots = None
+    if snapshot_path and snapshot_seconds:
+        snapshots = SnapshotManager(f"{snapshot_path}.{shard}", snapshot_seconds, detector)
+        snapshots.restore(snapshot_paths(snapshot_path))
+
+    try:
+        while not stop_event.is_set():
+            packets = ring.pop_batch()
+            if not packets:
+                time.sleep(0.001)
+            for packet, direction in packets:
+                try:
+                    attack_info = detector.detect(packet, direction)
+                    if attack_info:
+                        results.put((packet, attack_info))
+                except Exception as e:
+                    print(f"[WORKER {shard}] Detection error: {e}")
+
+            # Each worker follows the rule file on its own (no control channel needed)
+            if time.monotonic() >= next_rules_check:
+                rules = rule_file.poll()
+                if rules is not None:
+                    detector.apply_rules(rules)
+                next_rules_check = time.monotonic() + rules_reload_seconds
+
+            if snapshots is not None:
+                snapshots.maybe_save()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if snapshots is not None:
+            snapshots.save(wait=True)
+        ring.close()
+
+
+class ShardedPipeline:
+    """Capture-side dispatcher for N detector worker processes"""
+
+    def __init__(self, workers, on_detection, ring_capacity=32768, detector_options=None,
+                 rules_path=None, rules_reload_seconds=5, snapshot_path=None, snapshot_seconds=0):
+        self.workers = workers
+        self.on_detection = on_detection
+        self.rings = [PacketRing(ring_capacity) for _ in range(workers)]
+        self.results = multiprocessing.Queue(maxsize=10000)
+        self.stop_event = multiprocessing.Event()
+        self.processes = [
+            multiprocessing.Process(
+                target=_detector_worker,
+                args=(shard, ring.name, ring_capacity, self.results, self.stop_event, detector_options or {},
+                      rules_path or DEFAULT_RULES_FILE, rules_reload_seconds, snapshot_path, snapshot_seconds),
+                name=f'ids-detector-{shard}',
+                daemon=True
+            )
+            for shard, ring in enumerate(self.rings)
+        ]
+        self.collector = threading.Thread(target=self._collect, name='ids-detections', daemon=True)
+        self.dispatched = 0
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        self.collector.start()
+        print(f"[PIPELINE] {self.workers} detector workers started")
+
+    def dispatch(self, packet, direction=DIRECTION_INBOUND):
+        """Route a candidate packet to the worker that owns its remote address"""
+        remote_addr = packet.dst_addr if direction == DIRECTION_OUTBOUND else packet.src_addr
+        # Fibonacci hash of the integer address (spreads /24 neighbours)
+        shard = (((remote_addr * 2654435761) & 0xFFFFFFFF) >> 16) % self.workers
+        if self.rings[shard].push(packet, direction):
+            self.dispatched += 1
+
+    def _collect(self):
+        """Hand worker detections to the engine (single writer)"""
+        while not self.stop_event.is_set():
+            try:
+                packet, attack_info = self.results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                return
+            self.on_detection(packet, attack_info)
+
+    def stop(self):
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout=15)  # Workers write their final snapshot first
+        for ring in self.rings:
+            ring.close()
+
+    def get_stats(self):
+        return {
+            'workers': self.workers,
+            'dispatched': self.dispatched,
+            'shards': [
+                {
+                    'shard': shard,
+                    'alive': process.is_alive(),
+                    'queue_depth': ring.depth(),
+                    'dropped': ring.dropped
+                }
+                for shard, (ring, process) in enumerate(zip(self.rings, self.processes))
+            ]
+        }
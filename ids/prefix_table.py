@@ -0,0 +1,92 @@
+"""
+Prefix Table
+Longest-prefix match over packed integer addresses (IPv4 and IPv6)
+
+Networks are stored per prefix length in a dict keyed by the network
+bits (addr >> (width - length)); a lookup probes only the lengths that
+actually occur, longest first. Local hosts are a single /32 (/128) level,
+so the hot check is one shift and one dict probe; a handful of CIDR
+allow/deny entries adds a probe per distinct length. Strings are parsed
+once when the table is built, never per packet.
+"""
+
+import ipaddress
+
+# Special-purpose ranges treated as private (RFC 1918, 6598, 3927, 4193, loopback)
+PRIVATE_NETWORKS = (
+    '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', '100.64.0.0/10', '127.0.0.0/8', '169.254.0.0/16',
+    '::1/128', 'fc00::/7', 'fe80::/10'
+)
+
+
+def parse_network(cidr):
+    """'10.0.0.0/8', '192.0.2.1' or '2001:db8::/32' -> (version, network int, prefix length)"""
+    network = ipaddress.ip_network(cidr.strip(), strict=False)
+    return network.version, int(network.network_address), network.prefixlen
+
+
+class PrefixTable:
+    """Map of CIDR prefixes to values with longest-prefix lookup"""
+
+    def __init__(self, entries=()):
+        # version -> {prefix length: {network bits: value}}
+        self.networks = {4: {}, 6: {}}
+        self.levels = {4: (), 6: ()}
+        for cidr, value in entries:
+            self.add(cidr, value)
+
+    @classmethod
+    def from_cidrs(cls, cidrs, value=True):
+        return cls((cidr, value) for cidr in cidrs if cidr and cidr.strip())
+
+    def add(self, cidr, value=True):
+        """Insert a prefix (a bare address is a host route)"""
+        version, addr, length = parse_network(cidr)
+        width = 32 if version == 4 else 128
+        self.networks[version].setdefault(length, {})[addr >> (width - length)] = value
+        # (shift, networks) pairs, longest prefix first
+        self.levels[version] = tuple(
+            (width - length, networks)
+            for length, networks in sorted(self.networks[version].items(), reverse=True)
+        )
+
+    def lookup(self, addr, version=4):
+        """Value of the longest matching prefix, or None"""
+        for shift, networks in self.levels[version]:
+            value = networks.get(addr >> shift)
+            if value is not None:
+                return value
+        return None
+
+    def __contains__(self, addr):
+        """IPv4 membership test for packed addresses"""
+        for shift, networks in self.levels[4]:
+            if addr >> shift in networks:
+                return True
+        return False
+
+    def contains_ip(self, ip):
+        """Membership test for a dotted / colon string (config and API callers)"""
+        address = ipaddress.ip_address(ip)
+        return self.lookup(int(address), address.version) is not None
+
+    def __len__(self):
+        return sum(len(networks) for levels in self.networks.values() for networks in levels.values())
+
+    def __bool__(self):
+        return bool(self.levels[4] or self.levels[6])
+
+    def cidrs(self):
+        """Stored prefixes as strings (filter generation, stats)"""
+        result = []
+        for version, levels in self.networks.items():
+            width = 32 if version == 4 else 128
+            address_type = ipaddress.IPv4Address if version == 4 else ipaddress.IPv6Address
+            for length, networks in levels.items():
+                for bits in networks:
+                    address = address_type(bits << (width - length))
+                    result.append(str(address) if length == width else f"{address}/{length}")
+        return result
+
+
+PRIVATE_TABLE = PrefixTable.from_cidrs(PRIVATE_NETWORKS)
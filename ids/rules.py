@@ -0,0 +1,201 @@
+"""
+Detection Rules
+Declarative IDS thresholds and critical-port rules, compiled into lookup tables
+
+rules.json (or IDS_RULES_FILE) holds the thresholds, the ignored source
+ports and the critical ports with their tool / severity. compile_rules()
+turns it into an immutable CompiledRules:
+
+- ports:   65536-entry list, port number -> PortRule or None
+- ignored: 65536-byte table, source port -> 1 if return traffic
+- PortRule carries the finished probe / reconnaissance detections
+
+so the per-packet cost is an index into a list instead of dict lookups,
+if/elif chains and string formatting. RuleFile watches the file's mtime;
+a reload compiles a new CompiledRules and callers swap the reference, so
+a half-applied rule set is never visible. An invalid file is reported
+and the previous rules stay in force.
+"""
+
+import json
+import os
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+
+SEVERITIES = ('low', 'medium', 'high', 'critical')
+
+# Threshold key -> (AttackDetector attribute, type, default when omitted)
+THRESHOLDS = {
+    'port_scan_ports': ('PORT_SCAN_THRESHOLD', int, 3),
+    'port_scan_window': ('PORT_SCAN_TIME_WINDOW', int, 60),
+    'syn_flood_packets': ('SYN_FLOOD_THRESHOLD', int, 20),
+    'syn_flood_window': ('SYN_FLOOD_TIME_WINDOW', int, 10),
+    'suspicious_connections': ('SUSPICIOUS_CONNECTION_THRESHOLD', int, 5),
+    'suspicious_connections_idle': ('SUSPICIOUS_CONNECTION_IDLE', int, 600),
+    'flow_window': ('FLOW_WINDOW', int, 60),
+    'stealth_scan_ports': ('STEALTH_SCAN_THRESHOLD', int, 3),
+    'half_open_abandoned': ('HALF_OPEN_THRESHOLD', int, 10),
+    'half_open_ratio': ('HALF_OPEN_RATIO', float, 0.8),
+    'rst_storm_resets': ('RST_STORM_THRESHOLD', int, 50)
+}
+
+
+class PortRule:
+    """Precomputed detections for one critical port"""
+
+    __slots__ = ('port', 'name', 'tool', 'severity', 'probe', 'reconnaissance')
+
+    def __init__(self, port, name, tool, severity):
+        self.port = port
+        self.name = name
+        self.tool = tool
+        self.severity = severity
+        self.probe = {
+            'type': f'{name.lower()}_probe',
+            'tool': tool,
+            'severity': severity,
+            'confidence': 85,
+            'details': f"Multiple connection attempts to {name} (port {port})"
+        }
+        self.reconnaissance = {
+            'type': f'{name.lower()}_reconnaissance',
+            'tool': 'scanner',
+            'severity': 'low',
+            'confidence': 70,
+            'details': f"Reconnaissance attempt on {name} (port {port})"
+        }
+
+
+class CompiledRules:
+    """Immutable rule snapshot (replace the reference to change rules)"""
+
+    def __init__(self, spec, thresholds, port_rules, ignored_source_ports, source=None):
+        self.spec = spec
+        self.version = spec.get('version')
+        self.source = source
+        self.thresholds = thresholds  # detector attribute -> value
+        self.critical_ports = {port: rule.name for port, rule in port_rules.items()}
+        self.ignored_source_ports = frozenset(ignored_source_ports)
+
+        self.ports = [None] * 65536
+        for port, rule in port_rules.items():
+            self.ports[port] = rule
+        self.ignored = bytearray(65536)
+        for port in ignored_source_ports:
+            self.ignored[port] = 1
+
+    def with_critical_ports(self, critical_ports):
+        """New rules with the critical port map replaced ({port: name or rule dict})"""
+        spec = dict(self.spec)
+        spec['critical_ports'] = {str(port): entry for port, entry in critical_ports.items()}
+        return compile_rules(spec, self.source)
+
+    def describe(self):
+        return {
+            'source': self.source,
+            'version': self.version,
+            'critical_ports': len(self.critical_ports),
+            'ignored_source_ports': len(self.ignored_source_ports)
+        }
+
+
+def _port(value, what):
+    try:
+        port = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{what}: {value!r} is not a port number")
+    if not 0 < port < 65536:
+        raise ValueError(f"{what}: port {port} out of range")
+    return port
+
+
+def compile_rules(spec, source=None):
+    """
+    Validate a rule spec (parsed rules.json) and build the lookup tables
+
+    Raises:
+        ValueError: unknown threshold, bad port or severity
+    """
+    given = spec.get('thresholds', {})
+    for key in given:
+        if key not in THRESHOLDS:
+            raise ValueError(f"Unknown threshold: {key} (choose from {', '.join(THRESHOLDS)})")
+
+    thresholds = {}
+    for key, (attribute, kind, default) in THRESHOLDS.items():
+        try:
+            value = kind(given.get(key, default))
+        except (TypeError, ValueError):
+            raise ValueError(f"Threshold {key}: {given[key]!r} is not a number")
+        if value <= 0:
+            raise ValueError(f"Threshold {key} must be positive, got {value}")
+        thresholds[attribute] = value
+
+    default = spec.get('default_probe', {})
+    default_tool = default.get('tool', 'unknown')
+    default_severity = default.get('severity', 'medium')
+
+    port_rules = {}
+    for key, entry in spec.get('critical_ports', {}).items():
+        port = _port(key, 'critical_ports')
+        if isinstance(entry, str):
+            entry = {'name': entry}
+        name = entry.get('name') or f'Port-{port}'
+        severity = entry.get('severity', default_severity)
+        if severity not in SEVERITIES:
+            raise ValueError(f"critical_ports {port}: unknown severity {severity!r} "
+                             f"(choose from {', '.join(SEVERITIES)})")
+        port_rules[port] = PortRule(port, name, entry.get('tool', default_tool), severity)
+
+    ignored = [_port(port, 'ignored_source_ports') for port in spec.get('ignored_source_ports', [])]
+    return CompiledRules(spec, thresholds, port_rules, ignored, source)
+
+
+def load_rules(path=DEFAULT_RULES_FILE):
+    """Read and compile a rule file"""
+    with open(path) as f:
+        return compile_rules(json.load(f), path)
+
+
+class RuleFile:
+    """Reload a rule file when its mtime changes"""
+
+    def __init__(self, path=DEFAULT_RULES_FILE):
+        self.path = path
+        self.mtime = None
+        self.stats = {'reloads': 0, 'errors': 0, 'last_error': None}
+
+    def load(self):
+        """Initial load; errors propagate (a broken rule file must not start the IDS)"""
+        self.mtime = os.stat(self.path).st_mtime_ns
+        return load_rules(self.path)
+
+    def poll(self):
+        """
+        Return freshly compiled rules if the file changed, else None
+
+        A file that no longer parses keeps the old rules in force.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            return self._error(e)
+        if mtime == self.mtime:
+            return None
+        self.mtime = mtime
+
+        try:
+            rules = load_rules(self.path)
+        except (OSError, ValueError) as e:
+            return self._error(e)
+        self.stats['reloads'] += 1
+        self.stats['last_error'] = None
+        return rules
+
+    def _error(self, error):
+        message = str(error)
+        if message != self.stats['last_error']:
+            print(f"[RULES] Keeping previous rules, {self.path} not loaded: {message}")
+        self.stats['errors'] += 1
+        self.stats['last_error'] = message
+        return None
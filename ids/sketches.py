@@ -0,0 +1,342 @@
+"""
+Traffic Sketches
+Constant-memory summaries for volumetric attacks
+
+- CountMinSketch: approximate per-source packet counts (conservative update)
+- HyperLogLog:    approximate distinct counts (ports, hosts, sources)
+- SpaceSaving:    top-K heavy hitters with a guaranteed error bound
+
+TrafficSketch combines them over a tumbling window and raises the
+detections the exact per-source trackers cannot afford at scale:
+distributed SYN floods (many sources, one port), horizontal scans (one
+source, many local hosts) and single-source packet floods. Memory does
+not depend on how many sources are attacking.
+"""
+
+from array import array
+import threading
+import heapq
+import math
+import time
+
+from capture import TCP_SYN, addr_to_ip
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(x):
+    """splitmix64 finalizer: well-distributed 64-bit hash of an integer key"""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+class CountMinSketch:
+    """Approximate counts for integer keys; never underestimates"""
+
+    __slots__ = ('width', 'depth', 'rows', 'total')
+
+    def __init__(self, width=4096, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('L', bytes(array('L').itemsize * width)) for _ in range(depth)]
+        self.total = 0
+
+    def _indexes(self, key):
+        # Kirsch-Mitzenmacher double hashing: one 64-bit hash for all rows
+        h = _mix64(key)
+        h1 = h & 0xFFFFFFFF
+        h2 = h >> 32
+        width = self.width
+        return [(h1 + i * h2) % width for i in range(self.depth)]
+
+    def add(self, key, amount=1):
+        """Count key and return its new estimate"""
+        indexes = self._indexes(key)
+        rows = self.rows
+        estimate = min(row[i] for row, i in zip(rows, indexes)) + amount
+        # Conservative update: only raise counters that are below the new estimate
+        for row, i in zip(rows, indexes):
+            if row[i] < estimate:
+                row[i] = estimate
+        self.total += amount
+        return estimate
+
+    def estimate(self, key):
+        return min(row[i] for row, i in zip(self.rows, self._indexes(key)))
+
+    def memory_bytes(self):
+        return sum(row.itemsize * len(row) for row in self.rows)
+
+
+class HyperLogLog:
+    """Approximate distinct count of integer keys (standard error ~1.04/sqrt(2^p))"""
+
+    __slots__ = ('p', 'registers')
+
+    def __init__(self, p=10):
+        self.p = p
+        self.registers = bytearray(1 << p)
+
+    def add(self, key):
+        h = _mix64(key)
+        p = self.p
+        index = h >> (64 - p)
+        rest = (h << p) & _MASK64
+        rank = 64 - p + 1 if not rest else 65 - rest.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        registers = self.registers
+        m = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / m) if m >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / sum(2.0 ** -r for r in registers)
+        if estimate <= 2.5 * m:
+            zeros = registers.count(0)
+            if zeros:
+                # Small-range correction (linear counting)
+                estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def merge(self, other):
+        registers = self.registers
+        for i, r in enumerate(other.registers):
+            if r > registers[i]:
+                registers[i] = r
+
+    def memory_bytes(self):
+        return len(self.registers)
+
+
+class SpaceSaving:
+    """
+    Top-K heavy hitters (Metwally et al. stream-summary, unit increments)
+
+    Every key whose true count exceeds total / k is guaranteed to be
+    present; a key's count overestimates by at most its recorded error.
+    An optional factory attaches per-key state that is reset when the
+    slot is taken over by another key.
+    """
+
+    def __init__(self, k, factory=None):
+        self.k = k
+        self.factory = factory
+        self.counts = {}
+        self.errors = {}
+        self.state = {}
+        self.buckets = {}  # count -> set of keys
+        self.min_count = 0
+
+    def add(self, key):
+        """Count key; return its attached state (or None without a factory)"""
+        counts = self.counts
+        buckets = self.buckets
+        count = counts.get(key)
+
+        if count is None:
+            if len(counts) < self.k:
+                count = 0
+                self.errors[key] = 0
+            else:
+                # Replace a minimum-count key; the newcomer inherits its count as error
+                count = self.min_count
+                bucket = buckets[count]
+                victim = bucket.pop()
+                if not bucket:
+                    del buckets[count]
+                del counts[victim]
+                del self.errors[victim]
+                self.state.pop(victim, None)
+                self.errors[key] = count
+            if self.factory is not None:
+                self.state[key] = self.factory()
+        else:
+            bucket = buckets[count]
+            bucket.discard(key)
+            if not bucket:
+                del buckets[count]
+
+        count += 1
+        counts[key] = count
+        bucket = buckets.get(count)
+        if bucket is None:
+            buckets[count] = {key}
+        else:
+            bucket.add(key)
+        if count < self.min_count or self.min_count not in buckets:
+            self.min_count = count
+        return self.state.get(key)
+
+    def top(self, limit=None):
+        """[(key, count, error)] by descending count"""
+        items = heapq.nlargest(limit or self.k, self.counts.items(), key=lambda item: item[1])
+        return [(key, count, self.errors[key]) for key, count in items]
+
+    def __len__(self):
+        return len(self.counts)
+
+
+class _TalkerState:
+    """Per-heavy-hitter distinct counters (only the top-K sources carry these)"""
+
+    __slots__ = ('ports', 'hosts', 'alerted')
+
+    def __init__(self):
+        self.ports = HyperLogLog(6)
+        self.hosts = HyperLogLog(6)
+        self.alerted = False
+
+
+class TrafficSketch:
+    """Windowed sketch layer in front of the exact per-source detectors"""
+
+    # Distinct source HLLs are only kept for ports with at least this many SYNs
+    PORT_TRACK_MIN_SYNS = 64
+    # Heavy-hitter distinct counts are re-estimated every N packets per talker
+    TALKER_CHECK_EVERY = 8
+
+    def __init__(self, window_seconds=10, top_k=64, cms_width=4096, cms_depth=4, clock=time.monotonic):
+        self.window = window_seconds
+        self.top_k = top_k
+        self.cms_width = cms_width
+        self.cms_depth = cms_depth
+        self.clock = clock
+        self.lock = threading.Lock()
+
+        # Thresholds per window
+        self.SOURCE_RATE_THRESHOLD = 5000  # packets from one source
+        self.DISTRIBUTED_SYN_THRESHOLD = 2000  # SYNs to one port
+        self.DISTRIBUTED_SOURCE_THRESHOLD = 100  # distinct sources behind them
+        self.HORIZONTAL_SCAN_THRESHOLD = 20  # distinct local hosts from one source
+
+        self.epoch_end = 0
+        self.last_window = None
+        self._reset(int(self.clock()))
+
+    def _reset(self, now):
+        self.epoch_start = now
+        self.epoch_end = now + self.window
+        self.rates = CountMinSketch(self.cms_width, self.cms_depth)
+        self.sources = HyperLogLog(12)
+        self.port_syns = array('L', bytes(array('L').itemsize * 65536))
+        self.port_sources = {}
+        self.talkers = SpaceSaving(self.top_k, _TalkerState)
+        self.alerted_sources = set()
+        self.alerted_ports = set()
+
+    def _rotate(self, now):
+        """Close the window: keep a summary for the admin API, start empty"""
+        self.last_window = self._summary()
+        self._reset(now)
+
+    def observe(self, packet):
+        """Feed one inbound candidate packet; return a detection dict or None"""
+        now = int(self.clock())
+        src = packet.src_addr
+        with self.lock:
+            if now >= self.epoch_end or now < self.epoch_start:
+                self._rotate(now)
+
+            rate = self.rates.add(src)
+            self.sources.add(src)
+            talker = self.talkers.add(src)
+            talker.ports.add(packet.dst_port)
+            talker.hosts.add(packet.dst_addr)
+
+            if packet.flags == TCP_SYN:
+                result = self._check_port(packet.dst_port, src)
+                if result:
+                    return result
+
+            if rate >= self.SOURCE_RATE_THRESHOLD and src not in self.alerted_sources:
+                self.alerted_sources.add(src)
+                return {
+                    'type': 'packet_flood',
+                    'tool': 'unknown',
+                    'severity': 'high',
+                    'confidence': 80,
+                    'details': f"~{rate} packets from one source in {self.window}s (count-min estimate)"
+                }
+
+            if not talker.alerted and self.talkers.counts[src] % self.TALKER_CHECK_EVERY == 0:
+                hosts = talker.hosts.count()
+                if hosts >= self.HORIZONTAL_SCAN_THRESHOLD:
+                    talker.alerted = True
+                    return {
+                        'type': 'horizontal_scan',
+                        'tool': 'masscan',
+                        'severity': 'high',
+                        'confidence': 75,
+                        'details': f"~{hosts} local hosts probed in {self.window}s "
+                                   f"(~{talker.ports.count()} distinct ports)"
+                    }
+
+        return None
+
+    def _check_port(self, port, src):
+        syns = self.port_syns[port] + 1
+        self.port_syns[port] = syns
+        if syns < self.PORT_TRACK_MIN_SYNS:
+            return None
+
+        sources = self.port_sources.get(port)
+        if sources is None:
+            sources = self.port_sources[port] = HyperLogLog(8)
+        sources.add(src)
+
+        if port in self.alerted_ports or syns < self.DISTRIBUTED_SYN_THRESHOLD:
+            return None
+        # Only re-estimate at each multiple of the threshold
+        if syns % self.PORT_TRACK_MIN_SYNS:
+            return None
+        distinct = sources.count()
+        if distinct < self.DISTRIBUTED_SOURCE_THRESHOLD:
+            return None
+
+        self.alerted_ports.add(port)
+        return {
+            'type': 'distributed_syn_flood',
+            'tool': 'unknown',
+            'severity': 'critical',
+            'confidence': 85,
+            'details': f"{syns} SYNs to port {port} from ~{distinct} sources in {self.window}s"
+        }
+
+    def _summary(self, limit=None):
+        talkers = []
+        for key, count, error in self.talkers.top(limit):
+            state = self.talkers.state[key]
+            talkers.append({
+                'source_ip': addr_to_ip(key),
+                'packets': count,
+                'error': error,
+                'distinct_ports': state.ports.count(),
+                'distinct_hosts': state.hosts.count()
+            })
+        ports = heapq.nlargest(10, ((syns, port) for port, syns in enumerate(self.port_syns) if syns))
+        return {
+            'window_seconds': self.window,
+            'window_start': self.epoch_start,
+            'packets': self.rates.total,
+            'distinct_sources': self.sources.count(),
+            'top_talkers': talkers,
+            'top_syn_ports': [{'port': port, 'syns': syns} for syns, port in ports]
+        }
+
+    def get_top_talkers(self, limit=None):
+        """Current and last completed window summaries for the admin backend"""
+        with self.lock:
+            return {
+                'current': self._summary(limit),
+                'previous': self.last_window
+            }
+
+    def memory_bytes(self):
+        with self.lock:
+            return (self.rates.memory_bytes()
+                    + self.sources.memory_bytes()
+                    + self.port_syns.itemsize * len(self.port_syns)
+                    + sum(hll.memory_bytes() for hll in self.port_sources.values())
+                    + len(self.talkers) * 2 * (1 << 6))
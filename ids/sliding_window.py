@@ -0,0 +1,156 @@
+"""
+Sliding Window Counters
+Time-bucketed windows with O(1) amortized expiry for the IDS detectors
+
+Timestamps are integer seconds from a monotonic clock. Each structure
+keeps the newest per-second bucket inline and a ring (deque) of older
+buckets for seconds that actually saw traffic; buckets older than the
+window are popped from the left, so every recorded value is expired
+exactly once. The ring is only allocated once a source is active for
+more than one second, which keeps one-packet sources (spoofed floods)
+small.
+"""
+
+from collections import deque
+
+
+class SlidingCounter:
+    """Number of events in the last window_seconds"""
+
+    __slots__ = ('window', 'head_sec', 'head_count', 'past', 'total')
+
+    def __init__(self, window_seconds):
+        self.window = window_seconds
+        self.head_sec = 0
+        self.head_count = 0
+        self.past = None  # deque of (second, count), older than head
+        self.total = 0
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        past = self.past
+        if past:
+            while past and past[0][0] <= cutoff:
+                self.total -= past.popleft()[1]
+        if self.head_count and self.head_sec <= cutoff:
+            self.total -= self.head_count
+            self.head_count = 0
+
+    def add(self, now, amount=1):
+        """Record events at second `now`; return the windowed count"""
+        self._expire(now)
+        if now != self.head_sec:
+            if self.head_count:
+                if self.past is None:
+                    self.past = deque()
+                self.past.append((self.head_sec, self.head_count))
+            self.head_sec = now
+            self.head_count = 0
+        self.head_count += amount
+        self.total += amount
+        return self.total
+
+    def count(self, now):
+        self._expire(now)
+        return self.total
+
+    def buckets(self):
+        """(second, count) per recorded second, oldest first (may include expired ones)"""
+        if self.past:
+            yield from self.past
+        if self.head_count:
+            yield self.head_sec, self.head_count
+
+
+class SlidingDistinctCounter:
+    """Number of distinct values (e.g. destination ports) seen in the last window_seconds"""
+
+    __slots__ = ('window', 'head_sec', 'head', 'past', 'refs')
+
+    def __init__(self, window_seconds):
+        self.window = window_seconds
+        self.head_sec = 0
+        # Values seen at head_sec: None, a single value, or a set once there are two
+        self.head = None
+        # Older buckets and value -> live bucket count; None while only head is populated
+        self.past = None
+        self.refs = None
+
+    def _head_values(self):
+        head = self.head
+        if head is None:
+            return ()
+        return head if type(head) is set else (head,)
+
+    def _expire(self, now):
+        cutoff = now - self.window
+        past = self.past
+        if past:
+            refs = self.refs
+            while past and past[0][0] <= cutoff:
+                for value in past.popleft()[1]:
+                    if refs[value] == 1:
+                        del refs[value]
+                    else:
+                        refs[value] -= 1
+            if not past:
+                self.past = None
+                self.refs = None
+        if self.head is not None and self.head_sec <= cutoff:
+            self.head = None
+
+    def add(self, value, now):
+        """Record value at second `now`; return the windowed distinct count"""
+        self._expire(now)
+        head = self.head
+
+        if head is not None and now != self.head_sec:
+            # Roll the head bucket into the ring
+            values = self._head_values()
+            if self.past is None:
+                self.past = deque()
+                self.refs = dict.fromkeys(values, 1)
+            self.past.append((self.head_sec, values))
+            head = self.head = None
+
+        if head is None:
+            self.head = value
+            self.head_sec = now
+        elif type(head) is set:
+            if value in head:
+                return self._count()
+            head.add(value)
+        elif value == head:
+            return self._count()
+        else:
+            self.head = {head, value}
+
+        if self.refs is not None:
+            self.refs[value] = self.refs.get(value, 0) + 1
+        return self._count()
+
+    def _count(self):
+        if self.refs is not None:
+            return len(self.refs)
+        head = self.head
+        if head is None:
+            return 0
+        return len(head) if type(head) is set else 1
+
+    def count(self, now):
+        self._expire(now)
+        return self._count()
+
+    def buckets(self):
+        """(second, values) per recorded second, oldest first (may include expired ones)"""
+        if self.past:
+            yield from self.past
+        if self.head is not None:
+            yield self.head_sec, self._head_values()
+
+    def values(self, now):
+        """Distinct values currently inside the window"""
+        self._expire(now)
+        if self.refs is not None:
+            return self.refs.keys()
+        return self._head_values()
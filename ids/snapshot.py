@@ -0,0 +1,597 @@
+"""
+Detector Snapshots
+Versioned, memory-mapped snapshots of IDS tracker state
+
+A snapshot is one file: a fixed header, a section table and 8-byte
+aligned sections. Each tracker is stored as columns sorted by key:
+
+    XXK0  keys (u32 address or u64 address << 16 | port)
+    XXSn  per-key start index into stream n (count + 1 entries)
+    XXRn  stream n records, fixed-size little-endian structs
+
+Restore only maps the file and checks the header, so detection resumes
+immediately. Sources come back lazily: a tracker miss bisects the mapped
+key column and rebuilds that one source (BoundedSourceTable.loader), and
+once every window in the snapshot has run out it is unmapped. Times are
+stored relative to the detector clock at save time and shifted by the
+new clock and the downtime, so a scan window that was 40 s in resumes
+where it stopped and anything that aged out meanwhile is ignored.
+
+Saving is incremental on the thread that owns the detector: each
+maybe_save call encodes at most SAVE_SLICE_KEYS sources (first pulling in
+sources still only present in the attached snapshot, so back-to-back
+restarts don't lose them), and a writer thread sorts the packed records
+and writes the file. No fork, so no copy of the trackers and nothing to
+hang on locks held by other threads. The final save at shutdown runs
+inline. Files are written beside the target and renamed over it.
+
+Unknown versions or a damaged file are rejected as a whole; the IDS then
+starts with empty trackers, as it did before snapshots existed.
+"""
+
+from bisect import bisect_left
+from array import array
+import threading
+import struct
+import mmap
+import glob
+import time
+import re
+import sys
+import os
+
+from capture import ip_to_addr, addr_to_ip
+from flow_table import FlowSourceStats
+
+SNAPSHOT_MAGIC = b'PIDS'
+SNAPSHOT_VERSION = 1
+
+DEFAULT_SNAPSHOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state', 'detector.snap')
+
+_HEADER = struct.Struct('<4sHxxdqI4x')   # magic, version, saved wall time, saved clock, section count
+_SECTION = struct.Struct('<4sIQQ')       # tag, record size, record count, offset
+
+# Table code -> (key column type, record layout per stream); times are seconds relative to the save
+TABLES = {
+    b'SY': ('I', (struct.Struct('<iI'), struct.Struct('<iH'))),  # syn_tracker: flood buckets, scan ports
+    b'PS': ('I', (struct.Struct('<iH'),)),                        # port_scan_tracker: second, port
+    b'CN': ('Q', (struct.Struct('<iI'),)),                        # connection_tracker: last second, count
+    b'FS': ('I', (struct.Struct('<i5I'), struct.Struct('<H'))),   # flow sources: window and outcomes, stealth ports
+    b'AG': ('I', (struct.Struct('<qdH'),))                        # aggregation cache: row id, expires (epoch), type
+}
+_STRINGS = b'STR0'  # '\n'-joined attack types referenced by AG
+
+_FLOW_SOURCE_FIELDS = ('opened', 'completed', 'abandoned', 'refused', 'rsts_sent')
+
+SAVE_SLICE_KEYS = 1000  # Sources encoded per packet-thread step while a save is in progress
+
+
+def snapshot_paths(path):
+    """path plus per-worker files (path.0, path.1, ...), newest first"""
+    # Exact shard names only: a process killed mid-write leaves path.<shard>.tmp behind
+    shard = re.compile(re.escape(path) + r'\.\d+')
+    shards = [p for p in glob.glob(f"{glob.escape(path)}.[0-9]*") if shard.fullmatch(p)]
+    paths = [p for p in [path] + shards if os.path.isfile(p)]
+    return sorted(paths, key=os.path.getmtime, reverse=True)
+
+
+# Writing
+
+def _encode_packed(sections, code, items):
+    """Append one table's columns; items are (key, [packed bytes per stream]) in key order"""
+    key_type, layouts = TABLES[code]
+    keys = array(key_type)
+    starts = [array('I', [0]) for _ in layouts]
+    data = [bytearray() for _ in layouts]
+    for key, blobs in items:
+        keys.append(key)
+        for stream, blob in enumerate(blobs):
+            data[stream] += blob
+            starts[stream].append(len(data[stream]) // layouts[stream].size)
+    sections[code + b'K0'] = (keys.itemsize, keys.tobytes())
+    for stream, layout in enumerate(layouts):
+        sections[code + b'S%d' % stream] = (4, starts[stream].tobytes())
+        sections[code + b'R%d' % stream] = (layout.size, bytes(data[stream]))
+
+
+def _encode_table(sections, code, items):
+    """Append one table's columns; items are (key, [records per stream]) in key order"""
+    layouts = TABLES[code][1]
+    _encode_packed(sections, code, ((key, [b''.join(layout.pack(*record) for record in records)
+                                           for layout, records in zip(layouts, streams)])
+                                    for key, streams in items))
+
+
+def _tracker_tables(detector):
+    """(code, source table, value -> per-stream records relative to now) for each tracker"""
+
+    def syn_streams(tracker, now):
+        return ([(second - now, count) for second, count in tracker.count.buckets()],
+                [(second - now, port) for second, ports in tracker.ports.buckets() for port in ports])
+
+    def scan_streams(window, now):
+        return ([(second - now, port) for second, ports in window.buckets() for port in ports],)
+
+    def connection_streams(value, now):
+        return ([((value >> 32) - now, value & 0xFFFFFFFF)],)
+
+    def flow_source_streams(stats, now):
+        return ([(stats.window_start - now,) + tuple(getattr(stats, f) for f in _FLOW_SOURCE_FIELDS)],
+                [(port,) for port in stats.stealth_ports or ()])
+
+    tables = [(b'SY', detector.syn_tracker, syn_streams),
+              (b'PS', detector.port_scan_tracker, scan_streams),
+              (b'CN', detector.connection_tracker, connection_streams)]
+    if detector.flows is not None:
+        tables.append((b'FS', detector.flows.sources, flow_source_streams))
+    return tables
+
+
+def encode_detector(detector, now):
+    """Tracker sections in one go (shutdown save)"""
+    sections = {}
+    for code, table, streams in _tracker_tables(detector):
+        entries = table.entries
+        _encode_table(sections, code, ((key, streams(entries[key], now)) for key in sorted(entries)))
+    return sections
+
+
+def encode_detector_slices(detector, now, slice_keys):
+    """
+    Generator form of encode_detector for the packet thread: yields after
+    every slice_keys sources and returns [(code, keys, [(counts, data)]
+    per stream)] in entry order (the writer thread sorts, see _encode_unsorted)
+
+    Each source is encoded whole between two packets, so it is consistent
+    on its own; sources that arrive mid-save wait for the next one. Only
+    arrays and bytearrays are kept: no GC-tracked objects per source.
+    """
+    tables = []
+    budget = slice_keys
+    for code, table, streams in _tracker_tables(detector):
+        key_type, layouts = TABLES[code]
+        keys = array(key_type)
+        columns = [(array('I'), bytearray()) for _ in layouts]
+        entries = table.entries
+        for key in list(entries):
+            value = entries.get(key)
+            if value is not None:
+                keys.append(key)
+                for layout, (counts, data), records in zip(layouts, columns, streams(value, now)):
+                    pack = layout.pack
+                    for record in records:
+                        data += pack(*record)
+                    counts.append(len(records))
+            budget -= 1
+            if budget <= 0:
+                yield
+                budget = slice_keys
+        tables.append((code, keys, columns))
+    return tables
+
+
+def _encode_unsorted(sections, code, keys, columns):
+    """_encode_packed for encode_detector_slices output (writer thread)"""
+    layouts = TABLES[code][1]
+    starts = []
+    for counts, _ in columns:
+        offsets = array('I', [0])
+        for count in counts:
+            offsets.append(offsets[-1] + count)
+        starts.append(offsets)
+
+    def items():
+        for i in sorted(range(len(keys)), key=keys.__getitem__):
+            yield keys[i], [data[offsets[i] * layout.size:offsets[i + 1] * layout.size]
+                            for layout, (_, data), offsets in zip(layouts, columns, starts)]
+
+    _encode_packed(sections, code, items())
+
+
+def encode_cache(cache):
+    """Aggregation cache sections (small; taken under the cache lock in the calling thread)"""
+    with cache.lock:
+        entries = [(ip_to_addr(key[0]), key[1], entry[0], entry[1]) for key, entry in cache.entries.items()]
+
+    types = {}
+    by_addr = {}
+    for addr, attack_type, row_id, expires_at in entries:
+        index = types.setdefault(attack_type, len(types))
+        by_addr.setdefault(addr, []).append((row_id, expires_at, index))
+
+    sections = {}
+    _encode_table(sections, b'AG', ((addr, (by_addr[addr],)) for addr in sorted(by_addr)))
+    sections[_STRINGS] = (1, '\n'.join(types).encode())
+    return sections
+
+
+def write_snapshot(path, sections, now=0, wall=None):
+    """
+    Write encoded sections to path (via a temporary file and rename, so a
+    crash mid-write leaves the previous snapshot intact); returns the size.
+    wall is the time.time() that matches the clock second now (default: now)
+    """
+    offset = (_HEADER.size + _SECTION.size * len(sections) + 7) & ~7
+    table = []
+    for tag, (size, data) in sections.items():
+        table.append(_SECTION.pack(tag, size, len(data) // size, offset))
+        offset = (offset + len(data) + 7) & ~7
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, time.time() if wall is None else wall, now,
+                             len(sections)))
+        f.write(b''.join(table))
+        for size, data in sections.values():
+            f.write(b'\0' * (-f.tell() & 7))
+            f.write(data)
+    os.replace(tmp_path, path)
+    return offset
+
+
+# Reading
+
+class SnapshotTable:
+    """One tracker's columns inside a mapped snapshot"""
+
+    def __init__(self, snapshot, code):
+        key_type, self.layouts = TABLES[code]
+        self.keys = snapshot.column(code + b'K0', key_type)
+        self.starts = [snapshot.column(code + b'S%d' % stream, 'I') for stream in range(len(self.layouts))]
+        self.records = [snapshot.column(code + b'R%d' % stream) for stream in range(len(self.layouts))]
+        for stream, starts in enumerate(self.starts):
+            if len(starts) != len(self.keys) + 1 or starts[-1] * self.layouts[stream].size != len(self.records[stream]):
+                raise ValueError(f"{snapshot.path}: table {code.decode()} is inconsistent")
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, key):
+        """Per-stream record lists for key, or None"""
+        keys = self.keys
+        i = bisect_left(keys, key)
+        if i == len(keys) or keys[i] != key:
+            return None
+        return [self._stream(stream, i) for stream in range(len(self.layouts))]
+
+    def items(self):
+        for i, key in enumerate(self.keys):
+            yield key, [self._stream(stream, i) for stream in range(len(self.layouts))]
+
+    def _stream(self, stream, i):
+        size = self.layouts[stream].size
+        starts = self.starts[stream]
+        return list(self.layouts[stream].iter_unpack(self.records[stream][starts[i] * size:starts[i + 1] * size]))
+
+
+class Snapshot:
+    """A snapshot file mapped read-only (header and section table validated on open)"""
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError("snapshot columns are little-endian; not supported on this host")
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        self.columns = []
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self):
+        if len(self.map) < _HEADER.size:
+            raise ValueError(f"{self.path}: truncated header")
+        magic, version, self.saved_wall, self.saved_clock, count = _HEADER.unpack_from(self.map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"{self.path}: not a detector snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"{self.path}: snapshot version {version}, expected {SNAPSHOT_VERSION}")
+        if len(self.map) < _HEADER.size + count * _SECTION.size:
+            raise ValueError(f"{self.path}: truncated section table")
+
+        self.sections = {}
+        for i in range(count):
+            tag, size, records, offset = _SECTION.unpack_from(self.map, _HEADER.size + i * _SECTION.size)
+            if offset + size * records > len(self.map):
+                raise ValueError(f"{self.path}: section {tag!r} truncated")
+            self.sections[tag] = (offset, size * records)
+
+        self.tables = {code: SnapshotTable(self, code) for code in TABLES if code + b'K0' in self.sections}
+
+    def column(self, tag, item_type=None):
+        """Section as a memoryview (cast to item_type), empty if absent"""
+        offset, length = self.sections.get(tag, (0, 0))
+        column = self.view[offset:offset + length]
+        if item_type is not None:
+            column = column.cast(item_type)
+        self.columns.append(column)
+        return column
+
+    def base(self, now):
+        """Clock second that a stored relative time of 0 maps to (now minus downtime)"""
+        return now - max(0, int(time.time() - self.saved_wall))
+
+    def close(self):
+        for column in reversed(self.columns):
+            column.release()
+        self.columns = []
+        self.view.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # A caller still holds a slice; the mapping goes with it
+
+
+# Restoring
+
+class TableLoader:
+    """BoundedSourceTable.loader over one table in several snapshots (newest first)"""
+
+    def __init__(self, tables, build):
+        self.tables = tables  # [(SnapshotTable, base second)]
+        self.build = build    # (streams, base) -> record or None
+
+    def __call__(self, key):
+        for table, base in self.tables:
+            streams = table.lookup(key)
+            if streams is not None:
+                return self.build(streams, base)
+        return None
+
+    def keys(self):
+        for table, _ in self.tables:
+            yield from table.keys
+
+
+def attach_snapshots(detector, snapshots):
+    """
+    Serve tracker misses from snapshots; returns the clock second after
+    which nothing in them is live (detector detaches them then)
+    """
+    now = int(detector.clock())
+    clock = detector.clock
+
+    def build_syn(streams, base):
+        cutoff = int(clock())
+        tracker = detector.syn_tracker.factory()
+        for rel, count in streams[0]:
+            if base + rel > cutoff - tracker.count.window:
+                tracker.count.add(base + rel, count)
+                tracker.last_seen = max(tracker.last_seen, base + rel)
+        for rel, port in streams[1]:
+            if base + rel > cutoff - tracker.ports.window:
+                tracker.ports.add(port, base + rel)
+                tracker.last_seen = max(tracker.last_seen, base + rel)
+        return tracker if tracker.last_seen else None
+
+    def build_scan(streams, base):
+        cutoff = int(clock())
+        window = detector.port_scan_tracker.factory()
+        live = [(base + rel, port) for rel, port in streams[0] if base + rel > cutoff - window.window]
+        for second, port in live:
+            window.add(port, second)
+        return window if live else None
+
+    def build_connection(streams, base):
+        (rel, count), = streams[0]
+        second = base + rel
+        if second <= int(clock()) - detector.SUSPICIOUS_CONNECTION_IDLE:
+            return None
+        return (second << 32) | count
+
+    def build_flow_source(streams, base):
+        (rel, *counts), = streams[0]
+        window_start = base + rel
+        if window_start + 2 * detector.flows.window <= int(clock()):
+            return None
+        stats = FlowSourceStats()
+        stats.window_start = window_start
+        for field, value in zip(_FLOW_SOURCE_FIELDS, counts):
+            setattr(stats, field, value)
+        for port, in streams[1]:
+            stats.add_stealth_port(port)
+        return stats
+
+    targets = [(b'SY', detector.syn_tracker, build_syn),
+               (b'PS', detector.port_scan_tracker, build_scan),
+               (b'CN', detector.connection_tracker, build_connection)]
+    if detector.flows is not None:
+        targets.append((b'FS', detector.flows.sources, build_flow_source))
+
+    for code, table, build in targets:
+        tables = [(snapshot.tables[code], snapshot.base(now)) for snapshot in snapshots if code in snapshot.tables]
+        table.loader = TableLoader(tables, build) if tables else None
+
+    retention = max(detector.SYN_FLOOD_TIME_WINDOW, detector.PORT_SCAN_TIME_WINDOW,
+                    detector.SUSPICIOUS_CONNECTION_IDLE, 2 * detector.FLOW_WINDOW)
+    return max((snapshot.base(now) + retention for snapshot in snapshots), default=now)
+
+
+def materialize(detector):
+    """
+    Copy every live source still only in an attached snapshot into the
+    trackers, behind the live ones and only while there is room, so the
+    next save keeps them
+    """
+    for _ in materialize_slices(detector, sys.maxsize):
+        pass
+
+
+def materialize_slices(detector, slice_keys):
+    """Generator form of materialize: yields after every slice_keys snapshot keys"""
+    tables = [detector.syn_tracker, detector.port_scan_tracker, detector.connection_tracker]
+    if detector.flows is not None:
+        tables.append(detector.flows.sources)
+    budget = slice_keys
+    for table in tables:
+        loader, entries = table.loader, table.entries
+        if loader is None:
+            continue
+        for key in loader.keys():
+            if len(entries) >= table.max_entries:
+                break
+            if key not in entries:
+                record = loader(key)
+                if record is not None:
+                    entries[key] = record
+                    entries.move_to_end(key, last=False)
+            budget -= 1
+            if budget <= 0:
+                yield
+                budget = slice_keys
+                if table.loader is not loader:
+                    break  # Detached meanwhile: its columns are unmapped
+
+
+def restore_cache(cache, snapshot):
+    """Reopen aggregation rows still inside their window; returns how many"""
+    table = snapshot.tables.get(b'AG')
+    if table is None:
+        return 0
+    types = bytes(snapshot.column(_STRINGS)).decode().split('\n')
+    wall = time.time()
+    restored = 0
+    with cache.lock:
+        for addr, (rows,) in table.items():
+            for row_id, expires_at, index in rows:
+                key = (addr_to_ip(addr), types[index])
+                if expires_at > wall and key not in cache.entries:
+                    cache.entries[key] = [row_id, expires_at, 0, None]
+                    restored += 1
+    return restored
+
+
+class SnapshotManager:
+    """Restore at startup and periodic incremental saves for one detector (and optionally the cache)"""
+
+    def __init__(self, path, interval, detector=None, cache=None, slice_keys=SAVE_SLICE_KEYS):
+        self.path = path
+        self.interval = interval
+        self.detector = detector
+        self.cache = cache
+        self.slice_keys = slice_keys
+        self.next_save = time.monotonic() + interval
+        self.job = None      # Encoding in progress (generator stepped by maybe_save)
+        self.writer = None   # Thread sorting and writing the last encoded snapshot
+        self.save_started = 0.0
+        self.stats = {'restored_files': 0, 'restored_rows': 0, 'restore_ms': 0.0,
+                      'saves': 0, 'errors': 0, 'last_save_ms': 0.0, 'last_error': None}
+
+    def restore(self, paths):
+        """Map the given snapshot files (newest first) and attach them"""
+        started = time.perf_counter()
+        snapshots = []
+        for path in paths:
+            try:
+                snapshots.append(Snapshot(path))
+            except (OSError, ValueError) as e:
+                print(f"[SNAPSHOT] Ignoring {path}: {e}")
+        if not snapshots:
+            return
+
+        if self.cache is not None:
+            self.stats['restored_rows'] = sum(restore_cache(self.cache, snapshot) for snapshot in snapshots)
+        if self.detector is not None:
+            self.detector.attach_snapshots(snapshots)
+        else:
+            for snapshot in snapshots:
+                snapshot.close()
+        self.stats['restored_files'] = len(snapshots)
+        self.stats['restore_ms'] = (time.perf_counter() - started) * 1000
+
+    def maybe_save(self):
+        """Called from the thread that owns the detector: one encoding slice, or start a save when due"""
+        if self.job is not None:
+            self._step()
+        elif time.monotonic() >= self.next_save:
+            self.next_save = time.monotonic() + self.interval
+            self.save()
+
+    def save(self, wait=False):
+        """
+        Snapshot now: started here and continued a slice per maybe_save
+        call, or complete and written inline with wait=True (shutdown)
+        """
+        if self.writer is not None and self.writer.is_alive():
+            if not wait:
+                self._error("previous snapshot still being written, skipped")
+                return
+            self.writer.join()
+
+        if wait:
+            self.job = None
+            started = time.perf_counter()
+            try:
+                now = 0
+                sections = encode_cache(self.cache) if self.cache is not None else {}
+                if self.detector is not None:
+                    materialize(self.detector)
+                    now = int(self.detector.clock())
+                    sections.update(encode_detector(self.detector, now))
+                write_snapshot(self.path, sections, now)
+            except (OSError, ValueError, OverflowError, struct.error) as e:
+                self._error(e)
+                return
+            self.stats['saves'] += 1
+            self.stats['last_save_ms'] = (time.perf_counter() - started) * 1000
+            return
+
+        if self.job is None:
+            self.save_started = time.perf_counter()
+            self.job = self._encode()
+        self._step()
+
+    def _encode(self):
+        """The save as a generator: cache, then snapshot-only sources, then the trackers"""
+        sections = encode_cache(self.cache) if self.cache is not None else {}
+        tables = []
+        now = 0
+        wall = time.time()
+        if self.detector is not None:
+            yield from materialize_slices(self.detector, self.slice_keys)
+            now = int(self.detector.clock())
+            wall = time.time()  # Record times are relative to this moment, not to the write
+            tables = yield from encode_detector_slices(self.detector, now, self.slice_keys)
+        return sections, tables, now, wall
+
+    def _step(self):
+        try:
+            next(self.job)
+            return
+        except StopIteration as done:
+            sections, tables, now, wall = done.value
+        except (ValueError, OverflowError, struct.error) as e:
+            self.job = None
+            self._error(e)
+            return
+        self.job = None
+        # Only bytes and ints from here on: nothing shared with the packet thread
+        self.writer = threading.Thread(target=self._write, args=(sections, tables, now, wall),
+                                       name='ids-snapshot', daemon=True)
+        self.writer.start()
+
+    def _write(self, sections, tables, now, wall):
+        try:
+            for code, keys, columns in tables:
+                _encode_unsorted(sections, code, keys, columns)
+            write_snapshot(self.path, sections, now, wall)
+        except (OSError, ValueError, OverflowError, struct.error) as e:
+            self._error(e)
+            return
+        self.stats['saves'] += 1
+        self.stats['last_save_ms'] = (time.perf_counter() - self.save_started) * 1000
+
+    def _error(self, error):
+        self.stats['errors'] += 1
+        self.stats['last_error'] = str(error)
+        print(f"[SNAPSHOT] Failed to write {self.path}: {error}")
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['path'] = self.path
+        stats['saving'] = self.job is not None or (self.writer is not None and self.writer.is_alive())
+        return stats
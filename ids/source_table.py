@@ -0,0 +1,201 @@
+"""
+Bounded Source Table
+Memory-capped, least-recently-active map for per-source IDS state
+
+Keys are packed integers (IPv4 address, or address << 16 | port), values
+are small __slots__ records or ints. When the table is full the least
+recently active key is evicted, so a spoofed-source flood can churn the
+table but never grow it past max_entries.
+
+Every access moves the key to the back, so the table doubles as an
+expiry queue: with a deadline function (record -> second after which it
+holds no live state) expire() pops due records from the front, a bounded
+slice per call. Callers run it from the packet path; nothing ever sweeps
+the whole table or touches it from another thread.
+
+An optional loader (key -> record or None) is consulted on a miss before
+the factory; snapshot restore uses it to bring sources back lazily.
+"""
+
+from collections import OrderedDict, deque
+import sys
+import os
+
+# Most records dropped per expire() call (bounds the per-packet pause)
+EXPIRY_SLICE = 64
+
+
+class BoundedSourceTable:
+    """LRU-evicting map with a hard entry cap"""
+
+    def __init__(self, max_entries, factory=None, deadline=None):
+        self.max_entries = max_entries
+        self.factory = factory
+        self.deadline = deadline  # record -> expiry second; None = only evicted, never expired
+        self.loader = None
+        self.entries = OrderedDict()
+        self.evictions = 0
+        self.expired = 0
+        self.estimated_bytes = 0
+
+    def get(self, key):
+        """Return the record for key (marking it active) or None"""
+        entries = self.entries
+        record = entries.get(key)
+        if record is not None:
+            entries.move_to_end(key)
+        return record
+
+    def get_or_create(self, key):
+        """Return the record for key, creating it with factory() if missing"""
+        entries = self.entries
+        record = entries.get(key)
+        if record is None:
+            if self.loader is not None:
+                record = self.loader(key)
+            if record is None:
+                record = self.factory()
+            entries[key] = record
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+        else:
+            entries.move_to_end(key)
+        return record
+
+    def increment(self, key, amount=1):
+        """Add to an integer counter; return the new value"""
+        entries = self.entries
+        value = entries.get(key, 0) + amount
+        entries[key] = value
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def increment_at(self, key, now):
+        """
+        Count an event in a counter stamped with its last second
+        (value = now << 32 | count); return the count
+        """
+        entries = self.entries
+        value = entries.get(key)
+        if value is None:
+            value = self.loader(key) if self.loader is not None else None
+            if value is None:
+                value = 0
+        value = ((value & 0xFFFFFFFF) + 1) | (now << 32)
+        entries[key] = value
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evictions += 1
+        return value & 0xFFFFFFFF
+
+    def expire(self, now, limit=EXPIRY_SLICE):
+        """
+        Drop up to limit records whose deadline has passed, least recently
+        active first; returns how many were dropped (limit = more may be due)
+
+        Deadlines are last activity plus a per-table timeout, so front to
+        back is deadline order and the first live record ends the pass. A
+        timeout changed by a rule reload only delays expiry of records
+        queued behind a longer-lived one.
+        """
+        entries = self.entries
+        deadline = self.deadline
+        expired = 0
+        while entries and expired < limit:
+            key = next(iter(entries))
+            if deadline(entries[key]) > now:
+                break
+            del entries[key]
+            expired += 1
+        self.expired += expired
+        return expired
+
+    def __getitem__(self, key):
+        return self.get_or_create(key)
+
+    def __delitem__(self, key):
+        del self.entries[key]
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def keys(self):
+        return self.entries.keys()
+
+    def items(self):
+        return self.entries.items()
+
+    def clear(self):
+        self.entries.clear()
+
+    def estimate_bytes(self, sample_size=32):
+        """
+        Approximate memory held by the table: container plus the average
+        deep size of the most recently active records
+        """
+        entries = self.entries
+        total = sys.getsizeof(entries)
+        count = len(entries)
+        if not count:
+            return total
+
+        sampled = 0
+        sample_bytes = 0
+        try:
+            for key in reversed(entries):
+                sample_bytes += sys.getsizeof(key) + _deep_sizeof(entries[key])
+                sampled += 1
+                if sampled >= sample_size:
+                    break
+        except (RuntimeError, KeyError):
+            # Stats are read from other threads; the packet thread changed the table mid-sample
+            if not sampled:
+                return self.estimated_bytes
+        self.estimated_bytes = total + sample_bytes * count // sampled
+        return self.estimated_bytes
+
+    def get_stats(self):
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'evictions': self.evictions,
+            'expired': self.expired,
+            'estimated_bytes': self.estimate_bytes()
+        }
+
+
+def _deep_sizeof(obj, _depth=0):
+    """sys.getsizeof including __slots__ members and container contents"""
+    size = sys.getsizeof(obj)
+    if _depth > 4 or isinstance(obj, (int, float, str, bytes)):
+        return size
+    if isinstance(obj, dict):
+        return size + sum(_deep_sizeof(k, _depth + 1) + _deep_sizeof(v, _depth + 1) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset, deque)):
+        return size + sum(_deep_sizeof(item, _depth + 1) for item in obj)
+    for slot in getattr(type(obj), '__slots__', ()):
+        value = getattr(obj, slot, None)
+        if value is not None:
+            size += _deep_sizeof(value, _depth + 1)
+    return size
+
+
+def read_rss_bytes():
+    """Resident set size of this process (Linux), or None"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
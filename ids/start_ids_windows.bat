@@ -21,5 +21,5 @@ echo [OK] Running with admin privileges
 echo.
 echo [STARTING] IDS Engine...
 cd %~dp0
-python ids_engine.py
+python ids_engine.py --capture scapy
 
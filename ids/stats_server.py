@@ -0,0 +1,73 @@
+"""
+IDS Stats Server
+Local HTTP endpoint exposing engine counters (localhost only)
+
+GET /stats            -> JSON from IDSEngine.get_stats()
+GET /sketches?limit=N -> JSON from IDSEngine.get_top_talkers()
+GET /metrics          -> Prometheus text format (see metrics.py)
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import threading
+import json
+
+from metrics import registry
+
+
+class StatsServer:
+    """Serve engine stats on a background thread"""
+
+    def __init__(self, engine, host='127.0.0.1', port=9109):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.httpd = None
+
+    def start(self):
+        engine = self.engine
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                if url.path == '/metrics':
+                    self._send(registry.render().encode(), 'text/plain; version=0.0.4; charset=utf-8')
+                    return
+                if url.path == '/stats':
+                    payload = engine.get_stats()
+                elif url.path == '/sketches':
+                    try:
+                        limit = int(parse_qs(url.query).get('limit', ['0'])[0]) or None
+                    except ValueError:
+                        self.send_error(400)
+                        return
+                    payload = engine.get_top_talkers(limit)
+                    if payload is None:
+                        self.send_error(404, "Sketches disabled")
+                        return
+                else:
+                    self.send_error(404)
+                    return
+                self._send(json.dumps(payload, default=str).encode(), 'application/json')
+
+            def _send(self, body, content_type):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep the IDS console for detections
+
+        try:
+            self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            print(f"[STATS] Failed to bind {self.host}:{self.port}: {e}")
+            return
+        threading.Thread(target=self.httpd.serve_forever, name='ids-stats', daemon=True).start()
+        print(f"[STATS] Serving http://{self.host}:{self.port}/stats and /metrics")
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()